@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, List
+
+if TYPE_CHECKING:
+    from autogen_agentchat.agents import AssistantAgent
+
+
+class _ConversationLock:
+    """带引用计数的对话锁，无人使用时从字典中移除"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class AgentPool:
+    """有界的AssistantAgent池
+
+    每个请求独占一个代理，用完后重置内部模型上下文再放回池中，
+    不同对话可以真正并行生成；同一对话的请求按顺序执行，保证消息顺序。
+    """
+
+    def __init__(self, factory: Callable[[], Awaitable["AssistantAgent"]], size: int = 8):
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle: List["AssistantAgent"] = []
+        self._created = 0
+        self._slots = asyncio.Semaphore(self.size)
+        self._conversation_locks: Dict[str, _ConversationLock] = {}
+
+    @property
+    def in_use(self) -> int:
+        """正在使用的代理数量"""
+        return self._created - len(self._idle)
+
+    @asynccontextmanager
+    async def session(self, conversation_id: str) -> AsyncIterator["AssistantAgent"]:
+        """获取某个对话专用的代理，退出时自动重置并归还"""
+        entry = self._conversation_locks.setdefault(conversation_id, _ConversationLock())
+        entry.users += 1
+        try:
+            async with entry.lock:
+                async with self._slots:
+                    agent = await self._acquire()
+                    try:
+                        yield agent
+                    finally:
+                        await self._release(agent)
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                self._conversation_locks.pop(conversation_id, None)
+
+    async def _acquire(self) -> "AssistantAgent":
+        """取出空闲代理，没有则按需创建（总数受信号量限制）"""
+        if self._idle:
+            return self._idle.pop()
+        agent = await self.factory()
+        self._created += 1
+        return agent
+
+    async def _release(self, agent: "AssistantAgent"):
+        """重置代理状态后放回池中，重置失败则丢弃"""
+        from autogen_core import CancellationToken
+
+        try:
+            await agent.on_reset(CancellationToken())
+        except Exception as e:
+            print(f"重置代理状态错误: {e}")
+            self._created -= 1
+            return
+        self._idle.append(agent)
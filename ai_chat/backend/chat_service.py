@@ -1,24 +1,32 @@
 import asyncio
+import os
+import time
 import uuid
 from datetime import datetime
-from typing import AsyncGenerator, List, Optional
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import ModelClientStreamingChunkEvent
-from models import ChatMessage, MessageRole, StreamChunk
-from database import db
-from search_service import search_service
-from llms import model_client
-
-class ChatService:
-    def __init__(self):
-        self.active_streams = {}  # 存储活跃的流式对话
-        self.content_buffer = {}  # 存储每个对话的内容缓冲区，用于去重
-
-        # 创建智能助手代理
-        self.agent = AssistantAgent(
-            name="intelligent_assistant",
-            model_client=model_client,
-            system_message="""你是一个智能助手，能够帮助用户解答各种问题。
+from contextlib import aclosing
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Dict, List, Optional, Tuple
+from models import (
+    ChatMessage, ConversationPage, MessagePage, MessageRole, MessageSearchPage, RollingSummary, StreamChunk,
+    StreamStatus
+)
+from database import db, MESSAGE_TOKEN_OVERHEAD
+from summary_service import summary_service
+from llms import get_context_token_budget, get_model_client, get_model_name
+from service_registry import import_modules, services
+from token_counter import count_tokens
+from agent_pool import AgentPool
+from stream_cleaner import StreamCleaner
+from response_cache import response_cache
+from stream_registry import stream_registry
+from metrics import (
+    active_streams, agents_in_use, stage_seconds, stream_duration_seconds, tokens_per_second, ttft_seconds
+)
+
+if TYPE_CHECKING:
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_core import CancellationToken
+
+SYSTEM_MESSAGE = """你是一个智能助手，能够帮助用户解答各种问题。
                             你具有以下能力：
                             1. 回答各种知识性问题
                             2. 协助编程和技术问题
@@ -26,7 +34,42 @@ class ChatService:
                             4. 进行对话和交流
                             
                             请用友好、专业的语气回答用户的问题。如果用户提供了搜索结果，请结合这些信息来回答问题。
-                            请确保回答内容简洁明了，避免重复表达。""",
+                            请确保回答内容简洁明了，避免重复表达。"""
+
+class ChatService:
+    def __init__(self):
+        self._system_message_tokens: Optional[int] = None
+
+        # 智能助手代理池，每个请求独占一个代理，支持多个对话并行生成
+        self.agent_pool = AgentPool(
+            self._create_agent,
+            size=int(os.getenv("AGENT_POOL_SIZE", "8"))
+        )
+
+        # 生成前各阶段的时限（秒），超时的阶段放弃结果继续生成
+        self.search_stage_deadline = float(os.getenv("SEARCH_STAGE_DEADLINE", "4.0"))
+        self.history_stage_deadline = float(os.getenv("HISTORY_STAGE_DEADLINE", "2.0"))
+
+        active_streams.set_function(lambda: stream_registry.local_count)
+        agents_in_use.set_function(lambda: self.agent_pool.in_use)
+
+    @property
+    def system_message_tokens(self) -> int:
+        """系统提示词的token数（首次使用时计算）"""
+        if self._system_message_tokens is None:
+            self._system_message_tokens = count_tokens(SYSTEM_MESSAGE)
+        return self._system_message_tokens
+
+    async def _create_agent(self) -> "AssistantAgent":
+        """创建智能助手代理（autogen在第一次创建代理时才在工作线程中导入）"""
+        model_client = await get_model_client()
+        await import_modules("autogen_agentchat.agents")
+        from autogen_agentchat.agents import AssistantAgent
+
+        return AssistantAgent(
+            name="intelligent_assistant",
+            model_client=model_client,
+            system_message=SYSTEM_MESSAGE,
             model_client_stream=True,  # 支持流式输出
         )
     
@@ -34,233 +77,361 @@ class ChatService:
         self, 
         message: str, 
         conversation_id: Optional[str] = None,
-        use_search: bool = False
+        use_search: bool = False,
+        bypass_cache: bool = False
     ) -> AsyncGenerator[StreamChunk, None]:
-        """流式聊天"""
+        """流式聊天
+
+        第一个数据块为start，携带用于中断的stream_id。中断或客户端断开时通过取消令牌
+        取消对模型的请求，尽快释放代理和并发名额。bypass_cache为True时不使用缓存的回复。
+        """
+        # autogen第一次使用时在工作线程中导入，之后的import只是查表
+        await import_modules("autogen_core", "autogen_agentchat.messages")
+        from autogen_core import CancellationToken
+
+        # 生成流式ID用于中断控制
+        stream_id = str(uuid.uuid4())
+        cancellation_token = CancellationToken()
+
+        started_at = time.perf_counter()
+        timings: Dict[str, float] = {}
+        stage_tasks: List[asyncio.Task] = []
+        outcome = "error"
+
+        def start_stage(name: str, coro: Awaitable[Any], cancellable: bool = True) -> asyncio.Task:
+            # 记录阶段耗时（超时被取消时同样记录）
+            stage_started = time.perf_counter()
+            task = asyncio.ensure_future(coro)
+            task.add_done_callback(lambda _: timings.__setitem__(f"{name}_ms", _elapsed_ms(stage_started)))
+            if cancellable:
+                # 中断时取消尚未完成的阶段，不必等到阶段时限
+                cancellation_token.link_future(task)
+                stage_tasks.append(task)
+            return task
+
         try:
             # 检查是否是新对话
             is_new_conversation = not conversation_id
 
+            # 搜索只依赖问题本身，最先开始，与后面的阶段并行
+            search_task = start_stage("search", self._search_stage(message)) if use_search else None
+
             # 如果没有对话ID，创建新对话
             if not conversation_id:
                 conversation_id = await db.create_conversation()
 
-            # 保存用户消息
+            # 登记到流注册表后再发送stream_id，中断请求可以落在任意工作进程
+            await stream_registry.register(stream_id, cancellation_token, conversation_id)
+            yield StreamChunk(type="start", stream_id=stream_id, conversation_id=conversation_id)
+
+            # 保存用户消息和读取历史并行执行；新对话没有历史，无需读取
             user_message = ChatMessage(
+                id=str(uuid.uuid4()),
                 role=MessageRole.USER,
                 content=message,
                 timestamp=datetime.now(),
                 conversation_id=conversation_id
             )
-            await db.save_message(user_message)
-            
-            # 构建完整的对话上下文
-            conversation_context = await self._build_conversation_context(
-                conversation_id, message, use_search
-            )
-            
-            # 生成流式ID用于中断控制
-            stream_id = str(uuid.uuid4())
-            self.active_streams[stream_id] = True
-
-            # 初始化内容缓冲区
-            self.content_buffer[stream_id] = ""
-
-            try:
-                # 获取流式响应
-                result_stream = self.agent.run_stream(task=conversation_context)
-
-                assistant_content = ""
-                async for item in result_stream:
-                    # 检查是否被中断
-                    if not self.active_streams.get(stream_id, False):
-                        yield StreamChunk(type="error", error="对话已被中断")
-                        return
-
-                    if isinstance(item, ModelClientStreamingChunkEvent):
-                        content = item.content or ""
-
-                        if content:  # 只处理非空内容
-                            # 直接累积原始内容，不在流式过程中进行复杂去重
-                            assistant_content += content
-
-                            # 只进行基础的单字符去重，避免破坏流式体验
-                            cleaned_content = self._basic_clean_chunk(content)
-
-                            if cleaned_content:  # 只发送清理后的非空内容
-                                yield StreamChunk(
-                                    type="content",
-                                    content=cleaned_content,
-                                    conversation_id=conversation_id
-                                )
-                
-                # 对完整内容进行最终去重处理
-                final_content = self._deep_clean_content(assistant_content)
-
-                # 保存助手回复
-                assistant_message = ChatMessage(
-                    role=MessageRole.ASSISTANT,
-                    content=final_content,
-                    timestamp=datetime.now(),
-                    conversation_id=conversation_id
+            persist_task = start_stage("persist", db.save_message(user_message), cancellable=False)
+            history_task = None
+            if not is_new_conversation:
+                history_task = start_stage(
+                    "history", self._history_stage(conversation_id, message, user_message.id)
                 )
-                await db.save_message(assistant_message)
 
-                # 如果是新对话的第一条消息，生成标题
-                if is_new_conversation:
-                    title = self._generate_conversation_title(message)
-                    await db.update_conversation_title(conversation_id, title)
+            # 历史和搜索分别有时限，超时则不带该部分继续；用户消息必须保存成功
+            summary, history_messages = await self._await_stage(
+                history_task, "history", self.history_stage_deadline, started_at, (None, [])
+            )
+            search_parts = await self._await_stage(
+                search_task, "search", self.search_stage_deadline, started_at, []
+            )
+            await persist_task
+
+            # 构建完整的对话上下文
+            conversation_context = self._assemble_context(message, summary, history_messages, search_parts)
+            timings["context_ms"] = _elapsed_ms(started_at)
+            if cancellation_token.is_cancelled():
+                yield StreamChunk(type="error", error="对话已被中断")
+                return
+
+            # 相同的模型、系统提示词和上下文直接重放缓存的回复
+            cache_key = response_cache.make_key(get_model_name(), SYSTEM_MESSAGE, conversation_context)
+            cached_content = None
+            if bypass_cache:
+                response_cache.record_bypass()
+            else:
+                cached_content = response_cache.get(cache_key)
 
-                # 发送完成信号
-                yield StreamChunk(
-                    type="done",
-                    conversation_id=conversation_id
-                )
-            
-            finally:
-                # 清理活跃流和缓冲区
-                self.active_streams.pop(stream_id, None)
-                self.content_buffer.pop(stream_id, None)
-        
+            if cached_content is not None:
+                reply_pieces = response_cache.replay(cached_content, cancellation_token)
+            else:
+                reply_pieces = self._generate_reply(conversation_id, conversation_context, cancellation_token)
+
+            assistant_content = ""
+            async with aclosing(reply_pieces):
+                async for piece in reply_pieces:
+                    if not assistant_content:
+                        timings["ttft_ms"] = _elapsed_ms(started_at)
+                    assistant_content += piece
+                    yield StreamChunk(
+                        type="content",
+                        content=piece,
+                        conversation_id=conversation_id
+                    )
+
+            if cached_content is None:
+                response_cache.put(cache_key, assistant_content)
+
+            # 保存助手回复
+            assistant_message = ChatMessage(
+                role=MessageRole.ASSISTANT,
+                content=assistant_content,
+                timestamp=datetime.now(),
+                conversation_id=conversation_id
+            )
+            await db.save_message(assistant_message)
+
+            # 如果是新对话的第一条消息，生成标题
+            if is_new_conversation:
+                title = self._generate_conversation_title(message)
+                await db.update_conversation_title(conversation_id, title)
+
+            # 对话变长后在后台更新滚动摘要
+            summary_service.schedule_refresh(conversation_id)
+
+            # 发送完成信号
+            timings["total_ms"] = _elapsed_ms(started_at)
+            self._observe_reply(timings, "cache" if cached_content is not None else "model", assistant_content)
+            outcome = "done"
+            yield StreamChunk(
+                type="done",
+                conversation_id=conversation_id,
+                timings=timings
+            )
+
+        except asyncio.CancelledError:
+            if not cancellation_token.is_cancelled():
+                # 客户端断开：取消对模型的请求后继续向上传播
+                outcome = "disconnected"
+                cancellation_token.cancel()
+                raise
+            # 用户主动中断
+            outcome = "interrupted"
+            yield StreamChunk(type="error", error="对话已被中断", conversation_id=conversation_id)
         except Exception as e:
             yield StreamChunk(type="error", error=str(e))
+        finally:
+            # 客户端断开或出错时不再等待尚未完成的阶段（用户消息的保存不取消）
+            for task in stage_tasks:
+                if not task.done():
+                    task.cancel()
+            # 清理活跃流
+            stream_registry.unregister(stream_id)
+            stream_duration_seconds.observe(time.perf_counter() - started_at, outcome=outcome)
     
-    async def _build_conversation_context(
-        self, 
-        conversation_id: str, 
+    async def _generate_reply(
+        self,
+        conversation_id: str,
+        conversation_context: str,
+        cancellation_token: "CancellationToken"
+    ) -> AsyncGenerator[str, None]:
+        """调用模型流式生成回复，逐段返回去重后的内容"""
+        from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+
+        # 从代理池取出本对话专用的代理，结束后自动重置并归还
+        async with self.agent_pool.session(conversation_id) as agent:
+            # 获取流式响应，取消令牌会传递到模型客户端，取消时中止对模型的HTTP请求
+            result_stream = agent.run_stream(
+                task=conversation_context, cancellation_token=cancellation_token
+            )
+
+            # 流式去重：发送的内容与最终保存的内容完全一致
+            cleaner = StreamCleaner()
+            async for item in result_stream:
+                if isinstance(item, ModelClientStreamingChunkEvent):
+                    cleaned_content = cleaner.feed(item.content or "")
+                    if cleaned_content:  # 只发送清理后的非空内容
+                        yield cleaned_content
+
+            # 输出去重器中暂存的结尾
+            remaining_content = cleaner.finish()
+            if remaining_content:
+                yield remaining_content
+
+    def _observe_reply(self, timings: Dict[str, float], source: str, content: str):
+        """记录完成的回复的各阶段耗时、首字延迟和输出速度，输出速度同时写入timings"""
+        for stage in ("search", "history", "persist", "context"):
+            if f"{stage}_ms" in timings:
+                stage_seconds.observe(timings[f"{stage}_ms"] / 1000, stage=stage)
+
+        if "ttft_ms" not in timings:
+            return
+        ttft_seconds.observe(timings["ttft_ms"] / 1000, source=source)
+        generation_ms = timings["total_ms"] - timings["ttft_ms"]
+        timings["generation_ms"] = round(generation_ms, 2)
+        if generation_ms > 0:
+            rate = count_tokens(content) / (generation_ms / 1000)
+            timings["tokens_per_second"] = round(rate, 2)
+            tokens_per_second.observe(rate, source=source)
+
+    async def _await_stage(
+        self,
+        task: Optional[asyncio.Task],
+        name: str,
+        deadline: float,
+        started_at: float,
+        fallback: Any
+    ) -> Any:
+        """等待阶段完成，时限从生成开始计算；超时或出错时返回fallback"""
+        if task is None:
+            return fallback
+        remaining = max(0.0, deadline - (time.perf_counter() - started_at))
+        try:
+            return await asyncio.wait_for(task, timeout=remaining)
+        except asyncio.TimeoutError:
+            print(f"{name}阶段超过 {deadline} 秒，跳过")
+            return fallback
+        except Exception as e:
+            print(f"{name}阶段错误: {e}")
+            return fallback
+
+    async def _search_stage(self, current_message: str) -> List[str]:
+        """搜索并补充网页正文，返回放入上下文的搜索结果段落"""
+        search_parts = []
+        search_service = await services.acquire("search_service")
+        search_results = await search_service.search_web(current_message, max_results=3)
+        # 并发抓取排名靠前的网页正文，超时的页面只保留摘要
+        search_results = await search_service.enrich_results(search_results)
+        if search_results:
+            search_parts.append("\n相关搜索结果：")
+            for i, result in enumerate(search_results, 1):
+                search_parts.append(f"{i}. {result.title}")
+                search_parts.append(f"   链接: {result.url}")
+                search_parts.append(f"   摘要: {result.snippet}")
+                if result.content:
+                    search_parts.append(f"   正文: {result.content}")
+                search_parts.append("")
+        return search_parts
+
+    async def _history_stage(
+        self,
+        conversation_id: str,
+        current_message: str,
+        exclude_message_id: Optional[str] = None
+    ) -> Tuple[Optional[RollingSummary], List[ChatMessage]]:
+        """读取滚动摘要和摘要之后的历史消息
+
+        与搜索并行执行，此时还不知道搜索结果的长度，按不含搜索结果的预算读取，
+        组装上下文时再裁掉超出的最早几条。
+        """
+        # 更早的对话已合并进滚动摘要
+        summary = await db.get_summary(conversation_id)
+
+        history_budget = (
+            get_context_token_budget()
+            - self.system_message_tokens
+            - (summary.token_count if summary else 0)
+            - count_tokens(_question_part(current_message))
+        )
+        if history_budget <= 0:
+            return summary, []
+
+        # 获取摘要之后的历史对话（当前问题单独放在最后，不重复计入历史）
+        history_messages = await db.get_context_messages(
+            conversation_id,
+            history_budget,
+            exclude_message_id=exclude_message_id,
+            after=summary.covered_until if summary else None
+        )
+        return summary, history_messages
+
+    def _assemble_context(
+        self,
         current_message: str,
-        use_search: bool
+        summary: Optional[RollingSummary],
+        history_messages: List[ChatMessage],
+        search_parts: List[str]
     ) -> str:
-        """构建对话上下文"""
+        """在token预算内组装上下文：当前问题和搜索结果优先，历史消息从最早的开始裁剪"""
+        question_part = _question_part(current_message)
+
+        if search_parts:
+            # 历史对话可用的预算 = 总预算 - 系统提示词 - 摘要 - 搜索结果 - 当前问题
+            history_budget = (
+                get_context_token_budget()
+                - self.system_message_tokens
+                - (summary.token_count if summary else 0)
+                - count_tokens("\n".join(search_parts))
+                - count_tokens(question_part)
+            )
+            kept = []
+            for msg in reversed(history_messages):
+                tokens = count_tokens(msg.content) + MESSAGE_TOKEN_OVERHEAD
+                if tokens > history_budget:
+                    break
+                history_budget -= tokens
+                kept.append(msg)
+            kept.reverse()
+            history_messages = kept
+
         context_parts = []
+
+        # 添加对话摘要到上下文
+        if summary:
+            context_parts.append(f"更早的对话摘要：\n{summary.content}\n")
         
-        # 获取历史对话
-        history_messages = await db.get_conversation_messages(conversation_id)
-        
-        # 添加历史对话到上下文（最近10条）
+        # 添加历史对话到上下文
         if history_messages:
             context_parts.append("对话历史：")
-            for msg in history_messages[-10:]:  # 只取最近10条
+            for msg in history_messages:
                 if msg.role == MessageRole.USER:
                     context_parts.append(f"用户: {msg.content}")
                 elif msg.role == MessageRole.ASSISTANT:
                     context_parts.append(f"助手: {msg.content}")
-        
-        # 如果启用搜索，添加搜索结果
-        if use_search:
-            search_results = await search_service.search_web(current_message, max_results=3)
-            if search_results:
-                context_parts.append("\n相关搜索结果：")
-                for i, result in enumerate(search_results, 1):
-                    context_parts.append(f"{i}. {result.title}")
-                    context_parts.append(f"   链接: {result.url}")
-                    context_parts.append(f"   摘要: {result.snippet}")
-                    context_parts.append("")
+
+        context_parts.extend(search_parts)
         
         # 添加当前问题
-        context_parts.append(f"\n当前问题: {current_message}")
+        context_parts.append(question_part)
         
         return "\n".join(context_parts)
     
-    def interrupt_stream(self, stream_id: str):
-        """中断流式对话"""
-        if stream_id in self.active_streams:
-            self.active_streams[stream_id] = False
+    async def interrupt_stream(self, stream_id: str) -> bool:
+        """中断流式对话（流可以在其他工作进程），返回是否找到该流"""
+        return await stream_registry.cancel(stream_id)
+
+    async def get_stream_status(self, stream_id: str) -> Optional[StreamStatus]:
+        """查询流式对话的状态"""
+        return await stream_registry.status(stream_id)
     
-    async def get_conversation_history(self, conversation_id: str) -> List[ChatMessage]:
-        """获取对话历史"""
-        return await db.get_conversation_messages(conversation_id)
+    async def get_conversation_history(
+        self,
+        conversation_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> MessagePage:
+        """分页获取对话历史"""
+        return await db.get_conversation_messages(conversation_id, limit=limit, before=before, after=after)
     
-    async def get_conversations(self) -> List:
-        """获取对话列表"""
-        return await db.get_conversations()
+    async def get_conversations(
+        self,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> ConversationPage:
+        """分页获取对话列表"""
+        return await db.get_conversations(limit=limit, before=before, after=after)
+
+    async def search_messages(self, query: str, limit: int = 20, after: Optional[str] = None) -> MessageSearchPage:
+        """全文搜索历史消息"""
+        return await db.search_messages(query, limit=limit, after=after)
     
     async def delete_conversation(self, conversation_id: str):
         """删除对话"""
         await db.delete_conversation(conversation_id)
 
-    def _basic_clean_chunk(self, content: str) -> str:
-        """基础清理单个chunk，只处理明显的重复"""
-        if not content:
-            return content
-
-        import re
-
-        # 只去除连续的相同字符（超过3个）
-        cleaned = re.sub(r'(.)\1{3,}', r'\1', content)
-
-        return cleaned
-
-    def _clean_single_chunk(self, content: str) -> str:
-        """清理单个流式chunk"""
-        if not content:
-            return content
-
-        import re
-
-        # 去除连续重复的字符（超过2个）
-        cleaned = re.sub(r'(.)\1{2,}', r'\1', content)
-
-        # 去除重复的标点符号
-        cleaned = re.sub(r'([。！？，；：、\n])\1+', r'\1', cleaned)
-
-        return cleaned
-
-    def _deep_clean_content(self, content: str) -> str:
-        """深度清理内容，去除各种重复"""
-        if not content:
-            return content
-
-        import re
-
-        # 1. 去除连续重复的字符
-        cleaned = re.sub(r'(.)\1{2,}', r'\1\1', content)  # 最多保留2个重复字符
-
-        # 2. 去除重复的中文词组（2-8个字符）
-        cleaned = re.sub(r'([\u4e00-\u9fff]{2,8})\1+', r'\1', cleaned)
-
-        # 3. 去除重复的英文单词
-        cleaned = re.sub(r'(\b[a-zA-Z]+\b)\s*\1+', r'\1', cleaned)
-
-        # 4. 去除重复的短语（包含空格的）
-        cleaned = re.sub(r'([^\n。！？]{3,20})\1+', r'\1', cleaned)
-
-        # 5. 处理行内重复（同一行内的重复内容）
-        lines = cleaned.split('\n')
-        processed_lines = []
-
-        for line in lines:
-            if line.strip():
-                # 去除行内重复的短语
-                line = re.sub(r'([^\s。！？，]{2,10})\s*\1+', r'\1', line)
-                # 去除重复的句子片段
-                line = re.sub(r'([^。！？]{5,30}[。！？])\s*\1+', r'\1', line)
-            processed_lines.append(line)
-
-        # 6. 去除重复的整行
-        final_lines = []
-        seen_lines = set()
-
-        for line in processed_lines:
-            line_normalized = re.sub(r'\s+', ' ', line.strip())
-            if line_normalized:
-                if line_normalized not in seen_lines:
-                    seen_lines.add(line_normalized)
-                    final_lines.append(line)
-            else:
-                final_lines.append(line)  # 保留空行
-
-        result = '\n'.join(final_lines)
-
-        # 7. 最终清理：去除多余的标点符号
-        result = re.sub(r'([。！？，；：])\1+', r'\1', result)
-
-        return result
-
-    def _clean_streaming_content(self, content: str) -> str:
-        """兼容性方法，调用深度清理"""
-        return self._deep_clean_content(content)
-
     def _generate_conversation_title(self, first_message: str) -> str:
         """根据第一条消息生成对话标题"""
         # 简单的标题生成逻辑
@@ -281,5 +452,13 @@ class ChatService:
 
         return title
 
+
+def _question_part(current_message: str) -> str:
+    return f"\n当前问题: {current_message}"
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
 # 全局聊天服务实例
 chat_service = ChatService()
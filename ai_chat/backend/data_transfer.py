@@ -0,0 +1,179 @@
+import json
+import zlib
+from typing import AsyncGenerator, AsyncIterable, Dict, Iterator, Optional
+
+# NDJSON导出格式：第一行为header，之后依次是conversation、message、summary记录，每行一个JSON对象
+EXPORT_FORMAT = "ai_chat.ndjson"
+EXPORT_FORMAT_VERSION = 1
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# 单行的长度上限，超过时拒绝导入，防止格式错误的输入或压缩炸弹把大量数据读进内存
+MAX_LINE_BYTES = 8 * 1024 * 1024
+# 每次解压输出的上限，高压缩比的输入也只能逐块展开
+DECOMPRESS_CHUNK_BYTES = 1024 * 1024
+# zstd的解压对象不支持max_length，按小块输入限制单次输出（zstd压缩比最高约为32000:1）
+_ZSTD_INPUT_BYTES = 32
+
+
+def _zstandard():
+    """zstd压缩依赖可选的zstandard包"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd压缩需要安装zstandard：pip install zstandard")
+    return zstandard
+
+
+def compression_from_filename(filename: str) -> str:
+    """按文件扩展名推断压缩格式"""
+    if filename.endswith(".gz"):
+        return "gzip"
+    if filename.endswith(".zst"):
+        return "zstd"
+    return "none"
+
+
+def export_filename(compression: str) -> str:
+    return {"none": "chat_export.ndjson", "gzip": "chat_export.ndjson.gz", "zstd": "chat_export.ndjson.zst"}[compression]
+
+
+def check_compression(compression: str):
+    """检查压缩格式可用，不可用时抛出ValueError"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩格式: {compression}")
+    if compression == "zstd":
+        _zstandard()
+
+
+class _Compressor:
+    def __init__(self, compression: str):
+        check_compression(compression)
+        self._compressor = None
+        if compression == "gzip":
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            self._compressor = _zstandard().ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return data if self._compressor is None else self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return b"" if self._compressor is None else self._compressor.flush()
+
+
+class _Decompressor:
+    """按开头的魔数自动识别gzip/zstd，未压缩的数据原样返回"""
+
+    def __init__(self):
+        self._decompressor = None
+        self._kind = "none"
+        self._detected = False
+        self._head = b""
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """解压一块输入，分多次输出，每次最多约DECOMPRESS_CHUNK_BYTES字节"""
+        if not self._detected:
+            self._head += data
+            if len(self._head) < len(_ZSTD_MAGIC):
+                return
+            data, self._head = self._head, b""
+            self._detected = True
+            if data.startswith(_GZIP_MAGIC):
+                self._kind = "gzip"
+                self._decompressor = zlib.decompressobj(31)
+            elif data.startswith(_ZSTD_MAGIC):
+                self._kind = "zstd"
+                self._decompressor = _zstandard().ZstdDecompressor().decompressobj()
+        if self._decompressor is None:
+            if data:
+                yield data
+        elif self._kind == "gzip":
+            while True:
+                output = self._decompressor.decompress(data, DECOMPRESS_CHUNK_BYTES)
+                data = self._decompressor.unconsumed_tail
+                if output:
+                    yield output
+                # 输出达到上限时解压器内部可能还有数据，继续取到不足上限为止
+                if not data and len(output) < DECOMPRESS_CHUNK_BYTES:
+                    break
+        else:
+            for start in range(0, len(data), _ZSTD_INPUT_BYTES):
+                output = self._decompressor.decompress(data[start:start + _ZSTD_INPUT_BYTES])
+                if output:
+                    yield output
+
+    def flush(self) -> bytes:
+        if not self._detected:
+            self._detected = True
+            return self._head
+        if self._kind == "gzip":
+            if not self._decompressor.eof:
+                raise ValueError("压缩数据不完整")
+            return self._decompressor.flush()
+        return b""
+
+
+async def encode_ndjson(
+    records: AsyncIterable[Dict], compression: str = "none", chunk_bytes: int = 64 * 1024
+) -> AsyncGenerator[bytes, None]:
+    """把记录编码为（可压缩的）NDJSON字节流，累积到chunk_bytes后输出一块"""
+    compressor = _Compressor(compression)
+    pending = []
+    pending_bytes = 0
+    async for record in records:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        pending.append(line)
+        pending_bytes += len(line)
+        if pending_bytes >= chunk_bytes:
+            data = compressor.compress(b"".join(pending))
+            pending.clear()
+            pending_bytes = 0
+            if data:
+                yield data
+    data = compressor.compress(b"".join(pending)) + compressor.flush()
+    if data:
+        yield data
+
+
+async def decode_ndjson(chunks: AsyncIterable[bytes]) -> AsyncGenerator[Dict, None]:
+    """把（可压缩的）NDJSON字节流解码为记录，只缓存未结束的一行；格式错误时抛出ValueError（带行号）"""
+    decompressor = _Decompressor()
+    partial = b""
+    line_number = 0
+
+    def parse(line: bytes) -> Optional[Dict]:
+        if not line.strip():
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"第 {line_number} 行不是有效的JSON: {e}")
+        if not isinstance(record, dict) or "type" not in record:
+            raise ValueError(f"第 {line_number} 行缺少type字段")
+        return record
+
+    def check_length(line: bytes, number: int):
+        if len(line) > MAX_LINE_BYTES:
+            raise ValueError(f"第 {number} 行超过长度上限（{MAX_LINE_BYTES} 字节）")
+
+    async for chunk in chunks:
+        for data in decompressor.decompress(chunk):
+            lines = (partial + data).split(b"\n")
+            partial = lines.pop()
+            check_length(partial, line_number + len(lines) + 1)
+            for line in lines:
+                line_number += 1
+                check_length(line, line_number)
+                record = parse(line)
+                if record is not None:
+                    yield record
+
+    partial += decompressor.flush()
+    for line in partial.split(b"\n"):
+        line_number += 1
+        check_length(line, line_number)
+        record = parse(line)
+        if record is not None:
+            yield record
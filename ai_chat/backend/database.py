@@ -1,131 +1,1195 @@
+import asyncio
+import os
+import re
+import html
+import base64
+import binascii
 import sqlite3
 import json
+import time
 import uuid
+import zlib
 from datetime import datetime
-from typing import List, Optional
-from models import ChatMessage, ConversationSummary, MessageRole
-import aiosqlite
+from typing import Any, AsyncGenerator, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Tuple
+from models import (
+    ChatMessage, ConversationSummary, ConversationPage, MessagePage, MessageRole, MessageSearchHit,
+    MessageSearchPage, RollingSummary
+)
+from db_pool import SQLitePool
+from data_transfer import EXPORT_FORMAT, EXPORT_FORMAT_VERSION
+from token_counter import count_tokens
+from write_behind import WriteBehindQueue
+from metrics import db_query_seconds, write_behind_dead_letters, write_behind_pending
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 数据库结构迁移：第N项把结构从 v(N-1) 升级到 vN，当前版本记录在 PRAGMA user_version 中
+SCHEMA_MIGRATIONS = [
+    # v1: 基础表结构
+    [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            conversation_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+        """,
+    ],
+    # v2: 消息索引 + 对话冗余统计字段，避免列表查询时的关联子查询
+    [
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_time ON messages (conversation_id, timestamp)",
+        "ALTER TABLE conversations ADD COLUMN last_message TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE conversations ADD COLUMN last_message_time TIMESTAMP",
+        """
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM messages WHERE conversation_id = conversations.id),
+            last_message = COALESCE((SELECT content FROM messages WHERE conversation_id = conversations.id
+                                     ORDER BY timestamp DESC LIMIT 1), ''),
+            last_message_time = COALESCE((SELECT MAX(timestamp) FROM messages WHERE conversation_id = conversations.id),
+                                         updated_at)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversations_last_message_time ON conversations (last_message_time)",
+    ],
+    # v3: 保存消息时预先计算的token数，旧数据为NULL，读取时再计算
+    [
+        "ALTER TABLE messages ADD COLUMN token_count INTEGER",
+    ],
+    # v4: 长对话的滚动摘要，每个对话一行，随新消息增量更新
+    [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            covered_until TEXT NOT NULL,
+            token_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+        """,
+    ],
+    # v5: 消息全文索引（trigram分词，支持中文任意子串），由触发器与messages保持同步
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='messages', content_rowid='rowid', tokenize='trigram'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+        END
+        """,
+        # 为已有消息建立索引，大库也可以先用 python manage.py backfill-fts 离线完成
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ],
+    # v6: 冷对话归档，长期无新消息的对话的全部消息压缩成一个blob，读取时还原；
+    # archived=1表示消息全部在归档中，部分索引让维护任务只扫描未归档的对话
+    [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_archives (
+            conversation_id TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            message_count INTEGER NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+        """,
+        "ALTER TABLE conversations ADD COLUMN archived INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_unarchived ON conversations (last_message_time) WHERE archived = 0",
+    ],
+    # v7: 归档对话最近一次被还原的时间，还原后的对话在一个空闲期内不会再次归档
+    [
+        "ALTER TABLE conversations ADD COLUMN rehydrated_at TIMESTAMP",
+    ],
+    # v8: 中文二元分词索引。trigram无法索引两个字的词，这里把连续的汉字展开成重叠的二字词，
+    # 存入无内容的FTS5表（只有索引，不重复保存正文）；分词由连接池注册的cjk_bigrams函数完成，
+    # 因此只能通过ChatDatabase写入messages表
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_cjk USING fts5(grams, content='', tokenize='unicode61')",
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_cjk_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_cjk (rowid, grams)
+                SELECT new.rowid, cjk_bigrams(new.content) WHERE cjk_bigrams(new.content) != '';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_cjk_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_cjk (messages_cjk, rowid, grams)
+                SELECT 'delete', old.rowid, cjk_bigrams(old.content) WHERE cjk_bigrams(old.content) != '';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_cjk_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_cjk (messages_cjk, rowid, grams)
+                SELECT 'delete', old.rowid, cjk_bigrams(old.content) WHERE cjk_bigrams(old.content) != '';
+            INSERT INTO messages_cjk (rowid, grams)
+                SELECT new.rowid, cjk_bigrams(new.content) WHERE cjk_bigrams(new.content) != '';
+        END
+        """,
+        "INSERT INTO messages_cjk (rowid, grams) "
+        "SELECT rowid, cjk_bigrams(content) FROM messages WHERE cjk_bigrams(content) != ''",
+    ],
+]
+
+# 归档消息的编码：JSON数组[[id, role, content, timestamp, token_count, rowid], ...]经zlib压缩；
+# 保存rowid使还原后的消息保持原来的rowid，摘要和分页游标 (timestamp, rowid) 在还原前后一致（旧归档没有rowid）
+ARCHIVE_CODEC = "zlib+json"
+
+
+async def _insert_message(db, record: Dict[str, Any]) -> bool:
+    """插入一条消息并维护对话上的冗余统计字段；消息已存在时不做任何修改，返回是否插入"""
+    cursor = await db.execute(
+        "INSERT OR IGNORE INTO messages (id, conversation_id, role, content, timestamp, token_count) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (record["id"], record["conversation_id"], record["role"], record["content"],
+         record["timestamp"], record["token_count"])
+    )
+    if cursor.rowcount == 0:
+        # 重放日志或重复导入时消息已存在，统计字段也已更新过
+        return False
+    # 消息乱序到达时只保留时间最新的一条作为最后消息
+    await db.execute("""
+        UPDATE conversations SET
+            archived = 0,
+            message_count = message_count + 1,
+            last_message = CASE WHEN last_message_time IS NULL OR ? >= last_message_time
+                                THEN ? ELSE last_message END,
+            last_message_time = CASE WHEN last_message_time IS NULL OR ? >= last_message_time
+                                     THEN ? ELSE last_message_time END
+        WHERE id = ?
+    """, (record["timestamp"], record["content"], record["timestamp"], record["timestamp"],
+          record["conversation_id"]))
+    return True
+
+
+def _record_conversation_id(record: Dict[str, Any]) -> Optional[str]:
+    """写入记录所属的对话，同一对话的记录在写后队列中按顺序提交"""
+    if record["op"] == "save_message":
+        return record["conversation_id"]
+    return record.get("id")
+
+
+# 每条消息在上下文中的格式开销（角色前缀、换行等）
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def _format_timestamp(value: datetime) -> str:
+    """转换为数据库中的时间字符串格式（与sqlite3默认的datetime适配器一致）"""
+    return value.isoformat(" ")
+
+
+def _encode_cursor(sort_value: str, rowid: int) -> str:
+    """把 (排序字段, rowid) 编码为不透明的分页游标"""
+    raw = json.dumps([sort_value, rowid], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    """解析分页游标，格式不正确时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, rowid = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError):
+        raise ValueError("无效的分页游标")
+    if not isinstance(rowid, int):
+        raise ValueError("无效的分页游标")
+    return sort_value, rowid
+
+
+# trigram分词的最短可索引长度，更短的搜索词只能逐行过滤
+FTS_MIN_TERM_LENGTH = 3
+# 单次搜索最多使用的词数
+MAX_SEARCH_TERMS = 8
+# 没有可用索引的短词（如"AI"）只在最近写入的这么多条消息中逐行过滤，避免全表扫描
+LIKE_SCAN_WINDOW = 5000
+
+# 中日韩文字：汉字（含扩展A）、假名、韩文音节
+_CJK_RUN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+')
+
+
+def _cjk_bigrams(text: Optional[str]) -> str:
+    """把连续的中日韩文字展开成重叠的二字词，每段末字单独成词，用空格分隔
+
+    例如"排序算法"得到"排序 序算 算法 法"：两个字的词可以精确匹配，单字可以用前缀匹配。
+    """
+    if not text:
+        return ""
+    return " ".join(run[i:i + 2] for run in _CJK_RUN.findall(text) for i in range(len(run)))
+
+
+def _parse_search_query(query: str):
+    """把搜索词拆成trigram索引查询、二元分词索引查询和需要用LIKE过滤的短词"""
+    terms = list(dict.fromkeys(query.split()))[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise ValueError("搜索词不能为空")
+
+    phrases = []
+    cjk_phrases = []
+    short_terms = []
+    for term in terms:
+        if len(term) >= FTS_MIN_TERM_LENGTH:
+            phrases.append('"' + term.replace('"', '""') + '"')
+        elif _CJK_RUN.fullmatch(term):
+            # 两个字的词正好是一个二字词；单字匹配以它开头的二字词
+            cjk_phrases.append(f'"{term}"' if len(term) == 2 else f'"{term}"*')
+        else:
+            short_terms.append(term)
+    return " AND ".join(phrases) or None, " AND ".join(cjk_phrases) or None, short_terms, terms
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _build_snippet(content: str, terms: List[str], width: int = 80) -> str:
+    """截取第一个命中词附近的文本，转义HTML后用<mark>标记所有命中词"""
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    first = min(positions) if positions else 0
+
+    start = max(0, first - width // 4)
+    end = min(len(content), start + width)
+    fragment = content[start:end]
+
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in pattern.finditer(fragment):
+        parts.append(html.escape(fragment[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(fragment[last:]))
+
+    snippet = " ".join("".join(parts).split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")
+
+
+def _encode_archive(messages: List[Tuple]) -> Tuple[bytes, int]:
+    """把消息行编码为归档blob，返回(blob, 压缩前字节数)"""
+    raw = json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 6), len(raw)
+
+
+def _decode_archive(codec: str, payload: bytes) -> List[List[Any]]:
+    if codec != ARCHIVE_CODEC:
+        raise ValueError(f"未知的归档编码: {codec}")
+    return json.loads(zlib.decompress(payload))
+
+
+# 导入时各类记录的必填字段
+_IMPORT_FIELDS = {
+    "conversation": ("id", "title"),
+    "message": ("id", "conversation_id", "role", "content", "timestamp"),
+    "summary": ("conversation_id", "content", "covered_until"),
+}
+
+
+def _check_export_header(record: Dict[str, Any]):
+    if record.get("format") != EXPORT_FORMAT:
+        raise ValueError(f"不是本系统导出的文件: format={record.get('format')}")
+    if not isinstance(record.get("version"), int) or record["version"] > EXPORT_FORMAT_VERSION:
+        raise ValueError(f"不支持的导出格式版本: {record.get('version')}")
+
+
+def _normalize_import_record(record: Dict[str, Any], position: int) -> Dict[str, Any]:
+    """校验导入记录并补全可选字段，错误信息带记录序号"""
+    record_type = record.get("type")
+    fields = _IMPORT_FIELDS.get(record_type)
+    if fields is None:
+        raise ValueError(f"第 {position} 条记录的类型未知: {record_type}")
+    missing = [field for field in fields if not isinstance(record.get(field), str)]
+    if missing:
+        raise ValueError(f"第 {position} 条{record_type}记录缺少字段: {', '.join(missing)}")
+
+    if record_type == "conversation":
+        now = _format_timestamp(datetime.now())
+        record.setdefault("created_at", now)
+        record.setdefault("updated_at", record["created_at"])
+        if not record.get("last_message_time"):
+            record["last_message_time"] = record["created_at"]
+    elif record_type == "message":
+        if record["role"] not in {role.value for role in MessageRole}:
+            raise ValueError(f"第 {position} 条message记录的角色无效: {record['role']}")
+        if not isinstance(record.get("token_count"), int):
+            record["token_count"] = count_tokens(record["content"])
+    else:
+        if not isinstance(record.get("token_count"), int):
+            record["token_count"] = count_tokens(record["content"])
+        record.setdefault("updated_at", _format_timestamp(datetime.now()))
+    return record
+
 
 class ChatDatabase:
-    def __init__(self, db_path: str = "chat_history.db"):
+    def __init__(
+        self,
+        db_path: str = "chat_history.db",
+        reader_count: int = 4,
+        write_behind: bool = False,
+        write_behind_journal: Optional[str] = None,
+        write_behind_interval_ms: float = 20,
+        write_behind_fsync: bool = False,
+        write_behind_max_attempts: int = 5,
+    ):
         self.db_path = db_path
-    
-    async def init_db(self):
-        """初始化数据库表"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id TEXT PRIMARY KEY,
-                    title TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        # 新数据库使用增量auto_vacuum，由后台维护任务分步回收空闲页；已有数据库需用 manage.py vacuum 转换
+        self.pool = SQLitePool(
+            db_path, reader_count=reader_count, auto_vacuum="INCREMENTAL", functions={"cjk_bigrams": _cjk_bigrams}
+        )
+
+        # 写后队列：新建对话、保存消息和更新标题立即返回，由后台批量提交
+        self.write_behind: Optional[WriteBehindQueue] = None
+        if write_behind:
+            self.write_behind = WriteBehindQueue(
+                write_behind_journal or f"{db_path}.writes.jsonl",
+                self._apply_record,
+                flush_interval_ms=write_behind_interval_ms,
+                fsync=write_behind_fsync,
+                max_attempts=write_behind_max_attempts,
+                order_key=_record_conversation_id,
+                on_dead_letter=self._forget_unflushed,
+            )
+        # 尚未提交的消息，按对话保存，供同一对话的上下文读取看到自己的写入
+        self._unflushed_messages: Dict[str, Dict[str, Tuple[ChatMessage, int]]] = {}
+
+    async def open(self):
+        """打开连接池"""
+        await self.pool.open()
+
+    async def close(self):
+        """提交剩余写操作并关闭连接池"""
+        if self.write_behind is not None:
+            await self.write_behind.close()
+        await self.pool.close()
+
+    async def flush_writes(self):
+        """等待写后队列中已接受的写入全部提交"""
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+    async def _submit(self, record: Dict[str, Any]):
+        """写后队列开启时写入日志后立即返回，否则直接提交"""
+        if self.write_behind is not None:
+            self.write_behind.submit(record)
+        else:
+            await self._apply_record(record)
+
+    async def _apply_record(self, record: Dict[str, Any]):
+        """把一条写入记录提交到数据库；重放日志时可能重复执行，所有操作都是幂等的"""
+        kind = record["op"]
+        if kind == "create_conversation":
+            async def op(db):
+                await db.execute(
+                    "INSERT OR IGNORE INTO conversations (id, title, last_message_time) VALUES (?, ?, ?)",
+                    (record["id"], record["title"], record["timestamp"])
                 )
-            """)
-            
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id TEXT PRIMARY KEY,
-                    conversation_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        elif kind == "save_message":
+            async def op(db):
+                await _insert_message(db, record)
+        elif kind == "update_title":
+            async def op(db):
+                await db.execute(
+                    "UPDATE conversations SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (record["title"], record["id"])
                 )
-            """)
-            
-            await db.commit()
+        else:
+            raise ValueError(f"未知的写入记录类型: {kind}")
+
+        start = time.perf_counter()
+        await self.pool.write(op)
+        db_query_seconds.observe(time.perf_counter() - start, operation=f"flush_{kind}")
+
+        self._forget_unflushed(record)
+
+    def _forget_unflushed(self, record: Dict[str, Any]):
+        """消息已提交或转入死信后，不再作为未提交的消息出现在上下文中"""
+        if record["op"] != "save_message":
+            return
+        unflushed = self._unflushed_messages.get(record["conversation_id"])
+        if unflushed is not None:
+            unflushed.pop(record["id"], None)
+            if not unflushed:
+                del self._unflushed_messages[record["conversation_id"]]
+    
+    async def init_db(self):
+        """初始化数据库表，并按版本执行结构迁移"""
+        async def op(db):
+            async with db.execute("PRAGMA user_version") as cursor:
+                current_version = (await cursor.fetchone())[0]
+
+            for version in range(current_version + 1, len(SCHEMA_MIGRATIONS) + 1):
+                for statement in SCHEMA_MIGRATIONS[version - 1]:
+                    await db.execute(statement)
+                await db.execute(f"PRAGMA user_version = {version}")
+            return current_version
+
+        previous_version = await self.pool.write(op)
+        if previous_version < len(SCHEMA_MIGRATIONS):
+            print(f"数据库结构已迁移: v{previous_version} -> v{len(SCHEMA_MIGRATIONS)}")
+
+        # 重放上次退出时写后队列中未提交的写入
+        if self.write_behind is not None:
+            replayed = await self.write_behind.recover()
+            if replayed:
+                print(f"已重放 {replayed} 条未提交的写入")
     
+    @db_query_seconds.time(operation="create_conversation")
     async def create_conversation(self, title: str = "新对话") -> str:
         """创建新对话"""
         conversation_id = str(uuid.uuid4())
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO conversations (id, title) VALUES (?, ?)",
-                (conversation_id, title)
-            )
-            await db.commit()
+        await self._submit({
+            "op": "create_conversation",
+            "id": conversation_id,
+            "title": title,
+            "timestamp": _format_timestamp(datetime.now()),
+        })
         return conversation_id
     
+    @db_query_seconds.time(operation="save_message")
     async def save_message(self, message: ChatMessage) -> str:
         """保存消息"""
         if not message.id:
             message.id = str(uuid.uuid4())
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO messages (id, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
-                (message.id, message.conversation_id, message.role.value, message.content, message.timestamp or datetime.now())
-            )
-            await db.commit()
-        
+        timestamp = _format_timestamp(message.timestamp or datetime.now())
+        token_count = count_tokens(message.content)
+
+        if self.write_behind is not None:
+            self._unflushed_messages.setdefault(message.conversation_id, {})[message.id] = (message, token_count)
+        await self._submit({
+            "op": "save_message",
+            "id": message.id,
+            "conversation_id": message.conversation_id,
+            "role": message.role.value,
+            "content": message.content,
+            "timestamp": timestamp,
+            "token_count": token_count,
+        })
         return message.id
     
-    async def get_conversation_messages(self, conversation_id: str) -> List[ChatMessage]:
-        """获取对话的所有消息"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def _ensure_hot(self, conversation_id: str):
+        """对话已归档时先把消息还原到messages表，之后按普通对话读取"""
+        async with self.pool.reader() as db:
             async with db.execute(
-                "SELECT id, role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY timestamp",
-                (conversation_id,)
+                "SELECT 1 FROM conversation_archives WHERE conversation_id = ?", (conversation_id,)
+            ) as cursor:
+                archived = await cursor.fetchone() is not None
+        if archived:
+            await self.rehydrate_conversation(conversation_id)
+
+    @db_query_seconds.time(operation="rehydrate_conversation")
+    async def rehydrate_conversation(self, conversation_id: str) -> int:
+        """把归档的对话还原为普通对话，返回还原的消息数"""
+        async def op(db):
+            async with db.execute(
+                "SELECT codec, payload FROM conversation_archives WHERE conversation_id = ?", (conversation_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if not row:
+                return 0
+            # 按原rowid插入；原rowid已被其他消息占用（或旧归档没有rowid）时分配新的rowid，按时间顺序插入保持先后顺序
+            messages = _decode_archive(row[0], row[1])
+            for m in messages:
+                values = (m[0], conversation_id, m[1], m[2], m[3], m[4])
+                cursor = await db.execute(
+                    "INSERT OR IGNORE INTO messages (rowid, id, conversation_id, role, content, timestamp, token_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (m[5] if len(m) > 5 else None,) + values
+                )
+                if cursor.rowcount == 0:
+                    await db.execute(
+                        "INSERT OR IGNORE INTO messages (id, conversation_id, role, content, timestamp, token_count) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        values
+                    )
+            await db.execute("DELETE FROM conversation_archives WHERE conversation_id = ?", (conversation_id,))
+            await db.execute(
+                "UPDATE conversations SET archived = 0, rehydrated_at = ? WHERE id = ?",
+                (_format_timestamp(datetime.now()), conversation_id)
+            )
+            return len(messages)
+
+        return await self.pool.write(op)
+
+    async def archive_idle_conversations(self, idle_before: datetime, limit: int = 200, batch_size: int = 20) -> int:
+        """把最后一条消息和最近一次还原都早于idle_before的对话归档，返回归档的对话数
+
+        每个对话的全部消息压缩成一个blob写入conversation_archives，并从messages表（及全文索引）删除；
+        读取该对话时自动还原。归档中的消息不参与全文搜索，直到对话被再次打开。
+        """
+        await self.flush_writes()
+        threshold = _format_timestamp(idle_before)
+        archived = 0
+
+        async def op(db):
+            async with db.execute(
+                "SELECT id FROM conversations WHERE archived = 0 AND last_message_time < ? "
+                "AND (rehydrated_at IS NULL OR rehydrated_at < ?) LIMIT ?",
+                (threshold, threshold, min(batch_size, limit - archived))
+            ) as cursor:
+                conversation_ids = [row[0] for row in await cursor.fetchall()]
+
+            for conversation_id in conversation_ids:
+                async with db.execute(
+                    "SELECT id, role, content, timestamp, token_count, rowid FROM messages "
+                    "WHERE conversation_id = ? ORDER BY timestamp, rowid",
+                    (conversation_id,)
+                ) as cursor:
+                    messages = [list(row) for row in await cursor.fetchall()]
+                async with db.execute(
+                    "SELECT codec, payload FROM conversation_archives WHERE conversation_id = ?", (conversation_id,)
+                ) as cursor:
+                    existing = await cursor.fetchone()
+                if existing:
+                    # 归档后又写入过消息（未经读取还原），与已有归档合并
+                    messages = sorted(_decode_archive(existing[0], existing[1]) + messages, key=lambda m: m[3])
+
+                if messages:
+                    payload, raw_bytes = _encode_archive(messages)
+                    await db.execute(
+                        "INSERT OR REPLACE INTO conversation_archives "
+                        "(conversation_id, codec, payload, message_count, raw_bytes) VALUES (?, ?, ?, ?, ?)",
+                        (conversation_id, ARCHIVE_CODEC, payload, len(messages), raw_bytes)
+                    )
+                    await db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                await db.execute("UPDATE conversations SET archived = 1 WHERE id = ?", (conversation_id,))
+            return len(conversation_ids)
+
+        # 分批提交，每批只短暂占用写连接
+        while archived < limit:
+            start = time.perf_counter()
+            count = await self.pool.write(op)
+            db_query_seconds.observe(time.perf_counter() - start, operation="archive_batch")
+            archived += count
+            if count == 0:
+                break
+        return archived
+
+    async def incremental_vacuum(self, max_pages: int = 2000) -> int:
+        """回收最多max_pages个空闲页（需要auto_vacuum=INCREMENTAL），返回回收的页数"""
+        async def op(db):
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                before = (await cursor.fetchone())[0]
+            # execute只执行语句的第一步（只释放一页），executescript才会执行完
+            await db.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                after = (await cursor.fetchone())[0]
+            return before - after
+
+        start = time.perf_counter()
+        freed = await self.pool.write(op, transaction=False)
+        db_query_seconds.observe(time.perf_counter() - start, operation="incremental_vacuum")
+        return freed
+
+    async def vacuum(self, incremental: bool = True):
+        """完整VACUUM重建数据库文件，可同时切换到增量auto_vacuum；期间阻塞所有写入，适合离线执行"""
+        async def op(db):
+            if incremental:
+                await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+            await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        await self.flush_writes()
+        await self.pool.write(op, transaction=False)
+
+    async def checkpoint(self):
+        """把WAL中的页写回数据库文件，使回收的空间体现在文件大小上"""
+        async def op(db):
+            await db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            await db.execute("PRAGMA optimize")
+
+        await self.pool.write(op, transaction=False)
+
+    async def storage_stats(self) -> Dict[str, Any]:
+        """数据库文件、空闲页和归档的统计"""
+        async with self.pool.reader() as db:
+            values = {}
+            for pragma in ("page_size", "page_count", "freelist_count", "auto_vacuum"):
+                async with db.execute(f"PRAGMA {pragma}") as cursor:
+                    values[pragma] = (await cursor.fetchone())[0]
+            async with db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(raw_bytes), 0), "
+                "COALESCE(SUM(LENGTH(payload)), 0) FROM conversation_archives"
             ) as cursor:
-                messages = []
+                archives = await cursor.fetchone()
+
+        return {
+            "file_bytes": values["page_size"] * values["page_count"],
+            "free_bytes": values["page_size"] * values["freelist_count"],
+            "free_pages": values["freelist_count"],
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(values["auto_vacuum"], "unknown"),
+            "archived_conversations": archives[0],
+            "archived_messages": archives[1],
+            "archive_raw_bytes": archives[2],
+            "archive_compressed_bytes": archives[3],
+        }
+
+    async def warm_up(self, conversations: int = 50):
+        """在每个只读连接上读取最近的对话及其消息，把常用的索引和数据页读入页缓存"""
+        async def touch():
+            async with self.pool.reader() as db:
+                async with db.execute(
+                    "SELECT c.id, COUNT(m.id), SUM(LENGTH(m.content)) FROM "
+                    "(SELECT id FROM conversations WHERE archived = 0 ORDER BY last_message_time DESC LIMIT ?) c "
+                    "LEFT JOIN messages m ON m.conversation_id = c.id GROUP BY c.id",
+                    (conversations,)
+                ) as cursor:
+                    await cursor.fetchall()
+
+        await asyncio.gather(*(touch() for _ in range(self.pool.reader_count)))
+
+    @db_query_seconds.time(operation="get_conversation_messages")
+    async def get_conversation_messages(
+        self,
+        conversation_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> MessagePage:
+        """按游标分页获取对话消息，不传游标时返回最新的一页"""
+        if before and after:
+            raise ValueError("before和after不能同时指定")
+
+        # 分页游标依赖rowid，本对话有未提交的消息时先提交
+        if conversation_id in self._unflushed_messages:
+            await self.flush_writes()
+        await self._ensure_hot(conversation_id)
+
+        if after:
+            timestamp, rowid = _decode_cursor(after)
+            sql = """
+                SELECT rowid, id, role, content, timestamp FROM messages
+                WHERE conversation_id = ? AND (timestamp, rowid) > (?, ?)
+                ORDER BY timestamp, rowid
+                LIMIT ?
+            """
+            params = (conversation_id, timestamp, rowid, limit + 1)
+        elif before:
+            timestamp, rowid = _decode_cursor(before)
+            sql = """
+                SELECT rowid, id, role, content, timestamp FROM messages
+                WHERE conversation_id = ? AND (timestamp, rowid) < (?, ?)
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+            """
+            params = (conversation_id, timestamp, rowid, limit + 1)
+        else:
+            sql = """
+                SELECT rowid, id, role, content, timestamp FROM messages
+                WHERE conversation_id = ?
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+            """
+            params = (conversation_id, limit + 1)
+
+        async with self.pool.reader() as db:
+            async with db.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+
+        # 多取的一条只用于判断是否还有更多数据
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not after:
+            rows.reverse()
+
+        messages = [
+            ChatMessage(
+                id=row[1],
+                role=MessageRole(row[2]),
+                content=row[3],
+                timestamp=datetime.fromisoformat(row[4]) if row[4] else None,
+                conversation_id=conversation_id
+            )
+            for row in rows
+        ]
+        return MessagePage(
+            items=messages,
+            has_more=has_more,
+            before_cursor=_encode_cursor(rows[0][4], rows[0][0]) if rows else before,
+            after_cursor=_encode_cursor(rows[-1][4], rows[-1][0]) if rows else after
+        )
+    
+    @db_query_seconds.time(operation="get_context_messages")
+    async def get_context_messages(
+        self,
+        conversation_id: str,
+        token_budget: int,
+        exclude_message_id: Optional[str] = None,
+        after: Optional[str] = None,
+        max_messages: int = 200
+    ) -> List[ChatMessage]:
+        """从最新的消息开始向前读取，直到用完token预算，按时间正序返回
+
+        通过游标分块读取，预算用完立即停止，读取量与预算成正比而不是与对话长度成正比。
+        after为分页游标，只读取其后的消息（已被摘要覆盖的消息不再重复放入上下文）。
+        写后队列中尚未提交的本对话消息按时间合并进来。
+        """
+        messages = []
+        used_tokens = 0
+        await self._ensure_hot(conversation_id)
+
+        if after:
+            after_time, after_rowid = _decode_cursor(after)
+        else:
+            after_time, after_rowid = "", 0
+
+        # 未提交的消息，从新到旧
+        unflushed = sorted(
+            (
+                (_format_timestamp(message.timestamp or datetime.now()), message, tokens)
+                for message, tokens in self._unflushed_messages.get(conversation_id, {}).values()
+                if message.id != exclude_message_id
+            ),
+            key=lambda item: item[0],
+            reverse=True
+        )
+        unflushed_ids = {message.id for _, message, _ in unflushed}
+
+        def take(message: ChatMessage, tokens: int) -> bool:
+            nonlocal used_tokens
+            tokens += MESSAGE_TOKEN_OVERHEAD
+            if used_tokens + tokens > token_budget or len(messages) >= max_messages:
+                return False
+            used_tokens += tokens
+            messages.append(message)
+            return True
+
+        budget_left = True
+        async with self.pool.reader() as db:
+            async with db.execute("""
+                SELECT id, role, content, timestamp, token_count FROM messages
+                WHERE conversation_id = ? AND (timestamp, rowid) > (?, ?)
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+            """, (conversation_id, after_time, after_rowid, max_messages)) as cursor:
                 async for row in cursor:
-                    messages.append(ChatMessage(
+                    if row[0] == exclude_message_id or row[0] in unflushed_ids:
+                        continue
+
+                    while budget_left and unflushed and unflushed[0][0] >= (row[3] or ""):
+                        _, message, tokens = unflushed.pop(0)
+                        budget_left = take(message, tokens)
+                    if not budget_left:
+                        break
+
+                    # 旧数据没有预先计算的token数，读取时补算
+                    tokens = row[4] if row[4] is not None else count_tokens(row[2])
+                    budget_left = take(ChatMessage(
                         id=row[0],
                         role=MessageRole(row[1]),
                         content=row[2],
                         timestamp=datetime.fromisoformat(row[3]) if row[3] else None,
                         conversation_id=conversation_id
-                    ))
-                return messages
+                    ), tokens)
+                    if not budget_left:
+                        break
+
+        while budget_left and unflushed:
+            _, message, tokens = unflushed.pop(0)
+            budget_left = take(message, tokens)
+
+        messages.reverse()
+        return messages
     
-    async def get_conversations(self, limit: int = 50) -> List[ConversationSummary]:
-        """获取对话列表"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT c.id, c.title, c.updated_at,
-                       (SELECT content FROM messages WHERE conversation_id = c.id ORDER BY timestamp DESC LIMIT 1) as last_message,
-                       (SELECT COUNT(*) FROM messages WHERE conversation_id = c.id) as message_count,
-                       (SELECT timestamp FROM messages WHERE conversation_id = c.id ORDER BY timestamp DESC LIMIT 1) as last_message_time
-                FROM conversations c
-                ORDER BY c.updated_at DESC
+    @db_query_seconds.time(operation="get_conversations")
+    async def get_conversations(
+        self,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> ConversationPage:
+        """按游标分页获取对话列表（最近活跃的在前），不传游标时返回第一页"""
+        if before and after:
+            raise ValueError("before和after不能同时指定")
+
+        await self.flush_writes()
+
+        if before:
+            # 列表中更靠前的数据，即更近期活跃的对话
+            last_time, rowid = _decode_cursor(before)
+            sql = """
+                SELECT rowid, id, title, updated_at, last_message, message_count, last_message_time
+                FROM conversations
+                WHERE (last_message_time, rowid) > (?, ?)
+                ORDER BY last_message_time, rowid
                 LIMIT ?
-            """, (limit,)) as cursor:
-                conversations = []
-                async for row in cursor:
-                    # 使用最后一条消息的时间，如果没有则使用对话更新时间
-                    last_time = row[5] if row[5] else row[2]
-                    try:
-                        if last_time:
-                            timestamp = datetime.fromisoformat(last_time.replace('Z', '+00:00'))
-                        else:
-                            timestamp = datetime.now()
-                    except (ValueError, AttributeError):
-                        timestamp = datetime.now()
-
-                    conversations.append(ConversationSummary(
-                        id=row[0],
-                        title=row[1] or f"对话 {timestamp.strftime('%m-%d %H:%M')}",
-                        timestamp=timestamp,
-                        last_message=row[3] or "",
-                        message_count=row[4] or 0
-                    ))
-                return conversations
+            """
+            params = (last_time, rowid, limit + 1)
+        elif after:
+            last_time, rowid = _decode_cursor(after)
+            sql = """
+                SELECT rowid, id, title, updated_at, last_message, message_count, last_message_time
+                FROM conversations
+                WHERE (last_message_time, rowid) < (?, ?)
+                ORDER BY last_message_time DESC, rowid DESC
+                LIMIT ?
+            """
+            params = (last_time, rowid, limit + 1)
+        else:
+            sql = """
+                SELECT rowid, id, title, updated_at, last_message, message_count, last_message_time
+                FROM conversations
+                ORDER BY last_message_time DESC, rowid DESC
+                LIMIT ?
+            """
+            params = (limit + 1,)
+
+        async with self.pool.reader() as db:
+            async with db.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before:
+            rows.reverse()
+
+        conversations = []
+        for row in rows:
+            # 使用最后一条消息的时间，如果没有则使用对话更新时间
+            last_time = row[6] if row[6] else row[3]
+            try:
+                if last_time:
+                    timestamp = datetime.fromisoformat(last_time.replace('Z', '+00:00'))
+                else:
+                    timestamp = datetime.now()
+            except (ValueError, AttributeError):
+                timestamp = datetime.now()
+
+            conversations.append(ConversationSummary(
+                id=row[1],
+                title=row[2] or f"对话 {timestamp.strftime('%m-%d %H:%M')}",
+                timestamp=timestamp,
+                last_message=row[4] or "",
+                message_count=row[5] or 0
+            ))
+
+        return ConversationPage(
+            items=conversations,
+            has_more=has_more,
+            before_cursor=_encode_cursor(rows[0][6], rows[0][0]) if rows else before,
+            after_cursor=_encode_cursor(rows[-1][6], rows[-1][0]) if rows else after
+        )
     
-    async def update_conversation_title(self, conversation_id: str, title: str):
-        """更新对话标题"""
-        async with aiosqlite.connect(self.db_path) as db:
+    @db_query_seconds.time(operation="search_messages")
+    async def search_messages(self, query: str, limit: int = 20, after: Optional[str] = None) -> MessageSearchPage:
+        """全文搜索历史消息，按相关度排序并分页
+
+        不少于3个字符的词走trigram索引，一两个汉字的词走二元分词索引，都按bm25排序；
+        其余短词（如"AI"）在索引命中的结果上用LIKE过滤，全部是这类短词时只扫描最近写入的消息，按时间倒序返回。
+        """
+        await self.flush_writes()
+
+        match_expression, cjk_expression, short_terms, terms = _parse_search_query(query)
+        like_sql = "".join(" AND m.content LIKE ? ESCAPE '\\'" for _ in short_terms)
+        like_params = tuple(_like_pattern(term) for term in short_terms)
+
+        # 第一个可用的索引负责打分，另一个索引只用于过滤
+        indexes = [(table, expression) for table, expression in (
+            ("messages_fts", match_expression), ("messages_cjk", cjk_expression)
+        ) if expression]
+
+        if indexes:
+            (table, expression), filters = indexes[0], indexes[1:]
+            filter_sql = "".join(
+                f" AND m.rowid IN (SELECT rowid FROM {name} WHERE {name} MATCH ?)" for name, _ in filters
+            )
+            sql = f"""
+                SELECT m.rowid, m.id, m.conversation_id, c.title, m.role, m.content, m.timestamp, hits.score
+                FROM (
+                    SELECT rowid, bm25({table}) AS score FROM {table} WHERE {table} MATCH ?
+                ) AS hits
+                JOIN messages m ON m.rowid = hits.rowid
+                JOIN conversations c ON c.id = m.conversation_id
+                WHERE 1 = 1{filter_sql}{like_sql}
+            """
+            params = (expression,) + tuple(expression for _, expression in filters) + like_params
+            if after:
+                score, rowid = _decode_cursor(after)
+                sql += " AND (hits.score, m.rowid) > (?, ?)"
+                params += (score, rowid)
+            sql += " ORDER BY hits.score, m.rowid LIMIT ?"
+        else:
+            sql = f"""
+                SELECT m.rowid, m.id, m.conversation_id, c.title, m.role, m.content, m.timestamp, m.timestamp
+                FROM messages m
+                JOIN conversations c ON c.id = m.conversation_id
+                WHERE m.rowid > (SELECT COALESCE(MAX(rowid), 0) FROM messages) - ?{like_sql}
+            """
+            params = (LIKE_SCAN_WINDOW,) + like_params
+            if after:
+                last_time, rowid = _decode_cursor(after)
+                sql += " AND (m.timestamp, m.rowid) < (?, ?)"
+                params += (last_time, rowid)
+            sql += " ORDER BY m.timestamp DESC, m.rowid DESC LIMIT ?"
+        params += (limit + 1,)
+
+        async with self.pool.reader() as db:
+            async with db.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return MessageSearchPage(
+            items=[
+                MessageSearchHit(
+                    message_id=row[1],
+                    conversation_id=row[2],
+                    conversation_title=row[3],
+                    role=MessageRole(row[4]),
+                    snippet=_build_snippet(row[5], terms),
+                    timestamp=row[6]
+                )
+                for row in rows
+            ],
+            has_more=has_more,
+            after_cursor=_encode_cursor(rows[-1][7], rows[-1][0]) if rows else after
+        )
+
+    async def rebuild_search_index(self) -> int:
+        """重建消息全文索引并合并索引段，返回索引的消息数"""
+        async def op(db):
+            await db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            await db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+            await db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')")
+            await db.execute("INSERT INTO messages_cjk (messages_cjk) VALUES ('delete-all')")
             await db.execute(
-                "UPDATE conversations SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (title, conversation_id)
+                "INSERT INTO messages_cjk (rowid, grams) "
+                "SELECT rowid, cjk_bigrams(content) FROM messages WHERE cjk_bigrams(content) != ''"
             )
-            await db.commit()
+            await db.execute("INSERT INTO messages_cjk (messages_cjk) VALUES ('optimize')")
+            async with db.execute("SELECT COUNT(*) FROM messages") as cursor:
+                return (await cursor.fetchone())[0]
+
+        return await self.pool.write(op)
+
+    @db_query_seconds.time(operation="get_summary")
+    async def get_summary(self, conversation_id: str) -> Optional[RollingSummary]:
+        """获取对话的滚动摘要"""
+        async with self.pool.reader() as db:
+            async with db.execute(
+                "SELECT content, covered_until, token_count FROM conversation_summaries WHERE conversation_id = ?",
+                (conversation_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        if not row:
+            return None
+        return RollingSummary(
+            conversation_id=conversation_id,
+            content=row[0],
+            covered_until=row[1],
+            token_count=row[2]
+        )
+
+    @db_query_seconds.time(operation="save_summary")
+    async def save_summary(self, summary: RollingSummary):
+        """保存（覆盖）对话的滚动摘要"""
+        async def op(db):
+            await db.execute("""
+                INSERT INTO conversation_summaries (conversation_id, content, covered_until, token_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                    content = excluded.content,
+                    covered_until = excluded.covered_until,
+                    token_count = excluded.token_count,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (summary.conversation_id, summary.content, summary.covered_until, summary.token_count))
+
+        await self.pool.write(op)
     
+    @db_query_seconds.time(operation="update_conversation_title")
+    async def update_conversation_title(self, conversation_id: str, title: str):
+        """更新对话标题"""
+        await self._submit({"op": "update_title", "id": conversation_id, "title": title})
+    
+    @db_query_seconds.time(operation="delete_conversation")
     async def delete_conversation(self, conversation_id: str):
         """删除对话"""
-        async with aiosqlite.connect(self.db_path) as db:
+        # 先提交排队中的写入，避免删除后又被写回
+        await self.flush_writes()
+
+        async def op(db):
             await db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            await db.execute("DELETE FROM conversation_summaries WHERE conversation_id = ?", (conversation_id,))
+            await db.execute("DELETE FROM conversation_archives WHERE conversation_id = ?", (conversation_id,))
             await db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
-            await db.commit()
+
+        await self.pool.write(op)
+
+    async def export_records(self, batch_size: int = 1000) -> AsyncGenerator[Dict[str, Any], None]:
+        """按表逐页导出全部数据：header、对话、消息、摘要，最后是归档对话中的消息
+
+        每页按rowid游标读取batch_size行后立即归还连接，内存占用与数据库大小无关；
+        导出期间的新写入可能只有一部分包含在结果中，需要时间点一致的备份请使用SQLite的备份接口。
+        """
+        await self.flush_writes()
+        yield {
+            "type": "header",
+            "format": EXPORT_FORMAT,
+            "version": EXPORT_FORMAT_VERSION,
+            "schema_version": len(SCHEMA_MIGRATIONS),
+            "exported_at": _format_timestamp(datetime.now()),
+        }
+
+        tables = [
+            ("conversation", "SELECT rowid, id, title, created_at, updated_at, last_message_time FROM conversations",
+             ("id", "title", "created_at", "updated_at", "last_message_time")),
+            ("message", "SELECT rowid, id, conversation_id, role, content, timestamp, token_count FROM messages",
+             ("id", "conversation_id", "role", "content", "timestamp", "token_count")),
+            ("summary", "SELECT rowid, conversation_id, content, covered_until, token_count, updated_at "
+                        "FROM conversation_summaries",
+             ("conversation_id", "content", "covered_until", "token_count", "updated_at")),
+        ]
+        for record_type, select, fields in tables:
+            last_rowid = 0
+            while True:
+                start = time.perf_counter()
+                async with self.pool.reader() as db:
+                    async with db.execute(
+                        f"{select} WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size)
+                    ) as cursor:
+                        rows = await cursor.fetchall()
+                db_query_seconds.observe(time.perf_counter() - start, operation="export_page")
+                if not rows:
+                    break
+                for row in rows:
+                    record = {"type": record_type}
+                    record.update(zip(fields, row[1:]))
+                    yield record
+                last_rowid = rows[-1][0]
+
+        # 归档对话的消息解压后按普通消息导出（每页的blob较大，页更小）
+        last_rowid = 0
+        while True:
+            async with self.pool.reader() as db:
+                async with db.execute(
+                    "SELECT rowid, conversation_id, codec, payload FROM conversation_archives "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, max(1, batch_size // 20))
+                ) as cursor:
+                    rows = await cursor.fetchall()
+            if not rows:
+                break
+            for _, conversation_id, codec, payload in rows:
+                for m in _decode_archive(codec, payload):
+                    yield {
+                        "type": "message", "id": m[0], "conversation_id": conversation_id, "role": m[1],
+                        "content": m[2], "timestamp": m[3], "token_count": m[4],
+                    }
+            last_rowid = rows[-1][0]
+
+    async def import_records(
+        self,
+        records: AsyncIterable[Dict[str, Any]],
+        batch_size: int = 500,
+        skip: int = 0,
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> Dict[str, int]:
+        """导入export_records格式的记录，每batch_size条在一个事务中提交
+
+        已存在的对话、消息和摘要会被跳过，重复导入同一文件是安全的；中断后可以用skip跳过
+        已提交的记录数继续导入。每提交一批调用on_progress(已提交的记录数)。
+        """
+        await self.flush_writes()
+        counts = {"records": 0, "conversations": 0, "messages": 0, "summaries": 0, "existing": 0}
+        batch: List[Dict[str, Any]] = []
+        position = 0
+
+        async def commit():
+            async def op(db):
+                inserted = {"conversations": 0, "messages": 0, "summaries": 0, "existing": 0}
+                for record in batch:
+                    record_type = record["type"]
+                    if record_type == "conversation":
+                        # 统计字段由随后导入的消息维护，最后消息时间先取导出时的值，使其中最新的消息成为最后消息
+                        cursor = await db.execute(
+                            "INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at, last_message_time) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (record["id"], record["title"], record["created_at"], record["updated_at"],
+                             record["last_message_time"])
+                        )
+                        added = cursor.rowcount > 0
+                        key = "conversations"
+                    elif record_type == "message":
+                        added = await _insert_message(db, record)
+                        key = "messages"
+                    else:
+                        cursor = await db.execute(
+                            "INSERT OR IGNORE INTO conversation_summaries "
+                            "(conversation_id, content, covered_until, token_count, updated_at) VALUES (?, ?, ?, ?, ?)",
+                            (record["conversation_id"], record["content"], record["covered_until"],
+                             record["token_count"], record["updated_at"])
+                        )
+                        added = cursor.rowcount > 0
+                        key = "summaries"
+                    inserted[key if added else "existing"] += 1
+                return inserted
+
+            start = time.perf_counter()
+            inserted = await self.pool.write(op)
+            db_query_seconds.observe(time.perf_counter() - start, operation="import_batch")
+            for key, value in inserted.items():
+                counts[key] += value
+            counts["records"] = position
+            batch.clear()
+            if on_progress is not None:
+                await on_progress(position)
+
+        async for record in records:
+            position += 1
+            if position <= skip:
+                continue
+            if record.get("type") == "header":
+                _check_export_header(record)
+                continue
+            batch.append(_normalize_import_record(record, position))
+            if len(batch) >= batch_size:
+                await commit()
+
+        if batch:
+            await commit()
+        counts["records"] = position
+        return counts
 
 # 全局数据库实例
-db = ChatDatabase()
+db = ChatDatabase(
+    os.getenv("CHAT_DB_PATH", "chat_history.db"),
+    reader_count=int(os.getenv("DB_READER_CONNECTIONS", "4")),
+    write_behind=os.getenv("DB_WRITE_BEHIND", "false").lower() == "true",
+    write_behind_journal=os.getenv("DB_WRITE_BEHIND_JOURNAL") or None,
+    write_behind_interval_ms=float(os.getenv("DB_WRITE_BEHIND_INTERVAL_MS", "20")),
+    write_behind_fsync=os.getenv("DB_WRITE_BEHIND_FSYNC", "false").lower() == "true",
+    write_behind_max_attempts=int(os.getenv("DB_WRITE_BEHIND_MAX_ATTEMPTS", "5")),
+)
+if db.write_behind is not None:
+    write_behind_pending.set_function(lambda: db.write_behind.pending_count)
+    write_behind_dead_letters.set_function(lambda: db.write_behind.dead_letters)
@@ -0,0 +1,220 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import aiosqlite
+
+# 所有连接共用的PRAGMA
+_COMMON_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",      # 约16MB页缓存
+    "PRAGMA mmap_size = 134217728",    # 128MB内存映射读
+)
+
+# 写连接专用：WAL模式下NORMAL同步级别只在checkpoint时fsync，已足够安全
+_WRITER_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA wal_autocheckpoint = 1000",
+)
+
+# 读连接专用：防止误写
+_READER_PRAGMAS = (
+    "PRAGMA query_only = ON",
+)
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class SQLitePool:
+    """SQLite连接池：一个写连接 + 多个只读连接
+
+    写操作进入队列，由后台任务合并成一个事务提交（group commit），
+    多个并发写共享一次fsync；读操作从只读连接池中借用连接，在WAL模式下与写并行。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        reader_count: int = 4,
+        statement_cache_size: int = 256,
+        max_batch_size: int = 64,
+        auto_vacuum: Optional[str] = None,
+        functions: Optional[Dict[str, Callable[..., Any]]] = None,
+    ):
+        self.db_path = db_path
+        # 新数据库使用的auto_vacuum模式（NONE/FULL/INCREMENTAL），对已有数据库无效
+        self.auto_vacuum = auto_vacuum
+        self.reader_count = max(1, reader_count)
+        self.statement_cache_size = statement_cache_size
+        self.max_batch_size = max(1, max_batch_size)
+        # 注册到每个连接上的自定义SQL函数（名称 -> 函数），触发器和迁移中可以直接调用
+        self.functions = dict(functions or {})
+
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._open_lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        """打开写连接和读连接池（重复调用无副作用）"""
+        async with self._open_lock:
+            if self.is_open:
+                return
+
+            # 先打开写连接，确保WAL模式在读连接打开前生效；
+            # auto_vacuum必须在切换WAL之前设置，切换WAL会写入文件头，之后再设置不再生效
+            writer_pragmas = _WRITER_PRAGMAS
+            if self.auto_vacuum:
+                writer_pragmas = (f"PRAGMA auto_vacuum = {self.auto_vacuum}",) + writer_pragmas
+            writer = await self._connect(writer_pragmas)
+            readers = [await self._connect(_READER_PRAGMAS) for _ in range(self.reader_count)]
+
+            self._idle_readers = asyncio.Queue()
+            for reader in readers:
+                self._idle_readers.put_nowait(reader)
+            self._readers = readers
+            self._write_queue = asyncio.Queue()
+            self._writer = writer
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def close(self):
+        """等待排队中的写操作完成后关闭所有连接"""
+        async with self._open_lock:
+            if not self.is_open:
+                return
+
+            # 发送停止信号，写任务处理完队列中剩余的操作后退出
+            await self._write_queue.put(None)
+            await self._writer_task
+
+            for reader in self._readers:
+                await reader.close()
+            await self._writer.close()
+
+            self._writer = None
+            self._writer_task = None
+            self._readers = []
+            self._idle_readers = None
+            self._write_queue = None
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """借用一个只读连接"""
+        if not self.is_open:
+            await self.open()
+
+        idle_readers = self._idle_readers
+        conn = await idle_readers.get()
+        try:
+            yield conn
+        finally:
+            idle_readers.put_nowait(conn)
+
+    async def write(self, op: WriteOp, transaction: bool = True) -> Any:
+        """提交一个写操作，等待其所在批次提交后返回op的结果
+
+        op在写连接上执行，不能自行commit；单个op失败只回滚该op，不影响同批次的其他写。
+        transaction=False时op不进入批次，在两批之间单独执行且不开启事务（用于VACUUM等不能在事务中执行的语句）。
+        """
+        if not self.is_open:
+            await self.open()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((op, future, transaction))
+        return await future
+
+    async def _connect(self, pragmas: Tuple[str, ...]) -> aiosqlite.Connection:
+        """创建连接并应用PRAGMA"""
+        conn = await aiosqlite.connect(
+            self.db_path,
+            isolation_level=None,  # 手动管理事务
+            cached_statements=self.statement_cache_size,
+        )
+        for pragma in _COMMON_PRAGMAS + pragmas:
+            await conn.execute(pragma)
+        for name, func in self.functions.items():
+            await conn.create_function(name, -1, func, deterministic=True)
+        return conn
+
+    async def _writer_loop(self):
+        """写任务：取出队列中所有已到达的写操作，合并为一个事务提交"""
+        stopping = False
+        deferred = None
+        while not stopping:
+            item = deferred or await self._write_queue.get()
+            deferred = None
+            if item is None:
+                break
+            if not item[2]:
+                await self._run_outside_transaction(item[0], item[1])
+                continue
+
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._write_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if not item[2]:
+                    # 不能在事务中执行的操作等本批提交后再执行
+                    deferred = item
+                    break
+                batch.append(item)
+
+            await self._run_batch(batch)
+
+    async def _run_outside_transaction(self, op: WriteOp, future: asyncio.Future):
+        try:
+            result = await op(self._writer)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, batch: List[Tuple[WriteOp, asyncio.Future, bool]]):
+        """在一个事务中执行一批写操作"""
+        conn = self._writer
+        outcomes = []
+
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            for op, future, _ in batch:
+                await conn.execute("SAVEPOINT write_op")
+                try:
+                    result = await op(conn)
+                except Exception as e:
+                    await conn.execute("ROLLBACK TO write_op")
+                    await conn.execute("RELEASE write_op")
+                    outcomes.append((future, None, e))
+                else:
+                    await conn.execute("RELEASE write_op")
+                    outcomes.append((future, result, None))
+            await conn.execute("COMMIT")
+        except Exception as e:
+            # 事务本身失败（如磁盘错误），整批写操作都视为失败
+            if conn.in_transaction:
+                try:
+                    await conn.execute("ROLLBACK")
+                except Exception as rollback_error:
+                    print(f"回滚写事务错误: {rollback_error}")
+            outcomes = [(future, None, e) for _, future, _ in batch]
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,194 @@
+import asyncio
+import importlib.util
+import os
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+import httpx
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 可安全重试的状态码
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+# 可安全重试的异常（请求尚未被服务端处理或超时）
+RETRYABLE_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+
+class _HostSlot:
+    """单个主机的并发限制和计数，没有在途和等待的请求时从表中移除"""
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+
+
+class RetryBudget:
+    """重试预算：每个请求存入ratio个令牌，每次重试消耗一个令牌，避免故障时重试放大流量"""
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class HttpClient:
+    """应用级共享HTTP客户端
+
+    所有对外请求共用一个连接池（keep-alive、可选HTTP/2），DNS缓存交给系统解析器（nscd、systemd-resolved等），
+    并限制每个主机的并发连接数；GET请求在连接错误和临时性状态码上按重试预算做带抖动的指数退避重试。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        max_connections_per_host: int = 10,
+        keepalive_expiry: float = 30,
+        timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 2.0,
+    ):
+        self.max_connections_per_host = max(1, max_connections_per_host)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = RetryBudget()
+        # 安装了h2时启用HTTP/2
+        self.http2 = importlib.util.find_spec("h2") is not None
+
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+        # 只保存有在途或等待请求的主机
+        self._hosts: Dict[str, _HostSlot] = {}
+
+        self.requests = 0
+        self.retries = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """底层httpx客户端（首次使用时创建）"""
+        if self._client is None:
+            self.open()
+        return self._client
+
+    def open(self):
+        """创建连接池（重复调用无副作用）"""
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(limits=self._limits, http2=self.http2),
+            timeout=self._timeout,
+            follow_redirects=True,
+        )
+
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """发送GET请求，失败时在重试预算内退避重试"""
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                async with self._host_slot(url):
+                    self.requests += 1
+                    response = await self.client.get(url, **kwargs)
+                if response.status_code not in RETRYABLE_STATUS_CODES or not self._can_retry(attempt):
+                    return response
+                await response.aclose()
+            except RETRYABLE_EXCEPTIONS:
+                if not self._can_retry(attempt):
+                    raise
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """发送流式请求（不重试），响应体由调用方按需读取，提前退出时连接直接释放"""
+        async with self._host_slot(url):
+            self.requests += 1
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+
+    def stats(self) -> dict:
+        """连接池使用情况，用于评估连接池大小：在途请求数（HTTP/1.1下即占用的连接数）和排队数"""
+        return {
+            "http2": self.http2,
+            "max_connections": self._limits.max_connections,
+            "max_connections_per_host": self.max_connections_per_host,
+            "active_requests": sum(slot.active for slot in self._hosts.values()),
+            "waiting_requests": sum(slot.waiting for slot in self._hosts.values()),
+            "requests": self.requests,
+            "retries": self.retries,
+            "retry_budget": round(self.retry_budget.tokens, 2),
+            "hosts": {
+                host: {"active": slot.active, "waiting": slot.waiting}
+                for host, slot in self._hosts.items()
+            },
+        }
+
+    def _can_retry(self, attempt: int) -> bool:
+        return attempt < self.max_retries and self.retry_budget.try_withdraw()
+
+    def _backoff(self, attempt: int) -> float:
+        """全抖动指数退避"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str) -> AsyncIterator[None]:
+        """限制单个主机的并发请求数"""
+        host = httpx.URL(url).host
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = _HostSlot(self.max_connections_per_host)
+        slot.waiting += 1
+        try:
+            await slot.semaphore.acquire()
+        except BaseException:
+            slot.waiting -= 1
+            self._release_host(host, slot)
+            raise
+        slot.waiting -= 1
+
+        slot.active += 1
+        try:
+            yield
+        finally:
+            slot.active -= 1
+            slot.semaphore.release()
+            self._release_host(host, slot)
+
+    def _release_host(self, host: str, slot: _HostSlot):
+        """主机没有在途和等待的请求时移除，避免访问过的主机一直留在表中"""
+        if slot.active == 0 and slot.waiting == 0 and self._hosts.get(host) is slot:
+            del self._hosts[host]
+
+# 全局HTTP客户端实例，由应用生命周期负责打开和关闭
+http_client = HttpClient(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10")),
+)
@@ -1,17 +1,61 @@
+import json
 import os
-from autogen_core.models import ModelFamily
-from autogen_ext.models.openai import OpenAIChatCompletionClient
+from typing import TYPE_CHECKING, List
 from dotenv import load_dotenv
+from service_registry import services
+
+if TYPE_CHECKING:
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+    from model_router import ModelRouter
 
 # 加载环境变量
 load_dotenv()
 
-def get_model_client():
-    """获取模型客户端"""
-    openai_model_client = OpenAIChatCompletionClient(
-        model=os.getenv("MODEL", "deepseek-chat"),
-        base_url=os.getenv("BASE_URL", "https://api.deepseek.com/v1"),
-        api_key=os.getenv("API_KEY"),
+# 各模型构建上下文（历史对话、搜索结果和当前问题）时可用的token预算，需为回复预留空间
+MODEL_TOKEN_BUDGETS = {
+    "deepseek-chat": 24000,
+    "deepseek-reasoner": 24000,
+    "gpt-4o": 32000,
+    "gpt-4o-mini": 32000,
+    "gpt-4": 6000,
+}
+DEFAULT_TOKEN_BUDGET = 8000
+
+def get_model_name() -> str:
+    """当前使用的模型名称"""
+    return os.getenv("MODEL", "deepseek-chat")
+
+def get_context_token_budget(model: str = None) -> int:
+    """获取模型的上下文token预算，可通过环境变量CONTEXT_TOKEN_BUDGET统一覆盖"""
+    override = os.getenv("CONTEXT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    model = model or get_model_name()
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+def get_model_endpoints() -> List[dict]:
+    """模型端点配置：MODEL_ENDPOINTS为JSON数组，每项包含name、base_url、api_key、model；未设置时使用MODEL/BASE_URL/API_KEY"""
+    configured = os.getenv("MODEL_ENDPOINTS")
+    if configured:
+        return json.loads(configured)
+    return [{
+        "name": "default",
+        "base_url": os.getenv("BASE_URL", "https://api.deepseek.com/v1"),
+        "api_key": os.getenv("API_KEY"),
+        "model": get_model_name(),
+    }]
+
+def create_openai_client(model: str, base_url: str, api_key: str, max_retries: int = 2) -> "OpenAIChatCompletionClient":
+    """创建单个兼容OpenAI接口的模型客户端"""
+    # autogen和openai的导入耗时较长，推迟到第一次创建客户端时
+    from autogen_core.models import ModelFamily
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+    return OpenAIChatCompletionClient(
+        model=model,
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=max_retries,
         model_info={
             "vision": False,
             "function_calling": True,
@@ -21,7 +65,32 @@ def get_model_client():
             "multiple_system_messages": True,
         }
     )
-    return openai_model_client
 
-# 单例设计模式
-model_client = get_model_client()
+def create_model_client() -> "ModelRouter":
+    """创建模型客户端：在配置的端点之间路由、故障转移和对冲请求"""
+    from model_router import ModelEndpoint, ModelRouter
+
+    configs = get_model_endpoints()
+    endpoints = []
+    for index, config in enumerate(configs):
+        client = create_openai_client(
+            model=config.get("model") or get_model_name(),
+            base_url=config["base_url"],
+            api_key=config.get("api_key") or os.getenv("API_KEY"),
+            # 多个端点时由路由器换端点重试，不在同一个端点上反复重试
+            max_retries=2 if len(configs) == 1 else 0,
+        )
+        endpoints.append(ModelEndpoint(config.get("name") or f"endpoint-{index}", client))
+    return ModelRouter(
+        endpoints,
+        strategy=os.getenv("MODEL_ROUTING", "least_inflight"),
+        hedge=os.getenv("MODEL_HEDGE", "false").lower() == "true",
+        hedge_percentile=float(os.getenv("MODEL_HEDGE_PERCENTILE", "95")),
+        hedge_min_delay_ms=float(os.getenv("MODEL_HEDGE_MIN_DELAY_MS", "300")),
+        hedge_initial_delay_ms=float(os.getenv("MODEL_HEDGE_INITIAL_DELAY_MS", "2000")),
+        failure_cooldown=float(os.getenv("MODEL_FAILURE_COOLDOWN", "30")),
+    )
+
+async def get_model_client() -> "ModelRouter":
+    """获取共享的模型客户端（第一次使用时在工作线程中创建，见service_registry）"""
+    return await services.acquire("model_client")
@@ -1,33 +1,66 @@
 import asyncio
+import hmac
 import json
 import uuid
 from datetime import datetime
 from typing import Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sse_starlette.sse import EventSourceResponse
 from models import (
     ChatRequest, ChatResponse, ChatMessage, MessageRole,
-    SearchRequest, ConversationSummary, StreamChunk
+    SearchRequest, ConversationSummary, ConversationPage, MessagePage, MessageSearchPage, StreamChunk,
+    StreamStatus
 )
 from chat_service import chat_service
-from search_service import search_service
+from summary_service import summary_service
+from stream_coalescer import stream_coalescer
+from response_cache import response_cache
+from stream_registry import stream_registry
+from stream_buffer import stream_buffer
 from database import db
+from maintenance import db_maintenance
+from data_transfer import check_compression, decode_ndjson, encode_ndjson, export_filename
+from metrics import metrics
+from service_registry import services
+from token_counter import load_encoding
 import os
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
+# 数据导入导出接口的管理员令牌，未设置时这两个接口关闭
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# 启动时在后台预热的服务（逗号分隔，见service_registry），默认全部在第一次使用时加载
+SERVICE_WARMUP = [name.strip() for name in os.getenv("SERVICE_WARMUP", "").split(",") if name.strip()]
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    # 启动时初始化数据库
+    # 启动时打开并初始化数据库；模型客户端、HTTP连接池和搜索服务在第一次使用时加载，
+    # 配置了SERVICE_WARMUP时启动后提前加载并建立连接；导入和构造都在工作线程中进行，不阻塞事件循环
+    await db.open()
     await db.init_db()
+    await stream_registry.open()
+    db_maintenance.start()
+    # tiktoken编码器在线程中加载，加载完成前token数使用估算
+    tokenizer = asyncio.create_task(load_encoding())
+    warm_up = asyncio.create_task(services.warm_up(SERVICE_WARMUP))
     yield
-    # 关闭时的清理工作（如果需要）
+    # 关闭时停止后台任务，提交剩余写操作并关闭连接池
+    for task in (warm_up, tokenizer):
+        task.cancel()
+    await asyncio.gather(warm_up, tokenizer, return_exceptions=True)
+    await db_maintenance.stop()
+    await stream_buffer.close()
+    await stream_registry.close()
+    await summary_service.shutdown()
+    await services.close()
+    await db.close()
 
 app = FastAPI(title="智能聊天系统", version="1.0.0", lifespan=lifespan)
 
@@ -38,6 +71,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Worker"],
 )
 
 @app.get("/")
@@ -48,34 +82,100 @@ async def root():
 @app.post("/api/chat/stream")
 async def chat_stream_endpoint(request: ChatRequest):
     """流式聊天接口"""
-    async def generate():
-        async for chunk in chat_service.chat_stream(
-            message=request.message,
-            conversation_id=request.conversation_id,
-            use_search=request.use_search
-        ):
-            # EventSourceResponse会自动添加"data: "前缀，所以只需要返回JSON字符串
-            yield chunk.model_dump_json()
+    chunks = chat_service.chat_stream(
+        message=request.message,
+        conversation_id=request.conversation_id,
+        use_search=request.use_search,
+        bypass_cache=request.bypass_cache
+    )
+    # 生成在后台进行并缓冲，连接断开后可通过续传接口继续接收；合并细碎的content块后再发送
+    buffer = stream_buffer.start(chunks)
+    return EventSourceResponse(stream_coalescer.stream(buffer.subscribe()), headers=_stream_worker_headers())
 
-    return EventSourceResponse(generate())
+@app.get("/api/chat/stream/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    after: Optional[int] = Query(None, ge=0)
+):
+    """断线重连：重放Last-Event-ID（或after参数）之后的数据块，然后继续接收实时输出"""
+    buffer = stream_buffer.get(stream_id)
+    if buffer is None:
+        # 续传缓冲只在生成该流的工作进程内，流在其他进程时返回421和所属进程，由负载均衡按粘性路由重试
+        status = await stream_registry.status(stream_id)
+        if status is not None and status.worker_id != stream_registry.worker_id:
+            raise HTTPException(
+                status_code=421,
+                detail=f"聊天流在工作进程 {status.worker_id} 上，续传请求需要路由到该进程",
+                headers={"X-Stream-Worker": status.worker_id},
+            )
+        raise HTTPException(status_code=404, detail="聊天流不存在或已过期")
+    if after is None:
+        try:
+            after = int(last_event_id) if last_event_id else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="无效的Last-Event-ID")
+    if not buffer.covers(after):
+        raise HTTPException(status_code=410, detail="断点之后的数据块已被丢弃，请重新加载对话")
+    return EventSourceResponse(stream_coalescer.stream(buffer.subscribe(after)), headers=_stream_worker_headers())
+
+def _stream_worker_headers() -> dict:
+    """流式响应带上所在工作进程，多进程部署时负载均衡据此把续传请求路由回同一进程"""
+    return {"X-Stream-Worker": stream_registry.worker_id}
 
 @app.post("/api/chat/interrupt/{stream_id}")
 async def interrupt_chat(stream_id: str):
     """中断聊天流"""
-    chat_service.interrupt_stream(stream_id)
+    if not await chat_service.interrupt_stream(stream_id):
+        raise HTTPException(status_code=404, detail="聊天流不存在或已结束")
     return {"message": "聊天已中断"}
 
-@app.get("/api/conversations")
-async def get_conversations():
-    """获取对话列表"""
-    conversations = await chat_service.get_conversations()
-    return conversations
+@app.get("/api/chat/streams/{stream_id}", response_model=StreamStatus)
+async def get_stream_status(stream_id: str):
+    """查询聊天流的状态（所在工作进程、心跳时间、是否已请求中断）"""
+    status = await chat_service.get_stream_status(stream_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="聊天流不存在或已结束")
+    return status
+
+@app.get("/api/conversations", response_model=ConversationPage)
+async def get_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None
+):
+    """分页获取对话列表"""
+    try:
+        return await chat_service.get_conversations(limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/api/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str):
-    """获取对话消息"""
-    messages = await chat_service.get_conversation_history(conversation_id)
-    return messages
+@app.get("/api/conversations/search", response_model=MessageSearchPage)
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None
+):
+    """全文搜索历史消息，按相关度排序"""
+    try:
+        return await chat_service.search_messages(q, limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None
+):
+    """分页获取对话消息，默认返回最新的一页"""
+    try:
+        return await chat_service.get_conversation_history(
+            conversation_id, limit=limit, before=before, after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/api/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
@@ -83,12 +183,93 @@ async def delete_conversation(conversation_id: str):
     await chat_service.delete_conversation(conversation_id)
     return {"message": "对话已删除"}
 
+def require_admin(authorization: Optional[str] = Header(None)):
+    """校验 Authorization: Bearer <ADMIN_TOKEN>；未配置ADMIN_TOKEN时接口关闭"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="数据导入导出接口未启用，需要设置ADMIN_TOKEN")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="需要管理员令牌", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/api/export", dependencies=[Depends(require_admin)])
+async def export_conversations(compression: str = Query("gzip")):
+    """流式导出全部对话、消息和摘要（NDJSON，compression为none/gzip/zstd）"""
+    try:
+        check_compression(compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        encode_ndjson(db.export_records(), compression),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(compression)}"'}
+    )
+
+@app.post("/api/import", dependencies=[Depends(require_admin)])
+async def import_conversations(request: Request, skip: int = Query(0, ge=0)):
+    """流式导入NDJSON（自动识别gzip/zstd压缩），已存在的记录会被跳过；出错时可用skip跳过已提交的记录续传"""
+    committed = skip
+
+    async def on_progress(position: int):
+        nonlocal committed
+        committed = position
+
+    try:
+        return await db.import_records(decode_ndjson(request.stream()), skip=skip, on_progress=on_progress)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e}（已提交 {committed} 条记录，可使用 skip={committed} 续传）")
+    except Exception as e:
+        print(f"导入数据错误: {e}")
+        raise HTTPException(status_code=500, detail=f"导入失败: {e}（已提交 {committed} 条记录，可使用 skip={committed} 续传）")
+
 @app.post("/api/search")
 async def search_web(request: SearchRequest):
     """网络搜索接口"""
+    search_service = await services.acquire("search_service")
     results = await search_service.search_web(request.query, request.max_results)
     return results
 
+@app.get("/api/http/stats")
+async def http_stats():
+    """对外HTTP连接池使用情况（尚未加载时不创建）"""
+    return _service_stats("http_client", lambda client: client.stats())
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """搜索缓存和回复缓存的命中情况"""
+    return {
+        "search": _service_stats("search_service", lambda service: service.cache.stats()),
+        "response": response_cache.stats(),
+    }
+
+@app.get("/api/models/stats")
+async def model_stats():
+    """各模型端点的请求数、错误数、在途请求数和首字延迟"""
+    return _service_stats("model_client", lambda client: client.stats())
+
+@app.get("/api/services/stats")
+async def service_stats():
+    """各延迟加载服务是否已加载，以及加载、启动和预热的耗时"""
+    return services.stats()
+
+def _service_stats(name: str, collect) -> dict:
+    """已加载服务的统计；监控探测不触发延迟加载，尚未加载的服务报告未加载"""
+    instance = services.peek(name)
+    if instance is None:
+        return {"loaded": False}
+    return collect(instance)
+
+@app.get("/api/storage/stats")
+async def storage_stats():
+    """数据库文件大小、空闲页、归档对话的压缩情况和最近一次后台维护的结果"""
+    stats = await db.storage_stats()
+    stats["last_maintenance"] = db_maintenance.last_run
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus格式的运行指标：数据库、搜索、首字延迟、输出速度和流式对话耗时"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from database import ChatDatabase, db
+
+# 加载环境变量
+load_dotenv()
+
+
+class DatabaseMaintenance:
+    """数据库后台维护任务
+
+    每隔interval秒执行一次：归档超过archive_after_days天没有新消息的对话，
+    空闲页超过阈值时分步执行增量vacuum（每步回收vacuum_pages页，步与步之间让出写连接），
+    最后做一次WAL检查点并更新查询规划统计。
+    """
+
+    def __init__(
+        self,
+        database: ChatDatabase,
+        interval: float = 600,
+        archive_after_days: float = 0,
+        archive_batch: int = 200,
+        vacuum_pages: int = 2000,
+        vacuum_min_free_pages: int = 256,
+        vacuum_max_steps: int = 50,
+    ):
+        self.database = database
+        self.interval = interval
+        self.archive_after_days = archive_after_days
+        self.archive_batch = archive_batch
+        self.vacuum_pages = max(1, vacuum_pages)
+        self.vacuum_min_free_pages = vacuum_min_free_pages
+        self.vacuum_max_steps = vacuum_max_steps
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._warned_no_auto_vacuum = False
+
+    def start(self):
+        """启动后台任务（interval为0时不启动）"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> Dict[str, Any]:
+        """执行一轮维护，返回本轮的归档数、回收的页数和耗时"""
+        start = time.perf_counter()
+        result = {"archived": 0, "freed_pages": 0}
+
+        if self.archive_after_days > 0:
+            idle_before = datetime.now() - timedelta(days=self.archive_after_days)
+            result["archived"] = await self.database.archive_idle_conversations(idle_before, limit=self.archive_batch)
+
+        stats = await self.database.storage_stats()
+        if stats["auto_vacuum"] == "incremental":
+            for _ in range(self.vacuum_max_steps):
+                if stats["free_pages"] - result["freed_pages"] < self.vacuum_min_free_pages:
+                    break
+                freed = await self.database.incremental_vacuum(self.vacuum_pages)
+                result["freed_pages"] += freed
+                if freed == 0:
+                    break
+                await asyncio.sleep(0)
+        elif stats["free_pages"] >= self.vacuum_min_free_pages and not self._warned_no_auto_vacuum:
+            self._warned_no_auto_vacuum = True
+            print("数据库未启用增量auto_vacuum，空闲页不会自动回收，可离线执行 python manage.py vacuum 转换")
+
+        await self.database.checkpoint()
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["finished_at"] = datetime.now().isoformat()
+        self.last_run = result
+        return result
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                result = await self.run_once()
+                if result["archived"] or result["freed_pages"]:
+                    print(f"数据库维护: 归档 {result['archived']} 个对话，回收 {result['freed_pages']} 页，"
+                          f"耗时 {result['elapsed_ms']} ms")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"数据库维护错误: {e}")
+
+# 全局数据库维护实例
+db_maintenance = DatabaseMaintenance(
+    db,
+    interval=float(os.getenv("DB_MAINTENANCE_INTERVAL", "600")),
+    archive_after_days=float(os.getenv("ARCHIVE_AFTER_DAYS", "0")),
+    archive_batch=int(os.getenv("ARCHIVE_BATCH_SIZE", "200")),
+    vacuum_pages=int(os.getenv("DB_VACUUM_PAGES", "2000")),
+    vacuum_min_free_pages=int(os.getenv("DB_VACUUM_MIN_FREE_PAGES", "256")),
+)
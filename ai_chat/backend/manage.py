@@ -0,0 +1,193 @@
+"""命令行维护工具
+
+用法:
+    python manage.py backfill-fts [--db chat_history.db]
+    python manage.py export --output backup.ndjson.gz [--db chat_history.db] [--compression gzip]
+    python manage.py import --input backup.ndjson.gz [--db chat_history.db] [--resume]
+    python manage.py archive --idle-days 90 [--db chat_history.db]
+    python manage.py vacuum [--db chat_history.db]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from data_transfer import compression_from_filename, decode_ndjson, encode_ndjson
+from database import ChatDatabase
+from token_counter import load_encoding
+
+# 文件读取块大小
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+async def backfill_fts(db_path: str):
+    """执行结构迁移，并为已有消息重建全文索引"""
+    database = ChatDatabase(db_path, reader_count=1)
+    await database.open()
+    try:
+        await database.init_db()
+        start = time.perf_counter()
+        count = await database.rebuild_search_index()
+        print(f"全文索引已重建: {count} 条消息，耗时 {time.perf_counter() - start:.2f} 秒")
+    finally:
+        await database.close()
+
+
+async def export_data(db_path: str, output: str, compression: str):
+    """把整个数据库流式导出为NDJSON文件"""
+    database = ChatDatabase(db_path, reader_count=1)
+    await database.open()
+    start = time.perf_counter()
+    records = 0
+
+    async def counted():
+        nonlocal records
+        async for record in database.export_records():
+            records += 1
+            yield record
+
+    try:
+        await database.init_db()
+        # 先写临时文件，完成后再改名，避免留下不完整的导出文件
+        temp_path = f"{output}.partial"
+        with open(temp_path, "wb") as f:
+            async for data in encode_ndjson(counted(), compression):
+                await asyncio.to_thread(f.write, data)
+        os.replace(temp_path, output)
+        print(f"已导出 {records} 条记录到 {output}，"
+              f"{os.path.getsize(output) / 1024 / 1024:.1f} MB，耗时 {time.perf_counter() - start:.2f} 秒")
+    finally:
+        await database.close()
+
+
+async def import_data(db_path: str, input_path: str, resume: bool, batch_size: int):
+    """从NDJSON文件流式导入，进度记录在 <文件>.import-state 中，--resume 时跳过已提交的记录"""
+    state_path = f"{input_path}.import-state"
+    skip = 0
+    if resume and os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("size") != os.path.getsize(input_path):
+            raise SystemExit(f"输入文件与进度记录不一致，请删除 {state_path} 后重新导入")
+        skip = state["committed"]
+        print(f"从第 {skip + 1} 条记录继续导入")
+
+    async def read_chunks():
+        with open(input_path, "rb") as f:
+            while True:
+                data = await asyncio.to_thread(f.read, READ_CHUNK_BYTES)
+                if not data:
+                    break
+                yield data
+
+    async def save_progress(position: int):
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"committed": position, "size": os.path.getsize(input_path)}, f)
+
+    database = ChatDatabase(db_path, reader_count=1)
+    await database.open()
+    # 导入的消息没有token数时需要计算，先加载编码器
+    await load_encoding()
+    start = time.perf_counter()
+    try:
+        await database.init_db()
+        counts = await database.import_records(
+            decode_ndjson(read_chunks()), batch_size=batch_size, skip=skip, on_progress=save_progress
+        )
+    finally:
+        await database.close()
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    print(f"导入完成，耗时 {time.perf_counter() - start:.2f} 秒: "
+          f"对话 {counts['conversations']}，消息 {counts['messages']}，摘要 {counts['summaries']}，"
+          f"已存在跳过 {counts['existing']}")
+
+
+async def archive_idle(db_path: str, idle_days: float):
+    """归档超过idle_days天没有新消息的对话，之后回收空闲页"""
+    database = ChatDatabase(db_path, reader_count=1)
+    await database.open()
+    start = time.perf_counter()
+    try:
+        await database.init_db()
+        idle_before = datetime.now() - timedelta(days=idle_days)
+        total = 0
+        while True:
+            archived = await database.archive_idle_conversations(idle_before, limit=1000)
+            if archived == 0:
+                break
+            total += archived
+            print(f"已归档 {total} 个对话")
+        freed = 0
+        if (await database.storage_stats())["auto_vacuum"] == "incremental":
+            freed = await database.incremental_vacuum(max_pages=2 ** 31 - 1)
+        await database.checkpoint()
+        stats = await database.storage_stats()
+    finally:
+        await database.close()
+
+    print(f"归档完成，耗时 {time.perf_counter() - start:.2f} 秒: 归档 {total} 个对话，回收 {freed} 页；"
+          f"共 {stats['archived_conversations']} 个归档对话，"
+          f"{stats['archive_raw_bytes'] / 1024 / 1024:.1f} MB 压缩为 {stats['archive_compressed_bytes'] / 1024 / 1024:.1f} MB")
+
+
+async def vacuum_db(db_path: str):
+    """完整VACUUM重建数据库文件，并切换到增量auto_vacuum（需要停止服务后执行）"""
+    database = ChatDatabase(db_path, reader_count=1)
+    await database.open()
+    start = time.perf_counter()
+    try:
+        await database.init_db()
+        before = os.path.getsize(db_path)
+        await database.vacuum(incremental=True)
+        stats = await database.storage_stats()
+    finally:
+        await database.close()
+
+    print(f"VACUUM完成，耗时 {time.perf_counter() - start:.2f} 秒: "
+          f"{before / 1024 / 1024:.1f} MB -> {os.path.getsize(db_path) / 1024 / 1024:.1f} MB，"
+          f"auto_vacuum={stats['auto_vacuum']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智能聊天系统维护工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser("backfill-fts", help="为已有的聊天记录建立全文索引")
+    backfill.add_argument("--db", default="chat_history.db", help="数据库文件路径")
+
+    export = subparsers.add_parser("export", help="把全部对话导出为NDJSON文件（可压缩）")
+    export.add_argument("--db", default="chat_history.db", help="数据库文件路径")
+    export.add_argument("--output", required=True, help="输出文件，以.gz/.zst结尾时默认使用对应的压缩")
+    export.add_argument("--compression", choices=["none", "gzip", "zstd"], help="压缩格式")
+
+    import_ = subparsers.add_parser("import", help="从NDJSON文件导入对话，已存在的记录会被跳过")
+    import_.add_argument("--db", default="chat_history.db", help="数据库文件路径")
+    import_.add_argument("--input", required=True, help="导出的文件（自动识别gzip/zstd压缩）")
+    import_.add_argument("--resume", action="store_true", help="从上次中断的位置继续导入")
+    import_.add_argument("--batch-size", type=int, default=500, help="每个事务提交的记录数")
+
+    archive = subparsers.add_parser("archive", help="把长期没有新消息的对话压缩归档")
+    archive.add_argument("--db", default="chat_history.db", help="数据库文件路径")
+    archive.add_argument("--idle-days", type=float, required=True, help="最后一条消息早于多少天的对话被归档")
+
+    vacuum = subparsers.add_parser("vacuum", help="重建数据库文件回收空间，并启用增量auto_vacuum（需停止服务）")
+    vacuum.add_argument("--db", default="chat_history.db", help="数据库文件路径")
+
+    args = parser.parse_args()
+    if args.command == "backfill-fts":
+        asyncio.run(backfill_fts(args.db))
+    elif args.command == "export":
+        asyncio.run(export_data(args.db, args.output, args.compression or compression_from_filename(args.output)))
+    elif args.command == "import":
+        asyncio.run(import_data(args.db, args.input, args.resume, args.batch_size))
+    elif args.command == "archive":
+        asyncio.run(archive_idle(args.db, args.idle_days))
+    elif args.command == "vacuum":
+        asyncio.run(vacuum_db(args.db))
+
+
+if __name__ == "__main__":
+    main()
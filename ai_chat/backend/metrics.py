@@ -0,0 +1,158 @@
+import bisect
+import functools
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """直方图：按标签分组统计观测值落入各个桶的次数、总和与总数"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.labelnames = tuple(labelnames)
+        # 每组标签：各桶计数（非累计）、总和、总数
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def time(self, **labels: str):
+        """异步函数装饰器：记录每次调用的耗时（秒）"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key in sorted(self._series):
+            counts, (total, count) = self._series[key]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [math.inf], counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """仪表：采集时调用回调函数读取当前值"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def render(self) -> List[str]:
+        if self._function is None:
+            return []
+        try:
+            value = self._function()
+        except Exception as e:
+            print(f"采集指标 {self.name} 错误: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """指标注册表，以Prometheus文本格式输出所有指标"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, help_text, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        metric = Gauge(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+db_query_seconds = metrics.histogram(
+    "chat_db_query_seconds", "数据库操作耗时（秒）",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5), ("operation",)
+)
+search_seconds = metrics.histogram(
+    "chat_search_seconds", "网络搜索耗时（秒），stage为total/upstream/enrich",
+    (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16), ("stage",)
+)
+stage_seconds = metrics.histogram(
+    "chat_stage_seconds", "生成前各阶段耗时（秒）",
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8), ("stage",)
+)
+ttft_seconds = metrics.histogram(
+    "chat_ttft_seconds", "从收到请求到第一个内容块的耗时（秒）",
+    (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13), ("source",)
+)
+tokens_per_second = metrics.histogram(
+    "chat_tokens_per_second", "首个内容块之后的输出速度（token/秒）",
+    (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500), ("source",)
+)
+stream_duration_seconds = metrics.histogram(
+    "chat_stream_duration_seconds", "流式对话总耗时（秒），outcome为done/error/interrupted/disconnected",
+    (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300), ("outcome",)
+)
+active_streams = metrics.gauge("chat_active_streams", "正在进行的流式对话数")
+agents_in_use = metrics.gauge("chat_agents_in_use", "正在生成回复的代理数")
+write_behind_pending = metrics.gauge("chat_db_write_behind_pending", "写后队列中尚未提交的写入数")
+write_behind_dead_letters = metrics.gauge(
+    "chat_db_write_behind_dead_letters", "本进程启动以来多次提交失败、转存到死信文件的写入数"
+)
+detached_streams = metrics.gauge("chat_detached_streams", "客户端已断开、在宽限期内继续生成等待重连的流数")
+model_ttft_seconds = metrics.histogram(
+    "chat_model_ttft_seconds", "各模型端点从发出请求到第一个token的耗时（秒）",
+    (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13), ("endpoint",)
+)
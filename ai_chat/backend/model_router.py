@@ -0,0 +1,306 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, List, Mapping, Optional, Sequence, Union
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, RequestUsage
+)
+from autogen_core.tools import Tool, ToolSchema
+from metrics import model_ttft_seconds
+
+
+class ModelEndpoint:
+    """一个兼容OpenAI接口的模型端点及其运行状态"""
+
+    def __init__(self, name: str, client: ChatCompletionClient, sample_size: int = 200):
+        self.name = name
+        self.client = client
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedge_wins = 0
+        self.hedge_losses = 0  # 对冲落败、在首个token之前被取消的请求
+        self.ttft_samples: Deque[float] = deque(maxlen=sample_size)
+        self.ttft_ewma: Optional[float] = None
+        self.failed_at = 0.0
+
+    def record_ttft(self, seconds: float):
+        self.ttft_samples.append(seconds)
+        self.ttft_ewma = seconds if self.ttft_ewma is None else self.ttft_ewma * 0.8 + seconds * 0.2
+        model_ttft_seconds.observe(seconds, endpoint=self.name)
+
+    def ttft_percentile(self, percentile: float) -> Optional[float]:
+        if not self.ttft_samples:
+            return None
+        ordered = sorted(self.ttft_samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedge_wins": self.hedge_wins,
+            "hedge_losses": self.hedge_losses,
+            "ttft_ewma_ms": round(self.ttft_ewma * 1000, 1) if self.ttft_ewma is not None else None,
+            "ttft_p50_ms": _ms(self.ttft_percentile(50)),
+            "ttft_p95_ms": _ms(self.ttft_percentile(95)),
+        }
+
+
+class ModelRouter(ChatCompletionClient):
+    """在多个模型端点之间路由请求的模型客户端
+
+    按在途请求数（least_inflight）或实测首字延迟（ttft）选择端点，刚出错的端点在冷却期内排到最后；
+    请求在产生第一个token之前出错时换下一个端点重试。开启对冲时，首个token在按历史首字延迟
+    百分位计算的时间内没有到达，就向另一个端点发起同样的请求，先出首字的一方胜出，另一方被取消。
+    """
+
+    def __init__(
+        self,
+        endpoints: List[ModelEndpoint],
+        strategy: str = "least_inflight",
+        hedge: bool = False,
+        hedge_percentile: float = 95,
+        hedge_min_delay_ms: float = 300,
+        hedge_initial_delay_ms: float = 2000,
+        hedge_min_samples: int = 20,
+        failure_cooldown: float = 30,
+    ):
+        if not endpoints:
+            raise ValueError("至少需要一个模型端点")
+        if strategy not in ("least_inflight", "ttft"):
+            raise ValueError(f"未知的模型路由策略: {strategy}")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.hedge = hedge and len(endpoints) > 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self.hedge_initial_delay = hedge_initial_delay_ms / 1000
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_cooldown = failure_cooldown
+        self.hedged_requests = 0
+
+    def _ordered_endpoints(self) -> List[ModelEndpoint]:
+        """按路由策略排序的候选端点，冷却期内的端点排在最后"""
+        now = time.time()
+
+        def key(endpoint: ModelEndpoint):
+            cooling = now - endpoint.failed_at < self.failure_cooldown
+            # 还没有首字延迟数据的端点优先，先积累样本；从未出过首字、只在对冲中落败过的端点排在有数据的端点之后
+            if endpoint.ttft_ewma is not None:
+                ttft = endpoint.ttft_ewma
+            elif endpoint.hedge_losses:
+                ttft = float("inf")
+            else:
+                ttft = 0.0
+            if self.strategy == "ttft":
+                return (cooling, ttft, endpoint.inflight)
+            return (cooling, endpoint.inflight, ttft)
+
+        return sorted(self.endpoints, key=key)
+
+    def _hedge_delay(self, endpoint: ModelEndpoint) -> float:
+        """对冲等待时间：该端点首字延迟的百分位，样本不足时使用初始值"""
+        if len(endpoint.ttft_samples) < self.hedge_min_samples:
+            return self.hedge_initial_delay
+        return max(self.hedge_min_delay, endpoint.ttft_percentile(self.hedge_percentile))
+
+    def _record_failure(self, endpoint: ModelEndpoint, error: Exception):
+        endpoint.failures += 1
+        endpoint.failed_at = time.time()
+        print(f"模型端点 {endpoint.name} 请求错误: {error}")
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        """非流式请求：按顺序尝试端点，出错时换下一个"""
+        last_error: Optional[Exception] = None
+        for endpoint in self._ordered_endpoints():
+            endpoint.inflight += 1
+            endpoint.requests += 1
+            try:
+                return await endpoint.client.create(
+                    messages, tools=tools, json_output=json_output,
+                    extra_create_args=extra_create_args, cancellation_token=cancellation_token
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._record_failure(endpoint, e)
+                last_error = e
+            finally:
+                endpoint.inflight -= 1
+        raise last_error
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool | type] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """流式请求：首个token之前出错时换端点重试，超过对冲时间时并行请求另一个端点"""
+        kwargs = dict(
+            tools=tools, json_output=json_output,
+            extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+        candidates = self._ordered_endpoints()
+        # 正在等待首个token的请求：(端点, 流, 读取首个元素的任务)
+        attempts: List[tuple] = []
+        winner = None
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        def start_attempt():
+            endpoint = candidates.pop(0)
+            stream = self._attempt_stream(endpoint, messages, kwargs)
+            attempts.append((endpoint, stream, asyncio.ensure_future(stream.__anext__())))
+
+        try:
+            start_attempt()
+            while winner is None:
+                if not attempts:
+                    if not candidates:
+                        raise last_error or RuntimeError("没有可用的模型端点")
+                    start_attempt()
+
+                timeout = None
+                if self.hedge and candidates and len(attempts) == 1:
+                    timeout = self._hedge_delay(attempts[0][0])
+                done, _ = await asyncio.wait(
+                    [task for _, _, task in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首个token迟迟未到，向下一个端点发起对冲请求
+                    self.hedged_requests += 1
+                    hedged = True
+                    start_attempt()
+                    continue
+
+                for attempt in list(attempts):
+                    endpoint, stream, task = attempt
+                    if task not in done:
+                        continue
+                    attempts.remove(attempt)
+                    error = task.exception()
+                    if error is None:
+                        if winner is None:
+                            winner = (endpoint, stream, task.result())
+                        else:
+                            # 两个请求同时出首字，只保留先选中的一个
+                            await stream.aclose()
+                        continue
+                    await stream.aclose()
+                    if isinstance(error, StopAsyncIteration):
+                        error = RuntimeError(f"模型端点 {endpoint.name} 没有返回内容")
+                    last_error = error
+
+            endpoint, stream, first_item = winner
+            if hedged:
+                endpoint.hedge_wins += 1
+        finally:
+            # 取消对冲中落败或尚未完成的请求
+            for endpoint, loser, task in attempts:
+                if winner is not None:
+                    endpoint.hedge_losses += 1
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await loser.aclose()
+
+        try:
+            yield first_item
+            async for item in stream:
+                yield item
+        finally:
+            await stream.aclose()
+
+    async def _attempt_stream(
+        self, endpoint: ModelEndpoint, messages: Sequence[LLMMessage], kwargs: dict
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """对单个端点的流式请求，记录在途数、首字延迟和错误"""
+        endpoint.inflight += 1
+        endpoint.requests += 1
+        start = time.perf_counter()
+        first = True
+        try:
+            async for item in endpoint.client.create_stream(messages, **kwargs):
+                if first:
+                    # 只有真正收到首个token时才计入首字延迟；对冲落败、中断和断开连接不计入
+                    endpoint.record_ttft(time.perf_counter() - start)
+                    first = False
+                yield item
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            raise
+        finally:
+            endpoint.inflight -= 1
+
+    def stats(self) -> dict:
+        """各端点的请求数、错误数、在途数和首字延迟"""
+        return {
+            "strategy": self.strategy,
+            "hedge": self.hedge,
+            "hedged_requests": self.hedged_requests,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+    async def warm_up(self, timeout: float = 5.0):
+        """向各端点发一个轻量请求（列出模型），提前建立连接池中的TCP/TLS连接"""
+        async def ping(endpoint: ModelEndpoint):
+            # OpenAIChatCompletionClient没有公开底层的AsyncOpenAI客户端
+            openai_client = getattr(endpoint.client, "_client", None)
+            if openai_client is None:
+                return
+            try:
+                await asyncio.wait_for(openai_client.models.list(), timeout)
+            except Exception as e:
+                print(f"模型端点 {endpoint.name} 预热错误: {e}")
+
+        await asyncio.gather(*(ping(endpoint) for endpoint in self.endpoints))
+
+    async def close(self) -> None:
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return _sum_usage(endpoint.client.actual_usage() for endpoint in self.endpoints)
+
+    def total_usage(self) -> RequestUsage:
+        return _sum_usage(endpoint.client.total_usage() for endpoint in self.endpoints)
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.endpoints[0].client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.endpoints[0].client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self.endpoints[0].client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self.endpoints[0].client.model_info
+
+
+def _sum_usage(usages) -> RequestUsage:
+    prompt_tokens = completion_tokens = 0
+    for usage in usages:
+        prompt_tokens += usage.prompt_tokens
+        completion_tokens += usage.completion_tokens
+    return RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
@@ -19,6 +19,7 @@ class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
     use_search: bool = False
+    bypass_cache: bool = False  # 为True时总是重新生成，不使用缓存的回复
 
 class ChatResponse(BaseModel):
     message: ChatMessage
@@ -32,6 +33,7 @@ class SearchResult(BaseModel):
     title: str
     url: str
     snippet: str
+    content: Optional[str] = None  # 抓取到的网页正文（仅在补充正文后存在）
 
 class ConversationSummary(BaseModel):
     id: str
@@ -40,8 +42,50 @@ class ConversationSummary(BaseModel):
     timestamp: datetime
     message_count: int
 
+class RollingSummary(BaseModel):
+    conversation_id: str
+    content: str
+    covered_until: str  # 摘要已覆盖到的最后一条消息的分页游标
+    token_count: int = 0
+
+class ConversationPage(BaseModel):
+    items: List[ConversationSummary]
+    has_more: bool  # 按请求方向是否还有更多数据
+    before_cursor: Optional[str] = None  # 本页第一条的游标，作为before参数获取列表中更靠前的数据
+    after_cursor: Optional[str] = None  # 本页最后一条的游标，作为after参数获取列表中更靠后的数据
+
+class MessagePage(BaseModel):
+    items: List[ChatMessage]  # 按时间正序排列
+    has_more: bool  # 按请求方向是否还有更多数据
+    before_cursor: Optional[str] = None  # 作为before参数获取更早的消息
+    after_cursor: Optional[str] = None  # 作为after参数获取更新的消息
+
+class MessageSearchHit(BaseModel):
+    message_id: str
+    conversation_id: str
+    conversation_title: str
+    role: MessageRole
+    snippet: str  # 已做HTML转义，命中的词用<mark>标记
+    timestamp: datetime
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchHit]  # 按相关度排序
+    has_more: bool
+    after_cursor: Optional[str] = None  # 作为after参数获取下一页
+
+class StreamStatus(BaseModel):
+    stream_id: str
+    conversation_id: Optional[str] = None
+    worker_id: str  # 流所在的工作进程
+    started_at: datetime
+    heartbeat_at: datetime
+    cancel_requested: bool = False
+
 class StreamChunk(BaseModel):
-    type: str  # "content", "done", "error"
+    type: str  # "start", "content", "done", "error"
     content: Optional[str] = None
     conversation_id: Optional[str] = None
     error: Optional[str] = None
+    stream_id: Optional[str] = None  # 仅start块携带，用于中断
+    timings: Optional[Dict[str, float]] = None  # 仅done块携带，各阶段耗时（毫秒）
+    seq: Optional[int] = None  # 流内递增的序号，同时作为SSE事件ID，断线重连时通过Last-Event-ID续传
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncGenerator, Optional
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from autogen_core import CancellationToken
+
+# 加载环境变量
+load_dotenv()
+
+
+class _CachedReply:
+    __slots__ = ("content", "created_at")
+
+    def __init__(self, content: str, created_at: float):
+        self.content = content
+        self.created_at = created_at
+
+
+class ResponseCache:
+    """模型回复的精确匹配缓存
+
+    以模型名、系统提示词和完整上下文的哈希为键，相同输入直接重放已保存的回复，不再调用模型。
+    条目按TTL过期，条目数或总字符数超过上限时淘汰最久未使用的。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_chars: int = 5_000_000,
+        ttl: float = 3600,
+        replay_chunk_chars: int = 8,
+        replay_delay_ms: float = 10,
+    ):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.replay_chunk_chars = max(1, replay_chunk_chars)
+        self.replay_delay = max(0.0, replay_delay_ms) / 1000
+
+        self._entries: "OrderedDict[str, _CachedReply]" = OrderedDict()
+        self._total_chars = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    @staticmethod
+    def make_key(model: str, system_message: str, context: str) -> str:
+        """缓存键：模型名、系统提示词和上下文的SHA-256"""
+        digest = hashlib.sha256()
+        for part in (model, system_message, context):
+            data = part.encode("utf-8")
+            # 写入长度前缀，避免不同的切分拼接出相同的字节串
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查找未过期的回复"""
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry.created_at >= self.ttl:
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.content
+
+    def put(self, key: str, content: str):
+        """保存回复，超出上限时淘汰最久未使用的条目"""
+        if not self.enabled or not content or len(content) > self.max_chars:
+            return
+
+        self._remove(key)
+        self._entries[key] = _CachedReply(content, time.time())
+        self._total_chars += len(content)
+        while len(self._entries) > self.max_entries or self._total_chars > self.max_chars:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def record_bypass(self):
+        """记录一次跳过缓存的请求"""
+        self.bypassed += 1
+
+    async def replay(
+        self, content: str, cancellation_token: Optional["CancellationToken"] = None
+    ) -> AsyncGenerator[str, None]:
+        """按配置的速度分块重放缓存的回复，取消令牌被取消时抛出CancelledError"""
+        for start in range(0, len(content), self.replay_chunk_chars):
+            if start and self.replay_delay:
+                delay = asyncio.ensure_future(asyncio.sleep(self.replay_delay))
+                if cancellation_token is not None:
+                    cancellation_token.link_future(delay)
+                await delay
+            elif cancellation_token is not None and cancellation_token.is_cancelled():
+                raise asyncio.CancelledError()
+            yield content[start:start + self.replay_chunk_chars]
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "chars": self._total_chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_chars -= len(entry.content)
+
+# 全局回复缓存实例，RESPONSE_CACHE_SIZE设为0关闭
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+    max_chars=int(os.getenv("RESPONSE_CACHE_MAX_CHARS", "5000000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    replay_chunk_chars=int(os.getenv("RESPONSE_CACHE_REPLAY_CHARS", "8")),
+    replay_delay_ms=float(os.getenv("RESPONSE_CACHE_REPLAY_DELAY_MS", "10")),
+)
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from models import SearchResult
+
+CacheKey = Tuple[str, int]
+Fetcher = Callable[[], Awaitable[List[SearchResult]]]
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：全角转半角、转小写、合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+class _CacheEntry:
+    __slots__ = ("results", "fetched_at")
+
+    def __init__(self, results: List[SearchResult], fetched_at: float):
+        self.results = results
+        self.fetched_at = fetched_at
+
+
+class SearchCache:
+    """搜索结果缓存
+
+    - TTL + LRU淘汰：新鲜期内直接命中，条目数超过上限时淘汰最久未使用的
+    - stale-while-revalidate：过期但仍在宽限期内的结果先返回，同时在后台刷新
+    - single-flight：相同查询的并发请求共享同一次上游请求
+    - 可选的SQLite持久化，重启后缓存仍然有效
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 600,
+        stale_ttl: float = 3600,
+        persist_path: Optional[str] = None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.persist_path = persist_path
+
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._loaded = False
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get_or_fetch(self, query: str, max_results: int, fetch: Fetcher) -> List[SearchResult]:
+        """优先从缓存返回结果，必要时调用fetch获取并写入缓存"""
+        if not self._loaded:
+            await self.load()
+
+        key = (normalize_query(query), max_results)
+        entry = self._entries.get(key)
+        now = time.time()
+
+        if entry is not None:
+            age = now - entry.fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.results
+            if age < self.stale_ttl:
+                # 先返回旧结果，后台刷新
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                self._fetch_shared(key, fetch)
+                return entry.results
+
+        self.misses += 1
+        # shield: 单个等待方被取消时不影响其他等待方共享的上游请求
+        return await asyncio.shield(self._fetch_shared(key, fetch))
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight),
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+    async def load(self):
+        """从磁盘加载未过宽限期的缓存条目（未配置持久化时只标记为已加载）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.persist_path:
+            return
+
+        try:
+            rows = await asyncio.to_thread(self._load_rows)
+        except Exception as e:
+            print(f"加载搜索缓存错误: {e}")
+            return
+
+        for query, max_results, payload, fetched_at in rows:
+            results = [SearchResult(**item) for item in json.loads(payload)]
+            self._entries[(query, max_results)] = _CacheEntry(results, fetched_at)
+
+    async def close(self):
+        """等待后台刷新和持久化任务完成"""
+        tasks = list(self._background) + list(self._inflight.values())
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _fetch_shared(self, key: CacheKey, fetch: Fetcher) -> asyncio.Task:
+        """同一个key同时只有一个上游请求"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._on_fetch_done(key, done))
+        return task
+
+    def _on_fetch_done(self, key: CacheKey, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # 后台刷新没有等待方，在这里取出异常避免"exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            print(f"刷新搜索缓存错误: {task.exception()}")
+
+    async def _fetch_and_store(self, key: CacheKey, fetch: Fetcher) -> List[SearchResult]:
+        results = await fetch()
+        # 空结果通常意味着上游出错，不缓存
+        if results:
+            entry = _CacheEntry(results, time.time())
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            if self.persist_path:
+                task = asyncio.create_task(asyncio.to_thread(self._persist_entry, key, entry))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        return results
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.persist_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                query TEXT NOT NULL,
+                max_results INTEGER NOT NULL,
+                results TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (query, max_results)
+            )
+        """)
+        return conn
+
+    def _load_rows(self):
+        """读取最近的条目，并清理超过宽限期的旧条目"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM search_cache WHERE fetched_at < ?", (time.time() - self.stale_ttl,))
+            rows = conn.execute(
+                "SELECT query, max_results, results, fetched_at FROM search_cache ORDER BY fetched_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+        finally:
+            conn.close()
+        # 按时间正序放入，最新的条目位于LRU末尾
+        rows.reverse()
+        return rows
+
+    def _persist_entry(self, key: CacheKey, entry: _CacheEntry):
+        payload = json.dumps([result.model_dump() for result in entry.results], ensure_ascii=False)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (query, max_results, results, fetched_at) VALUES (?, ?, ?, ?)",
+                    (key[0], key[1], payload, entry.fetched_at)
+                )
+        except Exception as e:
+            print(f"保存搜索缓存错误: {e}")
+        finally:
+            conn.close()
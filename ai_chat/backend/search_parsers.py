@@ -0,0 +1,277 @@
+import re
+import urllib.parse
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+from typing import Dict, List, Type
+from models import SearchResult
+
+# 摘要清理用的正则，模块加载时编译一次
+_REPEATED_PUNCTUATION = re.compile(r'([。！？，；：])\1+')
+_NON_WORD = re.compile(r'[^\w]')
+
+# 连续重复的字符或词组的最大长度
+_MAX_REPEATED_UNIT = 10
+
+
+def _collapse_repeats(text: str, max_unit: int = _MAX_REPEATED_UNIT) -> str:
+    """把连续重复的字符或词组合并成一个，如 "很高兴很高兴" -> "很高兴"
+
+    与 re.sub(r'(.{1,10})\1+', r'\1', text) 结果相同：每个位置优先取最长的、至少重复一次的词组，
+    词组不跨换行。每个位置最多比较max_unit种长度，耗时与文本长度成线性，没有正则回溯。
+    """
+    pieces = []
+    length = len(text)
+    i = 0
+    while i < length:
+        newline = text.find("\n", i, i + max_unit)
+        longest = min(max_unit, (newline if newline != -1 else length) - i, (length - i) // 2)
+        first = text[i]
+        # 后面longest个字符里没有当前字符时不可能从这里开始重复
+        if first not in text[i + 1:i + 1 + longest]:
+            longest = 0
+        for unit in range(longest, 0, -1):
+            if text[i + unit] == first and text.startswith(text[i:i + unit], i + unit):
+                word = text[i:i + unit]
+                end = i + 2 * unit
+                while text.startswith(word, end):
+                    end += unit
+                pieces.append(word)
+                i = end
+                break
+        else:
+            pieces.append(text[i])
+            i += 1
+    return "".join(pieces)
+
+
+def clean_snippet(snippet: str) -> str:
+    """清理摘要文本，去除重复内容"""
+    if not snippet:
+        return ""
+
+    # 去除连续重复的字符或词组
+    snippet = _collapse_repeats(snippet)
+
+    # 去除重复的标点符号
+    snippet = _REPEATED_PUNCTUATION.sub(r'\1', snippet)
+
+    # 分割成句子并去重
+    sentences = []
+    for sep in ['。', '！', '？']:
+        if sep in snippet:
+            parts = snippet.split(sep)
+            for part in parts[:-1]:  # 最后一个可能是空的
+                if part.strip():
+                    sentences.append(part.strip() + sep)
+            if parts[-1].strip():  # 处理最后一部分
+                sentences.append(parts[-1].strip())
+            break
+    else:
+        # 如果没有句号等分隔符，按逗号分割
+        sentences = [s.strip() for s in snippet.split('，') if s.strip()]
+
+    # 去除重复句子
+    unique_sentences = []
+    seen_content = set()
+
+    for sentence in sentences:
+        # 简化句子用于比较（去除标点和空格）
+        simplified = _NON_WORD.sub('', sentence)
+        if simplified and simplified not in seen_content and len(sentence) > 2:
+            seen_content.add(simplified)
+            unique_sentences.append(sentence)
+
+    # 重新组合，限制长度
+    if unique_sentences:
+        result = '，'.join(unique_sentences)
+        # 确保以合适的标点结尾
+        if not result.endswith(('。', '！', '？', '，')):
+            result += '。'
+    else:
+        result = snippet[:100] if len(snippet) > 100 else snippet
+
+    # 最终长度限制
+    if len(result) > 200:
+        result = result[:200] + "..."
+
+    return result
+
+
+def resolve_result_url(url: str) -> str:
+    """把DuckDuckGo的跳转链接还原为目标网页地址"""
+    if url.startswith("//"):
+        url = "https:" + url
+    parsed = urllib.parse.urlparse(url)
+    if parsed.netloc.endswith("duckduckgo.com") and parsed.path.startswith("/l/"):
+        target = urllib.parse.parse_qs(parsed.query).get("uddg")
+        if target:
+            return target[0]
+    return url
+
+
+class PageTextExtractor(HTMLParser):
+    """增量提取网页正文：按块feed，跳过脚本、样式等非正文标签，收集到max_chars后停止"""
+
+    SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "head", "nav", "footer"}
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._length = 0
+        self._skip_depth = 0
+
+    @property
+    def full(self) -> bool:
+        """是否已收集到足够的文本"""
+        return self._length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth or self.full:
+            return
+        text = " ".join(data.split())
+        if text:
+            self._parts.append(text)
+            self._length += len(text) + 1
+
+    def get_text(self) -> str:
+        text = " ".join(self._parts)
+        return text[:self.max_chars] + "..." if len(text) > self.max_chars else text
+
+
+class ResultParser(ABC):
+    """DuckDuckGo结果页解析器基类
+
+    parse是同步的CPU密集操作，由SearchService放到工作线程/进程中执行。
+    """
+
+    name = ""
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def parse(self, html: str, max_results: int) -> List[SearchResult]:
+        """解析结果页，返回去重后的前max_results条结果"""
+
+    def _collect(self, items, max_results: int) -> List[SearchResult]:
+        """对 (标题, 链接, 摘要) 去重、清理并截取前max_results条"""
+        results = []
+        seen_urls = set()  # 用于去重
+
+        for title, url, snippet in items:
+            if len(results) >= max_results:
+                break
+
+            # 去重检查
+            if url in seen_urls or not url or not title:
+                continue
+            seen_urls.add(url)
+
+            results.append(SearchResult(
+                title=title,
+                url=url,
+                snippet=clean_snippet(snippet)
+            ))
+
+        return results
+
+
+class BeautifulSoupParser(ResultParser):
+    """基于BeautifulSoup + html.parser的纯Python解析器"""
+
+    name = "bs4"
+
+    def parse(self, html: str, max_results: int) -> List[SearchResult]:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, 'html.parser')
+        return self._collect(self._iter_items(soup), max_results)
+
+    def _iter_items(self, soup):
+        for element in soup.find_all('div', class_='result'):
+            try:
+                # 提取标题和链接
+                title_element = element.find('a', class_='result__a')
+                if not title_element:
+                    continue
+
+                # 提取摘要
+                snippet_element = element.find('a', class_='result__snippet')
+                yield (
+                    title_element.get_text(strip=True),
+                    title_element.get('href', ''),
+                    snippet_element.get_text(strip=True) if snippet_element else ""
+                )
+            except Exception as e:
+                print(f"解析搜索结果错误: {e}")
+                continue
+
+
+class SelectolaxParser(ResultParser):
+    """基于selectolax（lexbor引擎，C实现）和CSS选择器的快速解析器"""
+
+    name = "selectolax"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            import selectolax.lexbor  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def parse(self, html: str, max_results: int) -> List[SearchResult]:
+        from selectolax.lexbor import LexborHTMLParser
+
+        tree = LexborHTMLParser(html)
+        return self._collect(self._iter_items(tree), max_results)
+
+    def _iter_items(self, tree):
+        for element in tree.css('div.result'):
+            title_element = element.css_first('a.result__a')
+            if title_element is None:
+                continue
+
+            snippet_element = element.css_first('a.result__snippet')
+            yield (
+                title_element.text(strip=True),
+                title_element.attributes.get('href') or '',
+                snippet_element.text(strip=True) if snippet_element is not None else ""
+            )
+
+
+PARSER_BACKENDS: Dict[str, Type[ResultParser]] = {
+    BeautifulSoupParser.name: BeautifulSoupParser,
+    SelectolaxParser.name: SelectolaxParser,
+}
+
+_parsers: Dict[str, ResultParser] = {}
+
+
+def resolve_backend(name: str = "auto") -> str:
+    """解析后端名称：auto时优先使用selectolax，未安装则退回BeautifulSoup"""
+    if name == "auto":
+        return SelectolaxParser.name if SelectolaxParser.is_available() else BeautifulSoupParser.name
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"未知的搜索结果解析器: {name}")
+    if not PARSER_BACKENDS[name].is_available():
+        raise ValueError(f"搜索结果解析器不可用: {name}")
+    return name
+
+
+def parse_results(backend: str, html: str, max_results: int) -> List[SearchResult]:
+    """用指定后端解析结果页；模块级函数，可以提交到进程池执行"""
+    parser = _parsers.get(backend)
+    if parser is None:
+        parser = _parsers[backend] = PARSER_BACKENDS[backend]()
+    return parser.parse(html, max_results)
@@ -1,164 +1,158 @@
+import os
+import codecs
 import httpx
 import asyncio
-from typing import List
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
 from models import SearchResult
+from search_cache import SearchCache
+from search_parsers import PageTextExtractor, parse_results, resolve_backend, resolve_result_url
+from http_client import http_client
+from metrics import search_seconds
+from service_registry import services
+from dotenv import load_dotenv
 import urllib.parse
 
+# 加载环境变量
+load_dotenv()
+
 class SearchService:
     def __init__(self):
         self.timeout = httpx.Timeout(10.0)
+        # 搜索结果页地址，可指向兼容DuckDuckGo HTML格式的其他服务（如压测用的模拟服务）
+        self.search_url = os.getenv("SEARCH_URL", "https://html.duckduckgo.com/html/")
+        self.cache = SearchCache(
+            max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "600")),
+            stale_ttl=float(os.getenv("SEARCH_CACHE_STALE_TTL", "3600")),
+            persist_path=os.getenv("SEARCH_CACHE_PATH") or None,
+        )
+
+        # 结果页解析后端（auto/selectolax/bs4）和执行解析的工作池（thread/process）
+        self.parser_backend = resolve_backend(os.getenv("SEARCH_PARSER", "auto"))
+        parser_workers = int(os.getenv("SEARCH_PARSER_WORKERS", "2"))
+        if os.getenv("SEARCH_PARSER_EXECUTOR", "thread") == "process":
+            self._parser_executor = ProcessPoolExecutor(max_workers=parser_workers)
+        else:
+            self._parser_executor = ThreadPoolExecutor(
+                max_workers=parser_workers, thread_name_prefix="search-parser"
+            )
+
+        # 网页正文补充：抓取前几个结果的页面数（0表示关闭）、总时限（秒）、每页读取的字节上限和保留的字符数
+        self.enrich_top_k = int(os.getenv("SEARCH_ENRICH_TOP_K", "3"))
+        self.enrich_deadline = float(os.getenv("SEARCH_ENRICH_DEADLINE", "2.0"))
+        self.enrich_max_bytes = int(os.getenv("SEARCH_ENRICH_MAX_BYTES", "262144"))
+        self.enrich_max_chars = int(os.getenv("SEARCH_ENRICH_MAX_CHARS", "1500"))
     
+    @search_seconds.time(stage="total")
     async def search_web(self, query: str, max_results: int = 5) -> List[SearchResult]:
-        """执行网络搜索"""
+        """执行网络搜索（优先使用缓存）"""
+        return await self.cache.get_or_fetch(
+            query, max_results, lambda: self._search_upstream(query, max_results)
+        )
+
+    @search_seconds.time(stage="upstream")
+    async def _search_upstream(self, query: str, max_results: int) -> List[SearchResult]:
+        """请求DuckDuckGo执行搜索"""
         try:
             # 使用DuckDuckGo搜索API (免费且无需API key)
-            search_url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
+            search_url = f"{self.search_url}?q={urllib.parse.quote(query)}"
             
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(search_url, headers=headers)
-                response.raise_for_status()
-                
-                return self._parse_duckduckgo_results(response.text, max_results)
+            response = await http_client.get(search_url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            
+            return await self._parse_duckduckgo_results(response.text, max_results)
         
         except Exception as e:
             print(f"搜索错误: {e}")
             return []
     
-    def _parse_duckduckgo_results(self, html: str, max_results: int) -> List[SearchResult]:
-        """解析DuckDuckGo搜索结果"""
-        soup = BeautifulSoup(html, 'html.parser')
-        results = []
-        seen_urls = set()  # 用于去重
-
-        # 查找搜索结果
-        result_elements = soup.find_all('div', class_='result')
-
-        for element in result_elements:
-            if len(results) >= max_results:
-                break
-
-            try:
-                # 提取标题和链接
-                title_element = element.find('a', class_='result__a')
-                if not title_element:
-                    continue
-
-                title = title_element.get_text(strip=True)
-                url = title_element.get('href', '')
-
-                # 去重检查
-                if url in seen_urls or not url or not title:
-                    continue
-                seen_urls.add(url)
-
-                # 提取摘要
-                snippet_element = element.find('a', class_='result__snippet')
-                snippet = snippet_element.get_text(strip=True) if snippet_element else ""
-
-                # 清理摘要文本，去除重复内容
-                snippet = self._clean_snippet(snippet)
-
-                results.append(SearchResult(
-                    title=title,
-                    url=url,
-                    snippet=snippet
-                ))
-
-            except Exception as e:
-                print(f"解析搜索结果错误: {e}")
-                continue
-
-        return results
-
-    def _clean_snippet(self, snippet: str) -> str:
-        """清理摘要文本，去除重复内容"""
-        if not snippet:
+    async def _parse_duckduckgo_results(self, html: str, max_results: int) -> List[SearchResult]:
+        """在工作线程/进程中解析DuckDuckGo搜索结果，避免阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._parser_executor, parse_results, self.parser_backend, html, max_results
+        )
+
+    async def start(self):
+        """打开共享HTTP连接池并加载持久化的搜索缓存（第一次使用时由服务注册表调用）"""
+        await services.acquire("http_client")
+        await self.cache.load()
+
+    async def close(self):
+        """保存搜索缓存并关闭解析工作池"""
+        await self.cache.close()
+        self.shutdown()
+
+    def shutdown(self):
+        """关闭解析工作池"""
+        self._parser_executor.shutdown(wait=False, cancel_futures=True)
+    
+    @search_seconds.time(stage="enrich")
+    async def enrich_results(self, results: List[SearchResult], top_k: Optional[int] = None) -> List[SearchResult]:
+        """并发抓取前top_k个结果的网页正文，超过总时限仍未完成的页面直接放弃"""
+        top_k = self.enrich_top_k if top_k is None else top_k
+        targets = results[:max(0, top_k)]
+        if not targets:
+            return results
+
+        tasks = [
+            asyncio.create_task(self.get_page_content(resolve_result_url(result.url), self.enrich_max_chars))
+            for result in targets
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.enrich_deadline)
+        finally:
+            # 超时的页面不再等待，避免最慢的页面拖慢首字延迟
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        enriched = []
+        for result, task in zip(targets, tasks):
+            content = task.result() if task in done else ""
+            # 复制一份，不修改搜索缓存中的对象
+            enriched.append(result.model_copy(update={"content": content}) if content else result)
+        return enriched + results[len(targets):]
+
+    async def get_page_content(self, url: str, max_length: int = 2000, max_bytes: Optional[int] = None) -> str:
+        """流式获取网页正文摘要，最多读取max_bytes字节，提取到足够的文本后提前结束"""
+        if not url.startswith(("http://", "https://")):
             return ""
+        max_bytes = self.enrich_max_bytes if max_bytes is None else max_bytes
 
-        # 首先去除明显的重复字符模式
-        import re
-
-        # 去除连续重复的字符或词组
-        # 匹配重复的字符或词组，如 "很高兴很高兴" -> "很高兴"
-        snippet = re.sub(r'(.{1,10})\1+', r'\1', snippet)
-
-        # 去除重复的标点符号
-        snippet = re.sub(r'([。！？，；：])\1+', r'\1', snippet)
-
-        # 分割成句子并去重
-        sentences = []
-        for sep in ['。', '！', '？']:
-            if sep in snippet:
-                parts = snippet.split(sep)
-                for i, part in enumerate(parts[:-1]):  # 最后一个可能是空的
-                    if part.strip():
-                        sentences.append(part.strip() + sep)
-                if parts[-1].strip():  # 处理最后一部分
-                    sentences.append(parts[-1].strip())
-                break
-        else:
-            # 如果没有句号等分隔符，按逗号分割
-            sentences = [s.strip() for s in snippet.split('，') if s.strip()]
-
-        # 去除重复句子
-        unique_sentences = []
-        seen_content = set()
-
-        for sentence in sentences:
-            # 简化句子用于比较（去除标点和空格）
-            simplified = re.sub(r'[^\w]', '', sentence)
-            if simplified and simplified not in seen_content and len(sentence) > 2:
-                seen_content.add(simplified)
-                unique_sentences.append(sentence)
-
-        # 重新组合，限制长度
-        if unique_sentences:
-            result = '，'.join(unique_sentences)
-            # 确保以合适的标点结尾
-            if not result.endswith(('。', '！', '？', '，')):
-                result += '。'
-        else:
-            result = snippet[:100] if len(snippet) > 100 else snippet
-
-        # 最终长度限制
-        if len(result) > 200:
-            result = result[:200] + "..."
-
-        return result
-    
-    async def get_page_content(self, url: str, max_length: int = 2000) -> str:
-        """获取网页内容摘要"""
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, headers=headers)
+
+            async with http_client.stream("GET", url, headers=headers, timeout=self.timeout) as response:
                 response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # 移除脚本和样式标签
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                
-                # 提取文本内容
-                text = soup.get_text()
-                
-                # 清理文本
-                lines = (line.strip() for line in text.splitlines())
-                chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                text = ' '.join(chunk for chunk in chunks if chunk)
-                
-                # 截断到指定长度
-                return text[:max_length] + "..." if len(text) > max_length else text
-        
+                content_type = response.headers.get("content-type", "")
+                if content_type and "html" not in content_type and not content_type.startswith("text/"):
+                    return ""
+
+                try:
+                    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+                extractor = PageTextExtractor(max_length)
+                received = 0
+                async for chunk in response.aiter_bytes():
+                    chunk = chunk[:max_bytes - received]
+                    received += len(chunk)
+                    # 逐块解析放到线程中执行，避免大页面阻塞事件循环
+                    await asyncio.to_thread(extractor.feed, decoder.decode(chunk))
+                    if extractor.full or received >= max_bytes:
+                        break
+
+            return extractor.get_text()
+
         except Exception as e:
             print(f"获取网页内容错误: {e}")
             return ""
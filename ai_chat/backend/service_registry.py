@@ -0,0 +1,167 @@
+import asyncio
+import importlib
+import inspect
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class _ServiceEntry:
+    def __init__(self, name: str, target: str, call: bool, start: Optional[str], warm_up: Optional[str], close: Optional[str]):
+        self.name = name
+        self.target = target
+        self.call = call
+        self.start = start
+        self.warm_up = warm_up
+        self.close = close
+        self.instance: Any = None
+        self.loaded = False
+        self.started = False
+        self.load_ms: Optional[float] = None
+        self.start_ms: Optional[float] = None
+        self.warm_up_ms: Optional[float] = None
+        self.load_lock = asyncio.Lock()
+        self.start_lock = asyncio.Lock()
+
+
+class ServiceRegistry:
+    """延迟加载的服务注册表
+
+    服务以"模块:属性"注册，第一次使用时才导入所在模块（连同autogen、openai、httpx等重量级依赖）
+    并取得实例，call=True时调用该属性构造实例；acquire在工作线程中导入和构造，不阻塞事件循环。
+    start、warm_up、close为实例上的方法名（同步或异步），acquire时执行一次start，
+    warm_up用于启动时提前建立连接，close按start的相反顺序关闭已启动的服务。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _ServiceEntry] = {}
+        self._started: List[_ServiceEntry] = []
+
+    def register(
+        self,
+        name: str,
+        target: str,
+        call: bool = False,
+        start: Optional[str] = None,
+        warm_up: Optional[str] = None,
+        close: Optional[str] = None,
+    ):
+        self._entries[name] = _ServiceEntry(name, target, call, start, warm_up, close)
+
+    def get(self, name: str) -> Any:
+        """取得服务实例，第一次调用时在当前线程导入模块并构造；只用于同步代码（命令行工具等），异步代码使用acquire"""
+        entry = self._entries[name]
+        if not entry.loaded:
+            started = time.perf_counter()
+            self._set_instance(entry, _load(entry), started)
+        return entry.instance
+
+    async def acquire(self, name: str) -> Any:
+        """取得服务实例并确保已执行start（只执行一次）；第一次使用时在工作线程中导入和构造"""
+        entry = self._entries[name]
+        if not entry.loaded:
+            async with entry.load_lock:
+                if not entry.loaded:
+                    started = time.perf_counter()
+                    self._set_instance(entry, await asyncio.to_thread(_load, entry), started)
+        instance = entry.instance
+        if entry.started or entry.start is None:
+            return instance
+        async with entry.start_lock:
+            if not entry.started:
+                started = time.perf_counter()
+                await _call(instance, entry.start)
+                entry.started = True
+                entry.start_ms = _elapsed_ms(started)
+                self._started.append(entry)
+        return instance
+
+    def _set_instance(self, entry: _ServiceEntry, instance: Any, started: float):
+        entry.instance = instance
+        entry.loaded = True
+        entry.load_ms = _elapsed_ms(started)
+
+    def loaded(self, name: str) -> bool:
+        return self._entries[name].loaded
+
+    def peek(self, name: str) -> Any:
+        """取得已加载的服务实例，未加载时返回None，不触发导入（用于统计接口）"""
+        entry = self._entries[name]
+        return entry.instance if entry.loaded else None
+
+    async def warm_up(self, names: Iterable[str]):
+        """依次加载并预热服务，单个服务失败只打印错误，不影响其他服务和请求处理"""
+        for name in names:
+            if name not in self._entries:
+                print(f"未知的预热服务: {name}")
+                continue
+            entry = self._entries[name]
+            started = time.perf_counter()
+            try:
+                instance = await self.acquire(name)
+                if entry.warm_up is not None:
+                    await _call(instance, entry.warm_up)
+                entry.warm_up_ms = _elapsed_ms(started)
+            except Exception as e:
+                print(f"服务 {name} 预热错误: {e}")
+
+    async def close(self):
+        """按启动的相反顺序关闭服务；只加载未启动的服务若注册了close也会关闭"""
+        pending = list(reversed(self._started))
+        pending += [
+            entry for entry in self._entries.values()
+            if entry.loaded and entry.start is None and entry.close is not None
+        ]
+        self._started = []
+        for entry in pending:
+            entry.started = False
+            if entry.close is None:
+                continue
+            try:
+                await _call(entry.instance, entry.close)
+            except Exception as e:
+                print(f"关闭服务 {entry.name} 错误: {e}")
+
+    def stats(self) -> Dict[str, dict]:
+        """各服务是否已加载、已启动，以及加载、启动和预热的耗时"""
+        return {
+            name: {
+                "loaded": entry.loaded,
+                "started": entry.started,
+                "load_ms": entry.load_ms,
+                "start_ms": entry.start_ms,
+                "warm_up_ms": entry.warm_up_ms,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+async def import_modules(*names: str):
+    """在工作线程中导入尚未导入的模块，之后函数内的同名import只是查表，不阻塞事件循环"""
+    missing = [name for name in names if name not in sys.modules]
+    if missing:
+        await asyncio.to_thread(lambda: [importlib.import_module(name) for name in missing])
+
+
+def _load(entry: _ServiceEntry) -> Any:
+    """导入服务所在的模块并取得（或构造）实例"""
+    module_name, attr = entry.target.split(":")
+    instance = getattr(importlib.import_module(module_name), attr)
+    return instance() if entry.call else instance
+
+
+async def _call(instance: Any, method: str):
+    result = getattr(instance, method)()
+    if inspect.isawaitable(result):
+        await result
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+# 全局服务注册表实例
+services = ServiceRegistry()
+services.register("model_client", "llms:create_model_client", call=True, warm_up="warm_up", close="close")
+services.register("http_client", "http_client:http_client", start="open", close="close")
+services.register("search_service", "search_service:search_service", start="start", close="close")
+services.register("database", "database:db", warm_up="warm_up")
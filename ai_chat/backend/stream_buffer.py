@@ -0,0 +1,199 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterable, Callable, List, Optional
+from dotenv import load_dotenv
+from models import StreamChunk
+from metrics import detached_streams
+
+# 加载环境变量
+load_dotenv()
+
+
+class BufferedStream:
+    """一次流式对话的数据块缓冲
+
+    后台任务读取chat_stream并给每个块分配递增的序号，订阅者（SSE连接）从任意序号之后开始读取：
+    先重放缓冲中的块，再继续接收新块。缓冲最多保留max_chunks个块，更早的块被丢弃。
+    """
+
+    def __init__(self, max_chunks: int, on_detach: Callable[["BufferedStream"], None]):
+        self.stream_id: Optional[str] = None
+        self.conversation_id: Optional[str] = None
+        self.max_chunks = max_chunks
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self._on_detach = on_detach
+        self._chunks: List[StreamChunk] = []
+        self._first_seq = 1  # _chunks[0]的序号
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._grace_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._first_seq + len(self._chunks) - 1
+
+    def covers(self, after_seq: int) -> bool:
+        """序号after_seq之后的块是否都还在缓冲中"""
+        return after_seq + 1 >= self._first_seq
+
+    def append(self, chunk: StreamChunk):
+        chunk.seq = self.last_seq + 1
+        self._chunks.append(chunk)
+        overflow = len(self._chunks) - self.max_chunks
+        # 超出上限一定数量后再批量丢弃，避免每个块都移动整个列表
+        if overflow > self.max_chunks // 4:
+            del self._chunks[:overflow]
+            self._first_seq += overflow
+        self._notify()
+
+    def finish(self):
+        self.finished = True
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncGenerator[StreamChunk, None]:
+        """读取序号after_seq之后的块，直到流结束"""
+        self.subscribers += 1
+        self._cancel_grace_timer()
+        seq = after_seq
+        try:
+            while True:
+                changed = self._changed
+                if seq + 1 < self._first_seq:
+                    # 读取太慢，未读的块已被丢弃
+                    yield StreamChunk(type="error", error="数据块已被丢弃，请重新加载对话", conversation_id=self.conversation_id)
+                    break
+                start = seq + 1 - self._first_seq
+                for chunk in self._chunks[start:]:
+                    seq = chunk.seq
+                    yield chunk
+                if self.finished and seq >= self.last_seq:
+                    break
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            self._on_detach(self)
+
+    def _cancel_grace_timer(self):
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+
+class StreamBuffer:
+    """进行中和最近结束的流式对话缓冲，支持断线后按Last-Event-ID续传
+
+    生成在后台任务中进行，与SSE连接解耦：客户端断开后生成继续grace_period秒，
+    期间重连可以从断点继续接收，超时无人订阅才取消生成。结束的流保留retention秒，
+    最多保留max_streams个流，超出时先淘汰最早结束的流。缓冲只在本进程内，多进程部署时续传依赖粘性路由。
+    """
+
+    def __init__(
+        self,
+        max_streams: int = 256,
+        max_chunks: int = 4096,
+        grace_period: float = 30.0,
+        retention: float = 120.0,
+    ):
+        self.max_streams = max(1, max_streams)
+        self.max_chunks = max(16, max_chunks)
+        self.grace_period = max(0.0, grace_period)
+        self.retention = retention
+        self._streams: "OrderedDict[str, BufferedStream]" = OrderedDict()
+        self._running: set = set()
+
+    def start(self, chunks: AsyncIterable[StreamChunk]) -> BufferedStream:
+        """在后台任务中运行chat_stream，返回可订阅的缓冲"""
+        buffer = BufferedStream(self.max_chunks, self._on_detach)
+        buffer._task = asyncio.create_task(self._produce(buffer, chunks))
+        self._running.add(buffer)
+        if self.grace_period > 0:
+            # 连接在开始读取前就断开时同样在宽限期后取消
+            buffer._grace_timer = asyncio.get_running_loop().call_later(self.grace_period, buffer._task.cancel)
+        return buffer
+
+    def get(self, stream_id: str) -> Optional[BufferedStream]:
+        """按流ID查找缓冲（已过期或被淘汰时返回None）"""
+        self._evict_expired()
+        return self._streams.get(stream_id)
+
+    async def close(self):
+        """取消所有仍在生成的流"""
+        tasks = [buffer._task for buffer in self._running if buffer._task is not None]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._streams.clear()
+
+    def stats(self) -> dict:
+        return {
+            "streams": len(self._streams),
+            "running": len(self._running),
+            "detached": sum(1 for buffer in self._running if buffer.subscribers == 0),
+        }
+
+    async def _produce(self, buffer: BufferedStream, chunks: AsyncIterable[StreamChunk]):
+        try:
+            async for chunk in chunks:
+                if chunk.type == "start" and chunk.stream_id:
+                    buffer.stream_id = chunk.stream_id
+                    buffer.conversation_id = chunk.conversation_id
+                    self._register(buffer)
+                buffer.append(chunk)
+        except asyncio.CancelledError:
+            # 宽限期内无人重连或服务关闭，之后重连的客户端会收到该错误块
+            buffer.append(StreamChunk(type="error", error="生成已停止", conversation_id=buffer.conversation_id))
+        except Exception as e:
+            print(f"流式对话缓冲错误: {e}")
+            buffer.append(StreamChunk(type="error", error=str(e)))
+        finally:
+            buffer._cancel_grace_timer()
+            buffer.finish()
+            self._running.discard(buffer)
+
+    def _register(self, buffer: BufferedStream):
+        self._evict_expired()
+        self._streams[buffer.stream_id] = buffer
+        while len(self._streams) > self.max_streams:
+            # 优先淘汰最早结束的流，都在进行中时淘汰最早开始的（只影响续传，不影响生成）
+            victim = next((sid for sid, b in self._streams.items() if b.finished), None)
+            if victim is None:
+                victim = next(iter(self._streams))
+            del self._streams[victim]
+
+    def _evict_expired(self):
+        threshold = time.time() - self.retention
+        expired = [
+            sid for sid, b in self._streams.items()
+            if b.finished and b.finished_at < threshold
+        ]
+        for sid in expired:
+            del self._streams[sid]
+
+    def _on_detach(self, buffer: BufferedStream):
+        """最后一个订阅者断开后，生成继续grace_period秒，期间无人重连则取消"""
+        if buffer.subscribers > 0 or buffer.finished or buffer._task is None:
+            return
+        if self.grace_period == 0 or buffer.stream_id is None:
+            buffer._task.cancel()
+            return
+        buffer._cancel_grace_timer()
+        buffer._grace_timer = asyncio.get_running_loop().call_later(self.grace_period, buffer._task.cancel)
+
+# 全局流式对话缓冲实例
+stream_buffer = StreamBuffer(
+    max_streams=int(os.getenv("STREAM_BUFFER_STREAMS", "256")),
+    max_chunks=int(os.getenv("STREAM_BUFFER_CHUNKS", "4096")),
+    grace_period=float(os.getenv("STREAM_RESUME_GRACE", "30")),
+    retention=float(os.getenv("STREAM_BUFFER_RETENTION", "120")),
+)
+detached_streams.set_function(lambda: stream_buffer.stats()["detached"])
@@ -0,0 +1,172 @@
+import re
+from typing import List
+
+# 中文标点：连续重复时只保留一个
+_CJK_PUNCTUATION = frozenset("。！？，；：、")
+
+# 英文单词重复单元："the the" 中的 "the "
+_WORD_UNIT = re.compile(r'[^A-Za-z]([A-Za-z]{1,24} )$')
+
+# 整行重复检测要求该行至少包含一个文字或数字
+_LINE_CONTENT = re.compile(r'[^\W_]')
+
+# 中文短语重复单元的最大长度
+MAX_PHRASE_LENGTH = 16
+# 参与整行重复检测的行长度范围
+MIN_LINE_LENGTH = 8
+MAX_LINE_LENGTH = 200
+# 回看窗口：只需覆盖最长的短语单元和单词单元
+_TAIL_SIZE = 32
+
+
+def _is_ideograph(char: str) -> bool:
+    return '\u4e00' <= char <= '\u9fff' or '\u3400' <= char <= '\u4dbf'
+
+
+class StreamCleaner:
+    """流式回复的增量去重器，每个流一个实例
+
+    逐字符单遍处理：若新到的文本正好重复了已输出文本末尾的某个单元，就丢弃这段重复；
+    若新文本可能是重复的开头，先暂存，等确定后再输出或丢弃。处理的重复包括：
+    - 同一个汉字或换行连续超过两次，中文标点连续出现
+    - 连续重复的中文短语（如 "很高兴很高兴"）和英文单词（如 "the the"）
+    - 与上一行完全相同的整行
+    代码块、行内代码、数字和ASCII标点不做处理。暂存的文本不超过一个重复单元的长度，
+    feed返回值依次拼接再加上finish()的返回值就是最终保存的内容，与流式输出完全一致。
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._tail = " "  # 已输出文本的末尾，以空格开头方便匹配第一个单词
+        self._line = ""  # 当前行已输出的内容
+        self._prev_line = ""  # 可用于整行重复检测的上一行（含换行符）
+        self._line_overflow = False
+        self._cjk_run = 0  # 末尾连续的中文字符和标点数
+        self._in_code_block = False
+        self._in_inline_code = False
+        self._units = None  # 当前末尾可能被重复的单元，输出新字符后失效
+        self._unit_starts = None  # 这些单元的首字符，用于快速排除
+
+        self.dropped_chars = 0
+
+    def feed(self, chunk: str) -> str:
+        """输入一个流式片段，返回可以立即发送的文本"""
+        output: List[str] = []
+        for char in chunk:
+            self._pending += char
+            self._resolve(output)
+        return "".join(output)
+
+    def finish(self) -> str:
+        """流结束时输出暂存的文本（未构成完整重复，原样保留）"""
+        pending, self._pending = self._pending, ""
+        output: List[str] = []
+        for char in pending:
+            self._emit(char, output)
+        return "".join(output)
+
+    def _resolve(self, output: List[str]):
+        while self._pending:
+            if len(self._pending) == 1 and self._pending not in self._repeat_starts():
+                # 快速路径：新字符不可能是任何重复单元的开头
+                self._emit(self._pending, output)
+                self._pending = ""
+                return
+            units = self._repeat_units()
+            if self._pending in units:
+                # 完整重复了末尾的单元，丢弃
+                self.dropped_chars += len(self._pending)
+                self._pending = ""
+                return
+            if any(unit.startswith(self._pending) for unit in units):
+                # 可能是重复的开头，继续暂存
+                return
+            self._emit(self._pending[0], output)
+            self._pending = self._pending[1:]
+
+    def _emit(self, char: str, output: List[str]):
+        output.append(char)
+        self._tail = (self._tail + char)[-_TAIL_SIZE:]
+        self._units = None
+        self._unit_starts = None
+
+        if _is_ideograph(char) or char in _CJK_PUNCTUATION:
+            self._cjk_run += 1
+        else:
+            self._cjk_run = 0
+
+        if char == "\n":
+            usable = not (self._in_code_block or self._line_overflow)
+            self._prev_line = self._line + "\n" if usable else ""
+            self._line = ""
+            self._line_overflow = False
+            self._in_inline_code = False
+            return
+
+        if len(self._line) < MAX_LINE_LENGTH:
+            self._line += char
+        else:
+            self._line_overflow = True
+
+        if char == "`":
+            if self._line.lstrip() == "```":
+                self._in_code_block = not self._in_code_block
+                self._in_inline_code = False
+            elif not self._in_code_block:
+                self._in_inline_code = not self._in_inline_code
+
+    def _repeat_starts(self) -> str:
+        """可能被重复的单元的首字符，不必构造出所有单元"""
+        if self._unit_starts is not None:
+            return self._unit_starts
+
+        starts = ""
+        if not (self._in_code_block or self._in_inline_code):
+            tail = self._tail
+            last = tail[-1]
+            if last in _CJK_PUNCTUATION or tail[-2:] == last * 2:
+                starts += last
+            if not self._line and self._prev_line:
+                starts += self._prev_line[0]
+            if self._cjk_run >= 2:
+                starts += tail[-min(self._cjk_run, MAX_PHRASE_LENGTH):-1]
+            if last == " ":
+                starts += "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+        self._unit_starts = starts
+        return starts
+
+    def _repeat_units(self) -> List[str]:
+        """已输出文本末尾可能被模型重复输出的单元"""
+        if self._units is not None:
+            return self._units
+
+        units = []
+        if not (self._in_code_block or self._in_inline_code):
+            tail = self._tail
+            last = tail[-1]
+
+            # 单个字符
+            if last in _CJK_PUNCTUATION:
+                units.append(last)
+            elif tail[-2:] == last * 2 and (last == "\n" or _is_ideograph(last)):
+                units.append(last)
+
+            # 整行
+            if not self._line and MIN_LINE_LENGTH <= len(self._prev_line) and _LINE_CONTENT.search(self._prev_line):
+                units.append(self._prev_line)
+
+            # 中文短语
+            for length in range(2, min(self._cjk_run, MAX_PHRASE_LENGTH) + 1):
+                unit = tail[-length:]
+                if _is_ideograph(unit[0]):
+                    units.append(unit)
+
+            # 英文单词
+            if last == " ":
+                match = _WORD_UNIT.search(tail)
+                if match:
+                    units.append(match.group(1))
+
+        self._units = units
+        return units
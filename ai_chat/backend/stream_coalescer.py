@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import AsyncGenerator, AsyncIterable, Deque, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from models import StreamChunk
+
+# 加载环境变量
+load_dotenv()
+
+# 每个块单独序列化的字段，模板在这两个字段的值处断开
+_VARIABLE_FIELDS = ("content", "seq")
+
+
+class ContentFrameEncoder:
+    """content类型数据块的快速序列化
+
+    同一个对话的content块只有内容和序号不同，按对话预先生成JSON模板，
+    每个块只需对内容做一次json.dumps，输出与StreamChunk.model_dump_json()逐字节一致。
+    """
+
+    def __init__(self):
+        self._templates: Dict[Optional[str], Tuple[str, str, str]] = {}
+
+    def encode(self, content: str, conversation_id: Optional[str], seq: Optional[int] = None) -> str:
+        template = self._templates.get(conversation_id)
+        if template is None:
+            template = self._templates[conversation_id] = self._build_template(conversation_id)
+        prefix, middle, suffix = template
+        return prefix + json.dumps(content, ensure_ascii=False) + middle + json.dumps(seq) + suffix
+
+    def _build_template(self, conversation_id: Optional[str]) -> Tuple[str, str, str]:
+        """按字段顺序拼接其余字段，在content和seq的值处断开
+
+        conversation_id来自客户端，不能在序列化结果中查找占位符来定位字段。
+        """
+        fields = StreamChunk(type="content", conversation_id=conversation_id).model_dump(mode="json")
+        parts = []
+        text = "{"
+        for index, (name, value) in enumerate(fields.items()):
+            if index:
+                text += ","
+            text += json.dumps(name) + ":"
+            if name in _VARIABLE_FIELDS:
+                parts.append(text)
+                text = ""
+            else:
+                text += json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        parts.append(text + "}")
+        prefix, middle, suffix = parts
+        return prefix, middle, suffix
+
+
+class StreamCoalescer:
+    """合并流式content块后再发送SSE事件
+
+    第一个content块立即发送以保证首字延迟，之后的content块在时间窗口内累积，
+    窗口到期或累积内容超过字节阈值时合并成一个事件发送；其他类型的块发送前先刷出已累积的内容。
+    合并后的事件使用其中最后一个块的序号作为SSE事件ID。
+    """
+
+    def __init__(self, window_ms: float = 30, max_bytes: int = 512):
+        self.window = max(0.0, window_ms) / 1000
+        self.max_bytes = max_bytes
+
+    async def stream(self, chunks: AsyncIterable[StreamChunk]) -> AsyncGenerator[dict, None]:
+        """把StreamChunk流转换为合并后的SSE事件（data为JSON字符串，id为序号）"""
+        loop = asyncio.get_running_loop()
+        encoder = ContentFrameEncoder()
+        frames: Deque[dict] = deque()  # 已可以发送的事件
+        ready = asyncio.Event()
+
+        buffer: List[str] = []
+        buffered_bytes = 0
+        conversation_id = None
+        last_seq: Optional[int] = None
+        timer: Optional[asyncio.TimerHandle] = None
+        first_content = True
+
+        def flush():
+            nonlocal buffered_bytes, timer
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if buffer:
+                frames.append(_event(encoder.encode("".join(buffer), conversation_id, last_seq), last_seq))
+                buffer.clear()
+                buffered_bytes = 0
+            ready.set()
+
+        async def pump():
+            # 单独的任务读取上游，每个块只做追加，由计时器或阈值触发合并
+            nonlocal buffered_bytes, conversation_id, last_seq, timer, first_content
+            try:
+                async for chunk in chunks:
+                    if chunk.type != "content":
+                        flush()
+                        frames.append(_event(chunk.model_dump_json(), chunk.seq))
+                        continue
+                    if not chunk.content:
+                        continue
+
+                    if buffer and chunk.conversation_id != conversation_id:
+                        flush()
+                    conversation_id = chunk.conversation_id
+                    last_seq = chunk.seq
+                    buffer.append(chunk.content)
+                    buffered_bytes += len(chunk.content.encode("utf-8"))
+
+                    if first_content or buffered_bytes >= self.max_bytes or self.window == 0:
+                        first_content = False
+                        flush()
+                    elif timer is None:
+                        timer = loop.call_later(self.window, flush)
+            finally:
+                flush()
+
+        task = asyncio.create_task(pump())
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                while frames:
+                    yield frames.popleft()
+                if task.done():
+                    task.result()  # 上游出错时抛出异常
+                    break
+        finally:
+            # 客户端断开时停止读取上游
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+def _event(data: str, seq: Optional[int]) -> dict:
+    # EventSourceResponse会自动添加"data: "前缀；带序号时同时输出"id: "行，浏览器重连时作为Last-Event-ID发回
+    if seq is None:
+        return {"data": data}
+    return {"data": data, "id": str(seq)}
+
+# 全局SSE合并器实例
+stream_coalescer = StreamCoalescer(
+    window_ms=float(os.getenv("SSE_COALESCE_MS", "30")),
+    max_bytes=int(os.getenv("SSE_COALESCE_BYTES", "512")),
+)
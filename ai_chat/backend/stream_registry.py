@@ -0,0 +1,274 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Optional, Set
+from dotenv import load_dotenv
+from db_pool import SQLitePool
+from models import StreamStatus
+
+if TYPE_CHECKING:
+    from autogen_core import CancellationToken
+
+# 加载环境变量
+load_dotenv()
+
+
+class _LocalStream:
+    __slots__ = ("token", "conversation_id", "started_at")
+
+    def __init__(self, token: "CancellationToken", conversation_id: Optional[str]):
+        self.token = token
+        self.conversation_id = conversation_id
+        self.started_at = time.time()
+
+
+class StreamRegistry:
+    """流式对话注册表：记录本进程正在进行的流及其取消令牌
+
+    中断请求落在流所在的进程时直接取消令牌；子类负责把流信息共享给其他进程。
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._local: Dict[str, _LocalStream] = {}
+
+    @property
+    def local_count(self) -> int:
+        """本进程正在进行的流数量"""
+        return len(self._local)
+
+    async def open(self):
+        """启动注册表（内存实现无需准备）"""
+
+    async def close(self):
+        """关闭注册表"""
+        self._local.clear()
+
+    async def register(self, stream_id: str, token: "CancellationToken", conversation_id: Optional[str] = None):
+        """登记本进程的流"""
+        self._local[stream_id] = _LocalStream(token, conversation_id)
+
+    def unregister(self, stream_id: str):
+        """流结束时注销（不等待，可在finally中调用）"""
+        self._local.pop(stream_id, None)
+
+    async def cancel(self, stream_id: str) -> bool:
+        """请求中断流，返回是否找到该流"""
+        entry = self._local.get(stream_id)
+        if entry is None:
+            return False
+        entry.token.cancel()
+        return True
+
+    async def status(self, stream_id: str) -> Optional[StreamStatus]:
+        """查询流的状态"""
+        entry = self._local.get(stream_id)
+        if entry is None:
+            return None
+        now = time.time()
+        return StreamStatus(
+            stream_id=stream_id,
+            conversation_id=entry.conversation_id,
+            worker_id=self.worker_id,
+            started_at=datetime.fromtimestamp(entry.started_at),
+            heartbeat_at=datetime.fromtimestamp(now),
+            cancel_requested=entry.token.is_cancelled(),
+        )
+
+
+class SQLiteStreamRegistry(StreamRegistry):
+    """基于共享SQLite文件的注册表，同一主机上的多个工作进程通过它互相转发中断请求
+
+    每个进程登记自己的流，后台任务定期刷新心跳，并轮询是否有其他进程写入的中断请求；
+    心跳超时的记录（进程已退出）会被清理，不再接受中断。
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        db_path: str = "stream_registry.db",
+        poll_interval_ms: float = 200,
+        heartbeat_interval: float = 2.0,
+        stale_after: float = 10.0,
+    ):
+        super().__init__()
+        self.db_path = db_path
+        self.poll_interval = max(0.01, poll_interval_ms / 1000)
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.pool = SQLitePool(db_path, reader_count=1)
+        self._loop_task: Optional[asyncio.Task] = None
+        self._pending_writes: Set[asyncio.Task] = set()
+
+    async def open(self):
+        """创建表并启动心跳和中断轮询任务"""
+        await self.pool.open()
+
+        async def op(db):
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS streams (
+                    stream_id TEXT PRIMARY KEY,
+                    worker_id TEXT NOT NULL,
+                    conversation_id TEXT,
+                    started_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_streams_worker ON streams (worker_id)")
+
+        await self.pool.write(op)
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        """停止后台任务，删除本进程的记录并关闭连接"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+        async def op(db):
+            await db.execute("DELETE FROM streams WHERE worker_id = ?", (self.worker_id,))
+
+        try:
+            await self.pool.write(op)
+        except Exception as e:
+            print(f"清理流注册表错误: {e}")
+        await self.pool.close()
+        await super().close()
+
+    async def register(self, stream_id: str, token: "CancellationToken", conversation_id: Optional[str] = None):
+        await super().register(stream_id, token, conversation_id)
+        now = time.time()
+
+        async def op(db):
+            await db.execute(
+                "INSERT OR REPLACE INTO streams (stream_id, worker_id, conversation_id, started_at, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stream_id, self.worker_id, conversation_id, now, now)
+            )
+
+        await self.pool.write(op)
+
+    def unregister(self, stream_id: str):
+        if stream_id not in self._local:
+            return
+        super().unregister(stream_id)
+
+        async def op(db):
+            await db.execute("DELETE FROM streams WHERE stream_id = ?", (stream_id,))
+
+        # 后台删除，流的结束不等待共享表的提交
+        task = asyncio.ensure_future(self._write_quietly(op))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def cancel(self, stream_id: str) -> bool:
+        if await super().cancel(stream_id):
+            return True
+
+        # 流在其他进程：写入中断请求，由所属进程轮询到后取消
+        threshold = time.time() - self.stale_after
+
+        async def op(db):
+            cursor = await db.execute(
+                "UPDATE streams SET cancel_requested = 1 WHERE stream_id = ? AND heartbeat_at >= ?",
+                (stream_id, threshold)
+            )
+            return cursor.rowcount > 0
+
+        return await self.pool.write(op)
+
+    async def status(self, stream_id: str) -> Optional[StreamStatus]:
+        local_status = await super().status(stream_id)
+        if local_status is not None:
+            return local_status
+
+        async with self.pool.reader() as db:
+            async with db.execute(
+                "SELECT worker_id, conversation_id, started_at, heartbeat_at, cancel_requested "
+                "FROM streams WHERE stream_id = ? AND heartbeat_at >= ?",
+                (stream_id, time.time() - self.stale_after)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        if not row:
+            return None
+        return StreamStatus(
+            stream_id=stream_id,
+            conversation_id=row[1],
+            worker_id=row[0],
+            started_at=datetime.fromtimestamp(row[2]),
+            heartbeat_at=datetime.fromtimestamp(row[3]),
+            cancel_requested=bool(row[4]),
+        )
+
+    async def _write_quietly(self, op):
+        try:
+            await self.pool.write(op)
+        except Exception as e:
+            print(f"更新流注册表错误: {e}")
+
+    async def _maintain(self):
+        """后台任务：轮询其他进程发来的中断请求，定期刷新心跳并清理已退出进程的记录"""
+        last_heartbeat = 0.0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if self._local:
+                    await self._apply_cancel_requests()
+
+                now = time.time()
+                if now - last_heartbeat >= self.heartbeat_interval:
+                    last_heartbeat = now
+                    await self._heartbeat(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"流注册表维护错误: {e}")
+
+    async def _apply_cancel_requests(self):
+        async with self.pool.reader() as db:
+            async with db.execute(
+                "SELECT stream_id FROM streams WHERE worker_id = ? AND cancel_requested = 1",
+                (self.worker_id,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+        for (stream_id,) in rows:
+            entry = self._local.get(stream_id)
+            if entry is not None and not entry.token.is_cancelled():
+                entry.token.cancel()
+
+    async def _heartbeat(self, now: float):
+        async def op(db):
+            await db.execute("UPDATE streams SET heartbeat_at = ? WHERE worker_id = ?", (now, self.worker_id))
+            await db.execute("DELETE FROM streams WHERE heartbeat_at < ?", (now - self.stale_after,))
+
+        await self.pool.write(op)
+
+
+def create_stream_registry(backend: str = "memory") -> StreamRegistry:
+    """按名称创建注册表：memory（单进程）或 sqlite（同一主机上的多个工作进程）"""
+    if backend == "memory":
+        return StreamRegistry()
+    if backend == "sqlite":
+        return SQLiteStreamRegistry(
+            db_path=os.getenv("STREAM_REGISTRY_PATH", "stream_registry.db"),
+            poll_interval_ms=float(os.getenv("STREAM_REGISTRY_POLL_MS", "200")),
+            heartbeat_interval=float(os.getenv("STREAM_REGISTRY_HEARTBEAT", "2.0")),
+            stale_after=float(os.getenv("STREAM_REGISTRY_STALE_AFTER", "10.0")),
+        )
+    raise ValueError(f"未知的流注册表类型: {backend}")
+
+# 全局流注册表实例，多工作进程部署时设置 STREAM_REGISTRY=sqlite
+stream_registry = create_stream_registry(os.getenv("STREAM_REGISTRY", "memory"))
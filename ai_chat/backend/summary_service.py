@@ -0,0 +1,131 @@
+import asyncio
+import os
+from typing import Dict, List, Optional
+from models import ChatMessage, MessageRole, RollingSummary
+from database import db
+from llms import get_model_client
+from token_counter import count_tokens
+
+SUMMARY_SYSTEM_MESSAGE = """你负责维护一段对话的滚动摘要。
+给定已有摘要和之后新增的对话内容，输出一份更新后的完整摘要：
+保留用户的身份信息、偏好、目标、已确认的结论和尚未解决的问题，省略寒暄和重复内容。
+只输出摘要正文，使用与对话相同的语言，不超过500字。"""
+
+
+class SummaryService:
+    """长对话的增量滚动摘要
+
+    超出上下文窗口的旧消息被合并进每个对话的一段摘要中，摘要在后台按批更新，
+    构建上下文时摘要放在历史消息之前，使提示词长度不随对话长度增长。
+    """
+
+    def __init__(self):
+        # 未摘要的消息达到该数量时触发更新，设为0关闭滚动摘要
+        self.trigger_messages = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "12"))
+        # 最新的若干条消息保留原文，不并入摘要
+        self.keep_recent = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+        # 单次更新最多合并的消息数和token数
+        self.max_batch_messages = int(os.getenv("SUMMARY_MAX_BATCH", "40"))
+        self.max_batch_tokens = int(os.getenv("SUMMARY_MAX_BATCH_TOKENS", "6000"))
+
+        self._tasks: Dict[str, asyncio.Task] = {}  # 每个对话同时最多一个更新任务
+
+    @property
+    def enabled(self) -> bool:
+        return self.trigger_messages > 0
+
+    def schedule_refresh(self, conversation_id: str):
+        """在后台检查并更新对话摘要，不阻塞当前请求"""
+        if not self.enabled or conversation_id in self._tasks:
+            return
+
+        task = asyncio.create_task(self._refresh(conversation_id))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def shutdown(self):
+        """取消尚未完成的摘要任务"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _refresh(self, conversation_id: str):
+        """把足够多的新消息合并进摘要，直到剩余的未摘要消息低于触发阈值"""
+        try:
+            while await self._refresh_once(conversation_id):
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"更新对话摘要错误: {e}")
+
+    async def _refresh_once(self, conversation_id: str) -> bool:
+        """执行一次摘要更新，返回是否更新了摘要"""
+        summary = await db.get_summary(conversation_id)
+        covered_until = summary.covered_until if summary else None
+
+        page = await db.get_conversation_messages(
+            conversation_id, limit=self.max_batch_messages, after=covered_until
+        )
+        if len(page.items) < self.trigger_messages:
+            return False
+
+        # 没有更多消息时，最新的几条保留原文
+        batch_size = len(page.items) if page.has_more else len(page.items) - self.keep_recent
+        batch = self._fit_batch(page.items[:batch_size])
+        if not batch:
+            return False
+
+        content = await self._summarize(summary.content if summary else "", batch)
+        if not content:
+            return False
+
+        # 重新按数量读取一次，获得本批最后一条消息的游标
+        batch_page = await db.get_conversation_messages(
+            conversation_id, limit=len(batch), after=covered_until
+        )
+        await db.save_summary(RollingSummary(
+            conversation_id=conversation_id,
+            content=content,
+            covered_until=batch_page.after_cursor,
+            token_count=count_tokens(content)
+        ))
+        return True
+
+    def _fit_batch(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        """按token上限截取一批消息，至少保留一条"""
+        batch = []
+        used_tokens = 0
+        for message in messages:
+            tokens = count_tokens(message.content)
+            if batch and used_tokens + tokens > self.max_batch_tokens:
+                break
+            batch.append(message)
+            used_tokens += tokens
+        return batch
+
+    async def _summarize(self, previous_summary: str, messages: List[ChatMessage]) -> Optional[str]:
+        """调用模型生成更新后的摘要"""
+        lines = []
+        if previous_summary:
+            lines.append(f"已有摘要：\n{previous_summary}\n")
+        lines.append("新增对话：")
+        for message in messages:
+            speaker = "用户" if message.role == MessageRole.USER else "助手"
+            lines.append(f"{speaker}: {message.content}")
+
+        # 模型客户端在工作线程中加载时已导入autogen_core
+        model_client = await get_model_client()
+        from autogen_core.models import SystemMessage, UserMessage
+
+        result = await model_client.create([
+            SystemMessage(content=SUMMARY_SYSTEM_MESSAGE),
+            UserMessage(content="\n".join(lines), source="user"),
+        ])
+        if not isinstance(result.content, str):
+            return None
+        return result.content.strip()
+
+# 全局摘要服务实例
+summary_service = SummaryService()
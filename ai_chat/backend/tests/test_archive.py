@@ -0,0 +1,83 @@
+"""冷对话归档与还原的测试
+
+运行（在 ai_chat/backend 目录下）:
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from database import ChatDatabase
+from models import ChatMessage, MessageRole
+
+
+class ArchiveTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ChatDatabase(os.path.join(self.tmp.name, "chat.db"), reader_count=1)
+        await self.db.open()
+        await self.db.init_db()
+
+        self.conversation_id = await self.db.create_conversation()
+        start = datetime.now() - timedelta(days=30)
+        for index in range(6):
+            await self.db.save_message(ChatMessage(
+                conversation_id=self.conversation_id,
+                role=MessageRole.USER if index % 2 == 0 else MessageRole.ASSISTANT,
+                content=f"消息{index}",
+                timestamp=start + timedelta(minutes=index),
+            ))
+
+        # 对话创建时间为当前时间，改成与最后一条消息相同，使其成为冷对话
+        async def op(db):
+            await db.execute(
+                "UPDATE conversations SET last_message_time = ? WHERE id = ?",
+                (start + timedelta(minutes=5), self.conversation_id)
+            )
+
+        await self.db.pool.write(op)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def rowids(self):
+        async with self.db.pool.reader() as db:
+            async with db.execute(
+                "SELECT id, rowid FROM messages WHERE conversation_id = ? ORDER BY rowid", (self.conversation_id,)
+            ) as cursor:
+                return await cursor.fetchall()
+
+    async def archive(self) -> int:
+        return await self.db.archive_idle_conversations(datetime.now() - timedelta(days=1))
+
+    async def test_rehydrate_keeps_rowids_and_cursors(self):
+        before = await self.rowids()
+        # 摘要的covered_until与分页游标相同，是 (timestamp, rowid)：这里覆盖到倒数第二条消息
+        covered = (await self.db.get_conversation_messages(self.conversation_id, limit=2)).before_cursor
+        tail_before = await self.db.get_conversation_messages(self.conversation_id, after=covered)
+        self.assertEqual([m.content for m in tail_before.items], ["消息5"])
+
+        # 其他对话之后写入的消息占用更大的rowid，还原时不能重新分配
+        other_id = await self.db.create_conversation()
+        await self.db.save_message(ChatMessage(conversation_id=other_id, role=MessageRole.USER, content="其他对话"))
+
+        self.assertEqual(await self.archive(), 1)
+        self.assertEqual(await self.db.rehydrate_conversation(self.conversation_id), 6)
+
+        self.assertEqual(await self.rowids(), before)
+        tail_after = await self.db.get_conversation_messages(self.conversation_id, after=covered)
+        self.assertEqual([m.id for m in tail_after.items], [m.id for m in tail_before.items])
+
+    async def test_rehydrated_conversation_is_not_archived_again(self):
+        self.assertEqual(await self.archive(), 1)
+        await self.db.get_conversation_messages(self.conversation_id)
+        self.assertEqual(await self.archive(), 0)
+
+        # 还原之后又空闲了一个周期，可以再次归档
+        self.assertEqual(await self.db.archive_idle_conversations(datetime.now() + timedelta(seconds=1)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
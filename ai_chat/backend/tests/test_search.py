@@ -0,0 +1,95 @@
+"""历史消息全文搜索的测试
+
+运行（在 ai_chat/backend 目录下）:
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import database
+from database import ChatDatabase
+from models import ChatMessage, MessageRole
+
+
+class SearchMessagesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ChatDatabase(os.path.join(self.tmp.name, "chat.db"), reader_count=1)
+        await self.db.open()
+        await self.db.init_db()
+        self.conversation_id = await self.db.create_conversation()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def save(self, content):
+        return await self.db.save_message(
+            ChatMessage(conversation_id=self.conversation_id, role=MessageRole.USER, content=content)
+        )
+
+    async def search(self, query):
+        page = await self.db.search_messages(query)
+        return {hit.message_id for hit in page.items}
+
+    async def query_plan(self, query):
+        async with self.db.pool.reader() as db:
+            async with db.execute("EXPLAIN QUERY PLAN " + query) as cursor:
+                return " ".join(row[3] for row in await cursor.fetchall())
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(database._cjk_bigrams("快速排序算法"), "快速 速排 排序 序算 算法 法")
+        self.assertEqual(database._cjk_bigrams("用Python排序"), "用 排序 序")
+        self.assertEqual(database._cjk_bigrams("hello"), "")
+
+    async def test_two_character_terms_use_bigram_index(self):
+        sort_id = await self.save("快速排序算法的时间复杂度")
+        python_id = await self.save("用Python实现排序")
+        search_id = await self.save("二分查找")
+
+        self.assertEqual(await self.search("排序"), {sort_id, python_id})
+        self.assertEqual(await self.search("排序 算法"), {sort_id})
+        self.assertEqual(await self.search("排序 Python"), {python_id})
+        self.assertEqual(await self.search("查"), {search_id})
+        self.assertEqual(await self.search("序"), {sort_id, python_id})
+        self.assertIn("messages_cjk", await self.query_plan(
+            "SELECT rowid FROM messages_cjk WHERE messages_cjk MATCH '\"排序\"'"
+        ))
+
+    async def test_index_follows_updates_and_deletes(self):
+        message_id = await self.save("今天天气很好")
+
+        async def op(db):
+            await db.execute("UPDATE messages SET content = '明天下雨' WHERE id = ?", (message_id,))
+
+        await self.db.pool.write(op)
+        self.assertEqual(await self.search("天气"), set())
+        self.assertEqual(await self.search("下雨"), {message_id})
+
+        await self.db.delete_conversation(self.conversation_id)
+        self.assertEqual(await self.search("下雨"), set())
+
+    async def test_unindexed_short_terms_scan_recent_window(self):
+        old_id = await self.save("AI 旧消息")
+        new_id = await self.save("AI 新消息")
+        self.assertEqual(await self.search("AI"), {old_id, new_id})
+
+        with mock.patch.object(database, "LIKE_SCAN_WINDOW", 1):
+            self.assertEqual(await self.search("AI"), {new_id})
+
+    async def test_rebuild_restores_bigram_index(self):
+        message_id = await self.save("数据库索引")
+
+        async def op(db):
+            await db.execute("INSERT INTO messages_cjk (messages_cjk) VALUES ('delete-all')")
+
+        await self.db.pool.write(op)
+        self.assertEqual(await self.search("索引"), set())
+        await self.db.rebuild_search_index()
+        self.assertEqual(await self.search("索引"), {message_id})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""写后队列的重试、死信和同一对话按顺序提交的测试
+
+运行（在 ai_chat/backend 目录下）:
+    python -m unittest discover tests
+"""
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from database import ChatDatabase
+from models import ChatMessage, MessageRole
+from write_behind import WriteBehindError, WriteBehindQueue
+
+
+class FlakyApply:
+    """按记录id设置失败次数的apply_record，记录成功提交的顺序"""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.applied = []
+        self.calls = 0
+
+    async def __call__(self, record):
+        self.calls += 1
+        remaining = self.failures.get(record["id"], 0)
+        if remaining:
+            self.failures[record["id"]] = remaining - 1
+            raise RuntimeError(f"提交失败: {record['id']}")
+        self.applied.append(record["id"])
+
+
+def conversation_key(record):
+    return record.get("conversation_id") or record["id"]
+
+
+class WriteBehindQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.tmp.name, "writes.jsonl")
+        self.dead = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_queue(self, apply, max_attempts=3):
+        return WriteBehindQueue(
+            self.journal, apply, flush_interval_ms=0, max_attempts=max_attempts, retry_delay=0.01,
+            order_key=conversation_key, on_dead_letter=self.dead.append,
+        )
+
+    async def test_retry_until_applied(self):
+        apply = FlakyApply({"m1": 2})
+        queue = self.make_queue(apply)
+        queue.submit({"id": "m1"})
+        await queue.flush()
+        await queue.close()
+
+        self.assertEqual(apply.applied, ["m1"])
+        self.assertEqual(apply.calls, 3)
+        self.assertEqual(queue.dead_letters, 0)
+        self.assertEqual(os.path.getsize(self.journal), 0)
+
+    async def test_dead_letter_fails_flush_and_keeps_other_records(self):
+        apply = FlakyApply({"bad": 100})
+        queue = self.make_queue(apply)
+        queue.submit({"id": "bad"})
+        queue.submit({"id": "good"})
+        with self.assertRaises(WriteBehindError):
+            await queue.flush()
+        await queue.close()
+
+        self.assertEqual(apply.applied, ["good"])
+        self.assertEqual(queue.dead_letters, 1)
+        self.assertEqual([record["id"] for record in self.dead], ["bad"])
+        with open(queue.dead_letter_path, encoding="utf-8") as f:
+            dead = [json.loads(line) for line in f]
+        self.assertEqual(dead[0]["record"]["id"], "bad")
+        self.assertEqual(dead[0]["attempts"], 3)
+        # 死信记录已从日志中移除，重启后不会重放
+        self.assertEqual(os.path.getsize(self.journal), 0)
+        recovered = self.make_queue(FlakyApply())
+        self.assertEqual(await recovered.recover(), 0)
+        await recovered.close()
+
+    async def test_same_key_records_wait_for_failed_record(self):
+        apply = FlakyApply({"c1": 1})
+        queue = self.make_queue(apply)
+        queue.submit({"id": "c1"})
+        queue.submit({"id": "m1", "conversation_id": "c1"})
+        queue.submit({"id": "m2", "conversation_id": "c1"})
+        queue.submit({"id": "c2"})
+        await queue.flush()
+        await queue.close()
+
+        # 其他对话的记录不受影响，c1的消息在c1创建之后才提交
+        self.assertEqual(apply.applied, ["c2", "c1", "m1", "m2"])
+
+    async def test_records_after_dead_letter_are_applied(self):
+        apply = FlakyApply({"m1": 100})
+        queue = self.make_queue(apply, max_attempts=2)
+        queue.submit({"id": "m1", "conversation_id": "c1"})
+        queue.submit({"id": "m2", "conversation_id": "c1"})
+        with self.assertRaises(WriteBehindError):
+            await queue.flush()
+        await queue.close()
+
+        self.assertEqual(apply.applied, ["m2"])
+        self.assertEqual([record["id"] for record in self.dead], ["m1"])
+
+
+class FailingMessageDatabase(ChatDatabase):
+    """内容为"坏消息"的消息始终提交失败"""
+
+    async def _apply_record(self, record):
+        if record["op"] == "save_message" and record["content"] == "坏消息":
+            raise RuntimeError("磁盘错误")
+        await super()._apply_record(record)
+
+
+class ChatDatabaseDeadLetterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = FailingMessageDatabase(
+            os.path.join(self.tmp.name, "chat.db"), reader_count=1, write_behind=True, write_behind_max_attempts=2
+        )
+        self.db.write_behind.retry_delay = 0.01
+        await self.db.open()
+        await self.db.init_db()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    def message(self, conversation_id, content):
+        return ChatMessage(
+            conversation_id=conversation_id, role=MessageRole.USER, content=content, timestamp=datetime.now()
+        )
+
+    async def test_dead_lettered_message_leaves_context(self):
+        conversation_id = await self.db.create_conversation()
+        await self.db.save_message(self.message(conversation_id, "好消息"))
+        await self.db.save_message(self.message(conversation_id, "坏消息"))
+        with self.assertRaises(WriteBehindError):
+            await self.db.flush_writes()
+
+        self.assertNotIn(conversation_id, self.db._unflushed_messages)
+        messages = await self.db.get_context_messages(conversation_id, token_budget=10000)
+        self.assertEqual([message.content for message in messages], ["好消息"])
+        page = await self.db.get_conversation_messages(conversation_id)
+        self.assertEqual([message.content for message in page.items], ["好消息"])
+
+
+if __name__ == "__main__":
+    unittest.main()
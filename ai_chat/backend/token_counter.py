@@ -0,0 +1,47 @@
+import asyncio
+import re
+from typing import Optional
+
+# 中日韩字符大致按一个字符一个token估算
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _load_encoding():
+    """加载tiktoken编码器，不可用时返回None并退回估算"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 未安装tiktoken或无法下载词表时使用估算
+        print(f"tiktoken不可用，使用估算的token数: {e}")
+        return None
+
+
+async def load_encoding():
+    """在线程中加载编码器（第一次使用时可能需要下载词表），启动时调用，不阻塞事件循环"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding = await asyncio.to_thread(_load_encoding)
+        _encoding_loaded = True
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符类别估算token数：中日韩字符每个约1个token，其余约4个字符1个token"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """计算文本的token数，编码器加载完成前使用估算"""
+    if not text:
+        return 0
+    encoding = _encoding
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
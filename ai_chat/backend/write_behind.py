@@ -0,0 +1,443 @@
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，只支持单进程
+    fcntl = None
+
+# 多个工作进程共用一个数据库时，每个进程独占一个日志槽位：path、path.1、path.2 ...
+MAX_JOURNAL_SLOTS = 64
+
+ApplyRecord = Callable[[Dict[str, Any]], Awaitable[None]]
+OrderKey = Callable[[Dict[str, Any]], Optional[str]]
+DeadLetterHook = Callable[[Dict[str, Any]], None]
+
+
+class WriteBehindError(RuntimeError):
+    """已接受的写入最终没能提交（已转存到死信文件）"""
+
+
+class _Entry:
+    __slots__ = ("seq", "record", "line", "attempts")
+
+    def __init__(self, seq: int, record: Dict[str, Any], line: bytes):
+        self.seq = seq
+        self.record = record
+        self.line = line
+        self.attempts = 0
+
+
+class WriteBehindQueue:
+    """写后队列：写入先追加到本地日志文件后立即返回，由后台任务批量提交到数据库
+
+    日志按行保存JSON记录（带递增的_seq），每批提交后把"已提交到的序号"写入 <日志>.committed，
+    进程异常退出后recover()只重放该序号之后的记录，不会重新写入之后被删除的数据。
+    队列清空时截断日志，持续有写入时日志超过compact_bytes后重写为只含未提交的记录。
+    order_key相同的记录（如同一对话）按写入顺序依次提交，一条失败时同键的后续记录留到它之后再提交；
+    单条记录连续失败max_attempts次后转存到 <日志>.dead.jsonl并调用on_dead_letter，等待它的flush()抛出WriteBehindError。
+    apply_record必须是幂等的。多个工作进程各自加锁使用一个日志槽位，recover()同时重放没有被其他进程持有的槽位。
+    """
+
+    def __init__(
+        self,
+        journal_path: str,
+        apply_record: ApplyRecord,
+        flush_interval_ms: float = 20,
+        max_batch_size: int = 256,
+        fsync: bool = False,
+        max_attempts: int = 5,
+        retry_delay: float = 0.5,
+        compact_bytes: int = 1024 * 1024,
+        order_key: Optional[OrderKey] = None,
+        on_dead_letter: Optional[DeadLetterHook] = None,
+    ):
+        self.journal_path = journal_path
+        self.apply_record = apply_record
+        self.order_key = order_key
+        self.on_dead_letter = on_dead_letter
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.fsync = fsync
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.compact_bytes = compact_bytes
+        self.dead_letters = 0
+
+        self._pending: Deque[_Entry] = deque()
+        self._last_seq = 0
+        self._committed_seq = 0  # 该序号及之前的记录都已提交或转入死信
+        self._dead_seqs: List[int] = []
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (登记时已提交到的序号, 目标序号, future)
+        self._journal = None
+        self._journal_bytes = 0
+        self.active_journal_path = journal_path
+        self._wakeup: Optional[asyncio.Event] = None
+        self._urgent = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def dead_letter_path(self) -> str:
+        return f"{self.active_journal_path}.dead.jsonl"
+
+    def submit(self, record: Dict[str, Any]):
+        """写入日志并加入队列，不等待数据库提交"""
+        journal = self._open_journal()
+        seq = self._last_seq + 1
+        line = (json.dumps({**record, "_seq": seq}, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        journal.write(line)
+        # 写入操作系统缓冲区后即可承受进程崩溃；fsync用于承受断电，代价是每次写入一次磁盘同步
+        journal.flush()
+        if self.fsync:
+            os.fsync(journal.fileno())
+
+        self._last_seq = seq
+        self._journal_bytes += len(line)
+        self._pending.append(_Entry(seq, record, line))
+        self._ensure_flusher()
+
+    async def flush(self):
+        """立即提交当前排队的所有写入并等待完成；其中有写入转入死信时抛出WriteBehindError"""
+        if not self._pending:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((self._committed_seq, self._last_seq, future))
+        self._urgent = True
+        self._ensure_flusher()
+        self._wakeup.set()
+        await asyncio.shield(future)
+
+    async def recover(self) -> int:
+        """重放上次退出时未提交的日志记录（本进程的槽位和无人持有的槽位），返回重放的记录数"""
+        self._open_journal()
+        replayed, _ = await self._replay_file(self.active_journal_path, self._committed_seq)
+        if not self._pending:
+            self._set_committed(self._last_seq)
+            self._truncate_journal()
+
+        # 工作进程数变少后，多出来的槽位不会再被打开，由当前进程代为重放
+        for path in self._slot_paths():
+            if path == self.active_journal_path or not os.path.exists(path):
+                continue
+            orphan = self._try_lock(path)
+            if orphan is None:
+                continue
+            try:
+                count, last_seq = await self._replay_file(path, _read_marker(path))
+                replayed += count
+                _write_marker(path, last_seq, self.fsync)
+                orphan.truncate(0)
+            finally:
+                orphan.close()
+        return replayed
+
+    async def _replay_file(self, path: str, after_seq: int) -> Tuple[int, int]:
+        """重放序号after_seq之后的记录，返回(重放的记录数, 文件中最大的序号)"""
+        replayed = 0
+        last_seq = after_seq
+        for seq, record in _read_journal(path):
+            if seq is not None:
+                last_seq = max(last_seq, seq)
+                if seq <= after_seq:
+                    # 已提交的记录，重放会恢复之后被删除的数据
+                    continue
+            try:
+                await self.apply_record(record)
+                replayed += 1
+            except Exception as e:
+                print(f"重放写入日志错误: {e}")
+                self._write_dead_letter(record, e, 1)
+                self._notify_dead_letter(record)
+        return replayed, last_seq
+
+    async def close(self):
+        """提交剩余的写入并停止后台任务"""
+        self._closing = True
+        if self._flusher is not None:
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._closing = False
+
+    def _open_journal(self):
+        if self._journal is None:
+            if fcntl is None:
+                self._journal = open(self.journal_path, "ab")
+            else:
+                for path in self._slot_paths():
+                    self._journal = self._try_lock(path)
+                    if self._journal is not None:
+                        self.active_journal_path = path
+                        break
+                else:
+                    raise RuntimeError(f"写入日志槽位已全部被占用: {self.journal_path}")
+            # 序号跨进程重启保持递增，新记录的序号必须大于已记录的提交序号
+            self._committed_seq = _read_marker(self.active_journal_path)
+            self._last_seq = self._committed_seq
+            for seq, _ in _read_journal(self.active_journal_path):
+                if seq is not None:
+                    self._last_seq = max(self._last_seq, seq)
+            self._journal_bytes = os.path.getsize(self.active_journal_path)
+        return self._journal
+
+    def _slot_paths(self) -> List[str]:
+        if fcntl is None:
+            return [self.journal_path]
+        return [self.journal_path] + [f"{self.journal_path}.{slot}" for slot in range(1, MAX_JOURNAL_SLOTS)]
+
+    def _try_lock(self, path: str):
+        """以追加方式打开日志并加独占锁，已被其他进程持有时返回None"""
+        f = open(path, "ab")
+        if fcntl is None:
+            return f
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    def _truncate_journal(self):
+        journal = self._open_journal()
+        journal.truncate(0)
+        if self.fsync:
+            os.fsync(journal.fileno())
+        self._journal_bytes = 0
+
+    def _compact_journal(self):
+        """把日志重写为只包含未提交的记录：先写临时文件并加锁，再原子替换，槽位始终被本进程持有"""
+        path = self.active_journal_path
+        temp_path = f"{path}.compact"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        compacted = open(temp_path, "ab")
+        if fcntl is not None:
+            fcntl.flock(compacted.fileno(), fcntl.LOCK_EX)
+        compacted.write(b"".join(entry.line for entry in self._pending))
+        compacted.flush()
+        if self.fsync:
+            os.fsync(compacted.fileno())
+
+        if fcntl is None:
+            # Windows不能替换打开中的文件
+            self._journal.close()
+            os.replace(temp_path, path)
+        else:
+            os.replace(temp_path, path)
+            self._journal.close()
+        self._journal = compacted
+        self._journal_bytes = compacted.tell()
+
+    def _set_committed(self, seq: int):
+        if seq != self._committed_seq:
+            self._committed_seq = seq
+            _write_marker(self.active_journal_path, seq, self.fsync)
+
+    def _write_dead_letter(self, record: Dict[str, Any], error: BaseException, attempts: int):
+        self.dead_letters += 1
+        line = json.dumps({
+            "record": record,
+            "error": str(error),
+            "attempts": attempts,
+            "failed_at": datetime.now().isoformat(),
+        }, ensure_ascii=False, separators=(",", ":"))
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        self._wakeup.set()
+
+    async def _flush_loop(self):
+        """后台任务：等待一个间隔以合并更多写入，然后分批提交"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            if self._pending and not self._urgent and not self._closing and self.flush_interval:
+                try:
+                    await asyncio.wait_for(self._wait_urgent(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._urgent = False
+
+            while self._pending:
+                if not await self._flush_batch() and self._closing:
+                    # 关闭时数据库仍不可用：记录保留在日志中，下次启动时重放
+                    print(f"写后队列关闭时仍有 {len(self._pending)} 条写入未提交，已保留在日志中")
+                    self._fail_waiters(WriteBehindError("写后队列已关闭"))
+                    return
+
+            if self._closing:
+                return
+
+    async def _wait_urgent(self):
+        while not (self._urgent or self._closing):
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+    async def _wait_closing(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+    async def _flush_batch(self) -> bool:
+        """提交一批记录，同一批的写入由连接池合并为一个事务；没有任何记录提交或转入死信时返回False
+
+        失败的记录按原顺序放回队首稍后重试（间隔按失败次数翻倍），连续失败max_attempts次后转入死信。
+        """
+        batch = [self._pending[i] for i in range(min(self.max_batch_size, len(self._pending)))]
+        # 同一个键的记录组成一条链按顺序提交，不同的链并发提交，由连接池合并为一个事务
+        chains: Dict[Any, List[_Entry]] = {}
+        for entry in batch:
+            key = self.order_key(entry.record) if self.order_key is not None else None
+            chains.setdefault(key if key is not None else ("_seq", entry.seq), []).append(entry)
+        outcomes = await asyncio.gather(*(self._apply_chain(chain) for chain in chains.values()))
+
+        failed: Dict[int, BaseException] = {}
+        done = set()
+        for applied, failure in outcomes:
+            done.update(applied)
+            if failure is not None:
+                failed[failure[0].seq] = failure[1]
+
+        # 失败的记录和同键上被暂缓的后续记录按原顺序放回队首
+        retry: List[_Entry] = []
+        failures = 0
+        last_error: Optional[BaseException] = None
+        progressed = bool(done)
+        for entry in batch:
+            if entry.seq in done:
+                continue
+            error = failed.get(entry.seq)
+            if error is not None:
+                entry.attempts += 1
+                if entry.attempts >= self.max_attempts and not self._closing:
+                    print(f"写后队列记录连续 {entry.attempts} 次提交失败，已转存到 {self.dead_letter_path}: {error}")
+                    self._dead_letter(entry, error)
+                    progressed = True
+                    continue
+                failures += 1
+                last_error = error
+            retry.append(entry)
+        # 提交期间新写入只会追加到队尾，队首仍是本批记录
+        for _ in batch:
+            self._pending.popleft()
+        self._pending.extendleft(reversed(retry))
+
+        self._set_committed(self._pending[0].seq - 1 if self._pending else self._last_seq)
+        if not self._pending:
+            self._truncate_journal()
+        elif self._journal_bytes >= self.compact_bytes:
+            self._compact_journal()
+        self._resolve_waiters()
+
+        if failures:
+            print(f"写后队列提交错误（{len(retry)} 条稍后重试）: {last_error}")
+            if not self._closing:
+                attempts = max(entry.attempts for entry in retry)
+                try:
+                    # 关闭时不再等待，剩余记录保留在日志中
+                    await asyncio.wait_for(self._wait_closing(), timeout=min(self.retry_delay * 2 ** (attempts - 1), 10.0))
+                except asyncio.TimeoutError:
+                    pass
+        return progressed
+
+    async def _apply_chain(self, chain: List[_Entry]) -> Tuple[List[int], Optional[Tuple[_Entry, BaseException]]]:
+        """按顺序提交同一个键的记录，遇到失败即停止；返回(已提交的序号, (失败的记录, 错误))"""
+        applied = []
+        for entry in chain:
+            try:
+                await self.apply_record(entry.record)
+            except Exception as e:
+                return applied, (entry, e)
+            applied.append(entry.seq)
+        return applied, None
+
+    def _dead_letter(self, entry: _Entry, error: BaseException):
+        self._write_dead_letter(entry.record, error, entry.attempts)
+        self._dead_seqs.append(entry.seq)
+        self._notify_dead_letter(entry.record)
+
+    def _notify_dead_letter(self, record: Dict[str, Any]):
+        if self.on_dead_letter is not None:
+            try:
+                self.on_dead_letter(record)
+            except Exception as e:
+                print(f"写后队列死信回调错误: {e}")
+
+    def _resolve_waiters(self):
+        remaining = []
+        for start, target, future in self._waiters:
+            if target > self._committed_seq:
+                remaining.append((start, target, future))
+                continue
+            if future.done():
+                continue
+            dead = sum(1 for seq in self._dead_seqs if start < seq <= target)
+            if dead:
+                future.set_exception(WriteBehindError(f"{dead} 条写入提交失败，已转存到 {self.dead_letter_path}"))
+            else:
+                future.set_result(None)
+        self._waiters = remaining
+        if not remaining:
+            self._dead_seqs.clear()
+
+    def _fail_waiters(self, error: Exception):
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_exception(error)
+        self._waiters = []
+
+
+def _read_journal(path: str):
+    """逐行读取日志，返回(序号, 记录)；旧格式的记录没有序号，返回None"""
+    try:
+        with open(path, "rb") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # 崩溃时只写了一半的最后一行
+            continue
+        yield record.pop("_seq", None), record
+
+
+def _read_marker(path: str) -> int:
+    try:
+        with open(f"{path}.committed", "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _write_marker(path: str, seq: int, fsync: bool):
+    """原子地更新已提交到的序号"""
+    marker_path = f"{path}.committed"
+    temp_path = f"{marker_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(str(seq))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, marker_path)
@@ -0,0 +1,154 @@
+"""搜索结果解析基准测试
+
+对比各解析后端在录制样式的DuckDuckGo结果页上的耗时，校验各后端结果一致，
+并测量解析放在事件循环内执行与放到工作池执行时事件循环的最大停顿；
+最后对比摘要去重的线性扫描与原来的回溯正则 (.{1,10})\1+ 的结果和耗时。
+
+用法（在 ai_chat/backend 的虚拟环境中）:
+    python ../benchmarks/bench_search_parser.py [--iterations 200] [--max-results 5]
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "backend"))
+os.environ.setdefault("API_KEY", "benchmark")
+
+from search_parsers import PARSER_BACKENDS, _collapse_repeats, parse_results  # noqa: E402
+
+FIXTURES_DIR = BENCH_DIR / "fixtures" / "duckduckgo"
+BASELINE = "bs4"
+
+# 原来的摘要去重正则，作为线性扫描的对照
+REPEATED_UNIT = re.compile(r'(.{1,10})\1+')
+
+# 摘要去重的输入：常见摘要、重复词组和没有重复的长文本（正则在每个位置都要尝试全部长度）
+SNIPPET_INPUTS = {
+    "普通摘要": "Python 是一种广泛使用的解释型、高级和通用的编程语言。很高兴很高兴认识你！！" * 3,
+    "重复词组": "很高兴" * 2000,
+    "无重复长文本": "abcdefghijk" * 2000,
+    "短周期交替": "ab" * 10000 + "c",
+}
+
+
+def load_fixtures():
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(FIXTURES_DIR.glob("*.html"))}
+
+
+def available_backends():
+    return [name for name, parser in PARSER_BACKENDS.items() if parser.is_available()]
+
+
+def time_backend(backend: str, html: str, max_results: int, iterations: int):
+    """返回每次解析的耗时列表（毫秒）"""
+    parse_results(backend, html, max_results)  # 预热
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse_results(backend, html, max_results)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def check_parity(fixtures, backends, max_results: int) -> bool:
+    """各后端的解析结果必须与基线完全一致"""
+    ok = True
+    for name, html in fixtures.items():
+        expected = [result.model_dump() for result in parse_results(BASELINE, html, max_results)]
+        for backend in backends:
+            actual = [result.model_dump() for result in parse_results(backend, html, max_results)]
+            if actual != expected:
+                ok = False
+                print(f"  结果不一致: {name} / {backend}")
+    return ok
+
+
+def bench_snippet_cleaning(iterations: int):
+    """摘要去重：线性扫描与原正则的结果必须一致，输出两者的平均耗时（毫秒）"""
+    print(f"\n{'摘要去重输入':<16}{'长度':>8}{'正则 ms':>10}{'线性 ms':>10}{'一致':>6}")
+    for name, text in SNIPPET_INPUTS.items():
+        same = REPEATED_UNIT.sub(r'\1', text) == _collapse_repeats(text)
+        timings = []
+        for clean in (lambda: REPEATED_UNIT.sub(r'\1', text), lambda: _collapse_repeats(text)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                clean()
+            timings.append((time.perf_counter() - start) * 1000 / iterations)
+        print(f"{name:<16}{len(text):>8}{timings[0]:>10.3f}{timings[1]:>10.3f}{'是' if same else '否':>6}")
+
+
+async def measure_loop_stall(html: str, max_results: int, rounds: int, offload: bool) -> float:
+    """并发执行rounds次解析，同时用1ms心跳测量事件循环的最大停顿（毫秒）"""
+    from search_service import search_service
+
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal max_lag
+        interval = 0.001
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, (time.perf_counter() - start - interval) * 1000)
+
+    async def parse_once():
+        if offload:
+            await search_service._parse_duckduckgo_results(html, max_results)
+        else:
+            parse_results(search_service.parser_backend, html, max_results)
+        await asyncio.sleep(0)
+
+    ticker = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(parse_once() for _ in range(rounds)))
+    stop.set()
+    await ticker
+    return max_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--stall-rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    backends = available_backends()
+    print(f"可用后端: {', '.join(backends)}  迭代次数: {args.iterations}\n")
+
+    print(f"{'fixture':<30}{'backend':<12}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'speedup':>10}")
+    for name, html in fixtures.items():
+        baseline_mean = None
+        for backend in [BASELINE] + [b for b in backends if b != BASELINE]:
+            samples = sorted(time_backend(backend, html, args.max_results, args.iterations))
+            mean = statistics.fmean(samples)
+            if backend == BASELINE:
+                baseline_mean = mean
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            print(f"{name:<30}{backend:<12}{mean:>10.3f}{statistics.median(samples):>10.3f}"
+                  f"{p99:>10.3f}{baseline_mean / mean:>9.1f}x")
+
+    print("\n结果一致性:", "通过" if check_parity(fixtures, backends, args.max_results) else "失败")
+
+    from search_service import search_service
+    largest = max(fixtures.values(), key=len)
+    inline = asyncio.run(measure_loop_stall(largest, args.max_results, args.stall_rounds, offload=False))
+    offloaded = asyncio.run(measure_loop_stall(largest, args.max_results, args.stall_rounds, offload=True))
+    print(f"\n事件循环最大停顿（{search_service.parser_backend}，{args.stall_rounds}次并发解析）:")
+    print(f"  循环内解析: {inline:.2f} ms")
+    print(f"  工作池解析: {offloaded:.2f} ms")
+    search_service.shutdown()
+
+    bench_snippet_cleaning(max(1, args.iterations // 10))
+
+
+if __name__ == "__main__":
+    main()
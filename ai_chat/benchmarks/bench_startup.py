@@ -0,0 +1,184 @@
+"""启动耗时基准测试
+
+在全新的子进程中测量后端的冷启动：
+1. import main 的耗时，按 -X importtime 的结果统计各模块（后端模块和第三方包）的导入耗时；
+2. lifespan 启动和关闭的耗时（临时数据库）；
+3. 各延迟加载服务第一次使用的耗时（导入依赖、构造客户端、打开连接池），即被推迟到第一个请求的开销；
+4. 被推迟的重量级依赖（autogen、openai、httpx等）单独导入的耗时，作为对照。
+
+不需要API_KEY，也不会连接模型或搜索服务。
+
+用法:
+    python ../benchmarks/bench_startup.py [--iterations 5] [--top 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# 延迟加载的重量级依赖，单独导入作为对照
+DEFERRED_IMPORTS = [
+    "autogen_agentchat.agents",
+    "autogen_ext.models.openai",
+    "httpx",
+    "bs4",
+]
+
+# 在子进程中执行：导入main，运行lifespan，然后依次第一次使用各延迟加载服务
+STARTUP_SCRIPT = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - started) * 1000
+from service_registry import services
+
+async def run():
+    context = main.app.router.lifespan_context(main.app)
+    started = time.perf_counter()
+    await context.__aenter__()
+    startup_ms = (time.perf_counter() - started) * 1000
+    first_use = {}
+    for name in ("model_client", "search_service", "database"):
+        started = time.perf_counter()
+        await services.acquire(name)
+        first_use[name] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    await context.__aexit__(None, None, None)
+    shutdown_ms = (time.perf_counter() - started) * 1000
+    print(json.dumps({
+        "import_ms": import_ms, "startup_ms": startup_ms, "shutdown_ms": shutdown_ms,
+        "first_use_ms": first_use, "heavy_modules_at_import": HEAVY,
+    }))
+
+HEAVY = sorted(name for name in ("autogen_core", "autogen_agentchat", "openai", "httpx", "bs4") if name in sys.modules)
+asyncio.run(run())
+"""
+
+
+def child_env(tmp_dir: str) -> Dict[str, str]:
+    """子进程环境：临时数据库，不设置API_KEY，不预热，关闭后台维护"""
+    env = dict(os.environ)
+    env.pop("API_KEY", None)
+    env.pop("SERVICE_WARMUP", None)
+    env.update({
+        "CHAT_DB_PATH": os.path.join(tmp_dir, "bench.db"),
+        "STREAM_REGISTRY": "memory",
+        "SEARCH_CACHE_PATH": "",
+        "DB_MAINTENANCE_INTERVAL": "0",
+        # 模型客户端在第一次使用时构造，需要一个非空的密钥（不会发出请求）
+        "MODEL_ENDPOINTS": json.dumps([{
+            "name": "bench", "base_url": "http://127.0.0.1:9/v1", "api_key": "bench", "model": "bench"
+        }]),
+    })
+    return env
+
+
+def run_python(args: List[str], env: Dict[str, str]) -> subprocess.CompletedProcess:
+    result = subprocess.run(
+        [sys.executable, *args], cwd=str(BACKEND_DIR), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"子进程失败:\n{result.stderr}")
+    return result
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, int, str]]:
+    """解析 -X importtime 的输出，返回 (缩进层级, 自身耗时us, 累计耗时us, 模块名)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_part, cumulative_part, name = line.split("|", 2)
+        self_us = int(self_part.split(":")[1])
+        cumulative_us = int(cumulative_part)
+        level = (len(name) - len(name.lstrip())) // 2
+        rows.append((level, self_us, cumulative_us, name.strip()))
+    return rows
+
+
+def import_breakdown(env: Dict[str, str]) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """import main 时直接导入的后端模块的累计耗时，以及各顶层包的自身耗时合计（毫秒）"""
+    stderr = run_python(["-X", "importtime", "-c", "import main"], env).stderr
+    rows = parse_importtime(stderr)
+    backend_modules = {path.stem for path in BACKEND_DIR.glob("*.py")}
+
+    modules: Dict[str, float] = {}
+    for level, _, cumulative_us, name in rows:
+        # 后端模块可能被其他后端模块先导入，取第一次出现（即实际付出导入开销）时的累计耗时
+        if name in backend_modules and name not in modules:
+            modules[name] = cumulative_us / 1000
+
+    packages: Dict[str, float] = defaultdict(float)
+    for _, self_us, _, name in rows:
+        top = name.split(".")[0]
+        packages["(后端模块)" if top in backend_modules else top] += self_us / 1000
+    return modules, dict(packages)
+
+
+def measure_deferred(env: Dict[str, str]) -> Dict[str, float]:
+    """在全新进程中单独导入被推迟的依赖的耗时（毫秒）"""
+    results = {}
+    for module in DEFERRED_IMPORTS:
+        code = f"import time; s = time.perf_counter(); import {module}; print((time.perf_counter() - s) * 1000)"
+        try:
+            results[module] = float(run_python(["-c", code], env).stdout.strip())
+        except SystemExit:
+            results[module] = float("nan")  # 未安装
+    return results
+
+
+def print_table(title: str, values: Dict[str, float], top: int):
+    print(f"\n{title}")
+    for name, ms in sorted(values.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {name:<40} {ms:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端冷启动耗时基准测试")
+    parser.add_argument("--iterations", type=int, default=5, help="冷启动测量次数（取中位数）")
+    parser.add_argument("--top", type=int, default=15, help="导入耗时表显示的行数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = child_env(tmp_dir)
+        # 第一次运行生成字节码缓存，不计入结果
+        run_python(["-c", STARTUP_SCRIPT], env)
+
+        runs = []
+        for _ in range(args.iterations):
+            for name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, name))
+            runs.append(json.loads(run_python(["-c", STARTUP_SCRIPT], env).stdout.strip().splitlines()[-1]))
+
+        modules, packages = import_breakdown(env)
+        deferred = measure_deferred(env)
+
+    def median(key: str) -> float:
+        return statistics.median(run[key] for run in runs)
+
+    print(f"冷启动（{args.iterations} 次中位数）:")
+    print(f"  import main                              {median('import_ms'):>9.1f} ms")
+    print(f"  lifespan 启动                            {median('startup_ms'):>9.1f} ms")
+    print(f"  lifespan 关闭                            {median('shutdown_ms'):>9.1f} ms")
+    print(f"  导入时已加载的重量级依赖: {', '.join(runs[0]['heavy_modules_at_import']) or '无'}")
+
+    print("\n各服务第一次使用的耗时（推迟到第一个请求或后台预热）:")
+    for name in runs[0]["first_use_ms"]:
+        ms = statistics.median(run["first_use_ms"][name] for run in runs)
+        print(f"  {name:<40} {ms:>9.1f} ms")
+
+    print_table("import main 时各后端模块的累计导入耗时:", modules, args.top)
+    print_table("按顶层包统计的导入耗时（自身耗时合计）:", packages, args.top)
+    print_table("被推迟的依赖单独导入的耗时（对照）:", deferred, args.top)
+
+
+if __name__ == "__main__":
+    main()
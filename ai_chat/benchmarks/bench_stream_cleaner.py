@@ -0,0 +1,142 @@
+"""流式去重基准测试
+
+在较长的中文和英文回复（含Markdown、代码块、数字和注入的重复片段）上，
+对比原先的"逐chunk基础清理 + 结束后整段深度清理"与StreamCleaner的单遍增量清理：
+总耗时、结束时阻塞完成信号的耗时、流式输出与保存内容是否一致、代码块是否被破坏。
+
+用法:
+    python ../benchmarks/bench_stream_cleaner.py [--iterations 20]
+"""
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from stream_cleaner import StreamCleaner  # noqa: E402
+
+CODE_BLOCK = "```python\nfor i in range(1000):\n    total += i  # 累加\n\nassert total == 499500\n```\n"
+
+ZH_PARAGRAPHS = [
+    "Python 是一种解释型、面向对象的高级程序设计语言，语法简洁，适合快速开发。",
+    "在实际项目中，我们通常会先定义数据模型，然后编写业务逻辑，最后补充测试。",
+    "2024年的调查显示，超过 45.6% 的开发者在日常工作中使用 Python。",
+    "需要注意的是，异步代码中不要执行阻塞操作，否则会影响整个事件循环。",
+    "| 方案 | 延迟 | 吞吐 |\n|---|---|---|\n| 同步 | 120ms | 800 |\n| 异步 | 35ms | 3200 |",
+]
+ZH_REPEATS = ["很高兴很高兴", "非常非常非常", "。。。", "好的好的，", "哈哈哈哈哈"]
+
+EN_PARAGRAPHS = [
+    "Python is an interpreted, object-oriented programming language with a concise syntax.",
+    "In a real project you usually define the data model first, then write the business logic.",
+    "A 2024 survey found that 45.6% of developers use Python at work, up from 41.0% in 2023.",
+    "Never block the event loop inside async code; offload CPU-bound work to a thread pool.",
+    "See https://www.python.org/ and https://docs.python.org/3/ for details...",
+]
+EN_REPEATS = ["the the ", "very very very ", "is is "]
+
+
+def build_reply(paragraphs, repeats, target_length: int, seed: int) -> str:
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < target_length:
+        part = rng.choice(paragraphs)
+        if rng.random() < 0.3:
+            position = rng.randrange(len(part))
+            part = part[:position] + rng.choice(repeats) + part[position:]
+        if rng.random() < 0.1:
+            part += "\n" + part  # 整行重复
+        if rng.random() < 0.1:
+            part += "\n\n" + CODE_BLOCK
+        parts.append(part)
+        length += len(part)
+    return "\n\n".join(parts)
+
+
+def split_chunks(text: str, seed: int):
+    """按类似模型token的粒度切成流式片段"""
+    rng = random.Random(seed)
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 6)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+def legacy_clean(chunks):
+    """原先的实现：逐chunk基础清理后发送，结束后对完整原文做深度清理再保存"""
+    streamed = [re.sub(r'(.)\1{3,}', r'\1', chunk) for chunk in chunks]
+    start = time.perf_counter()
+    content = "".join(chunks)
+    cleaned = re.sub(r'(.)\1{2,}', r'\1\1', content)
+    cleaned = re.sub(r'([\u4e00-\u9fff]{2,8})\1+', r'\1', cleaned)
+    cleaned = re.sub(r'(\b[a-zA-Z]+\b)\s*\1+', r'\1', cleaned)
+    cleaned = re.sub(r'([^\n。！？]{3,20})\1+', r'\1', cleaned)
+    lines = []
+    for line in cleaned.split('\n'):
+        if line.strip():
+            line = re.sub(r'([^\s。！？，]{2,10})\s*\1+', r'\1', line)
+            line = re.sub(r'([^。！？]{5,30}[。！？])\s*\1+', r'\1', line)
+        lines.append(line)
+    final_lines = []
+    seen_lines = set()
+    for line in lines:
+        normalized = re.sub(r'\s+', ' ', line.strip())
+        if normalized:
+            if normalized not in seen_lines:
+                seen_lines.add(normalized)
+                final_lines.append(line)
+        else:
+            final_lines.append(line)
+    persisted = re.sub(r'([。！？，；：])\1+', r'\1', '\n'.join(final_lines))
+    return "".join(streamed), persisted, time.perf_counter() - start
+
+
+def incremental_clean(chunks):
+    cleaner = StreamCleaner()
+    streamed = [cleaner.feed(chunk) for chunk in chunks]
+    start = time.perf_counter()
+    streamed.append(cleaner.finish())
+    content = "".join(streamed)
+    return content, content, time.perf_counter() - start
+
+
+def bench(name, text, iterations: int):
+    chunks = split_chunks(text, seed=1)
+    print(f"\n{name}: {len(text)} 字符, {len(chunks)} 个片段")
+    print(f"  {'实现':<10}{'总耗时 ms':>12}{'结束阻塞 ms':>14}{'流式=保存':>10}{'代码块完整':>12}")
+    for label, clean in (("原实现", legacy_clean), ("增量清理", incremental_clean)):
+        totals, finals = [], []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            streamed, persisted, final = clean(chunks)
+            totals.append((time.perf_counter() - start) * 1000)
+            finals.append(final * 1000)
+        code_intact = persisted.count(CODE_BLOCK) == text.count(CODE_BLOCK)
+        print(f"  {label:<10}{statistics.median(totals):>12.2f}{statistics.median(finals):>14.3f}"
+              f"{str(streamed == persisted):>10}{str(code_intact):>12}")
+
+    # 切分方式不同时结果应完全相同
+    outputs = {incremental_clean(split_chunks(text, seed))[1] for seed in range(5)}
+    print(f"  增量清理结果与切分方式无关: {len(outputs) == 1}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--length", type=int, default=8000, help="每段回复的目标字符数")
+    args = parser.parse_args()
+
+    bench("中文长回复", build_reply(ZH_PARAGRAPHS, ZH_REPEATS, args.length, seed=7), args.iterations)
+    bench("英文长回复", build_reply(EN_PARAGRAPHS, EN_REPEATS, args.length * 2, seed=7), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
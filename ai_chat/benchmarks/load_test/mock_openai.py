@@ -0,0 +1,141 @@
+"""兼容OpenAI接口的模拟模型服务
+
+实现 POST /v1/chat/completions（流式和非流式），按配置的首字延迟和输出速度逐token返回，
+回复内容是一段不断循环的中文文本（不含重复短语和重复行，不会被后端的流式去重删掉）。
+把后端的 BASE_URL 指向 http://127.0.0.1:<port>/v1 即可离线压测。
+
+用法:
+    python mock_openai.py [--port 9100] [--first-token-ms 300] [--tokens-per-second 40] [--reply-tokens 200]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PASSAGE = (
+    "异步编程让单个进程可以同时处理大量网络请求，事件循环在等待数据库和外部接口时切换到其他任务。"
+    "合理设置超时和并发上限，可以避免慢请求拖垮整个服务，同时保持较低的首字延迟。"
+    "在压测中，我们关注首字延迟、字间延迟、尾部延迟以及可以稳定支撑的并发流数量。"
+)
+# 每个token两个字符，与真实模型的中文token粒度接近
+TOKENS = [PASSAGE[i:i + 2] for i in range(0, len(PASSAGE), 2)]
+
+
+def create_app(first_token_ms: float, tokens_per_second: float, reply_tokens: int, jitter: float) -> FastAPI:
+    app = FastAPI(title="模拟模型服务")
+    stats = {"requests": 0, "active": 0}
+
+    def reply_tokens_for(request_index: int):
+        # 每个请求从不同位置开始循环，避免所有回复完全相同
+        offset = request_index % len(TOKENS)
+        return [TOKENS[(offset + i) % len(TOKENS)] for i in range(reply_tokens)]
+
+    async def token_stream(model: str, tokens, include_usage: bool, prompt_tokens: int):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        rng = random.Random()
+
+        def frame(delta: dict, finish_reason=None, usage=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        stats["active"] += 1
+        try:
+            await asyncio.sleep(first_token_ms / 1000 * rng.uniform(1 - jitter, 1 + jitter))
+            yield frame({"role": "assistant", "content": ""})
+            first_at = time.perf_counter()
+            interval = 1 / tokens_per_second if tokens_per_second > 0 else 0
+            for i, token in enumerate(tokens):
+                # 按绝对时间表发送，避免sleep误差累积
+                delay = first_at + (i + rng.uniform(-jitter, jitter)) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield frame({"content": token})
+            yield frame({}, finish_reason="stop")
+            if include_usage:
+                yield frame({}, usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                })
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["active"] -= 1
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        request_index = stats["requests"]
+        stats["requests"] += 1
+
+        model = body.get("model", "mock-chat")
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in body.get("messages", []))
+        prompt_tokens = max(1, prompt_chars // 2)
+        tokens = reply_tokens_for(request_index)
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                token_stream(model, tokens, include_usage, prompt_tokens),
+                media_type="text/event-stream"
+            )
+
+        # 非流式请求（如滚动摘要）：等待生成全部token的时间后一次返回
+        await asyncio.sleep(first_token_ms / 1000 + (len(tokens) / tokens_per_second if tokens_per_second > 0 else 0))
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        })
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock-chat", "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="收到请求到第一个token的延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=40, help="每个流的输出速度")
+    parser.add_argument("--reply-tokens", type=int, default=200, help="每个回复的token数")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的随机浮动比例")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.first_token_ms, args.tokens_per_second, args.reply_tokens, args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""模拟搜索服务
+
+GET /html/?q=... 返回DuckDuckGo HTML格式的结果页，结果链接指向本服务的 /page/<n>，
+用于后端抓取网页正文。把后端的 SEARCH_URL 指向 http://127.0.0.1:<port>/html/ 即可离线压测搜索链路。
+
+用法:
+    python mock_search.py [--port 9200] [--search-latency-ms 400] [--page-latency-ms 150]
+"""
+import argparse
+import asyncio
+import html
+import random
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse
+
+RESULT_TEMPLATE = """
+<div class="result results_links results_links_deep web-result">
+  <div class="links_main links_deep result__body">
+    <h2 class="result__title">
+      <a rel="nofollow" class="result__a" href="{url}">{title}</a>
+    </h2>
+    <div class="result__extras"><span class="result__url">{url}</span></div>
+    <a class="result__snippet" href="{url}">{snippet}</a>
+  </div>
+</div>
+"""
+
+PAGE_PARAGRAPH = (
+    "<p>第{index}段：这是模拟网页的正文内容，用于测试后端抓取和提取网页正文的速度。"
+    "页面中还包含导航、脚本和样式等非正文内容，提取时应当被跳过。</p>"
+)
+
+
+def create_app(search_latency_ms: float, page_latency_ms: float, results: int, page_kb: int, jitter: float) -> FastAPI:
+    app = FastAPI(title="模拟搜索服务")
+    rng = random.Random()
+
+    async def delay(ms: float):
+        await asyncio.sleep(ms / 1000 * rng.uniform(1 - jitter, 1 + jitter))
+
+    @app.get("/html/", response_class=HTMLResponse)
+    async def search(request: Request, q: str = ""):
+        await delay(search_latency_ms)
+        base = str(request.base_url).rstrip("/")
+        query = html.escape(q)
+        items = "".join(
+            RESULT_TEMPLATE.format(
+                url=f"{base}/page/{i}",
+                title=f"{query} - 模拟结果 {i}",
+                snippet=f"关于“{query}”的第{i}条模拟搜索结果摘要，包含一些用于测试的说明文字。",
+            )
+            for i in range(1, results + 1)
+        )
+        return f"<html><head><title>{query} at DuckDuckGo</title></head><body><div id=\"links\">{items}</div></body></html>"
+
+    @app.get("/page/{page_id}", response_class=HTMLResponse)
+    async def page(page_id: int):
+        await delay(page_latency_ms)
+        paragraphs = []
+        size = 0
+        while size < page_kb * 1024:
+            paragraph = PAGE_PARAGRAPH.format(index=len(paragraphs) + 1)
+            paragraphs.append(paragraph)
+            size += len(paragraph.encode("utf-8"))
+        return (
+            f"<html><head><title>模拟页面 {page_id}</title><style>body{{margin:0}}</style>"
+            f"<script>var page = {page_id};</script></head>"
+            f"<body><nav>首页 | 文档 | 关于</nav><article>{''.join(paragraphs)}</article>"
+            f"<footer>版权所有</footer></body></html>"
+        )
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--search-latency-ms", type=float, default=400, help="结果页的响应延迟")
+    parser.add_argument("--page-latency-ms", type=float, default=150, help="网页的响应延迟")
+    parser.add_argument("--results", type=int, default=5, help="每页结果数")
+    parser.add_argument("--page-kb", type=int, default=32, help="每个网页的大小（KB）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的随机浮动比例")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.search_latency_ms, args.page_latency_ms, args.results, args.page_kb, args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
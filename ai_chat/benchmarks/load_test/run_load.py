@@ -0,0 +1,328 @@
+"""离线端到端压测
+
+启动模拟模型服务、模拟搜索服务和后端（临时数据库），按多个并发级别请求 /api/chat/stream，
+统计首字延迟（TTFT）、字间延迟（相邻两个content事件的间隔）、完整流耗时的p50/p99，
+并给出在TTFT p99不超过阈值且没有错误的前提下可以稳定支撑的最大并发流数量。
+结果保存为JSON，指定 --baseline 时与之前的结果对比，退化超过阈值时以非零状态退出。
+
+用法:
+    python run_load.py [--concurrency 1,8,32,64] [--rounds 3] [--search] [--output results.json]
+    python run_load.py --baseline results_old.json --output results_new.json
+    python run_load.py --backend-url http://127.0.0.1:8000   # 压测已在运行的后端（需自行配置模拟服务）
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+HERE = Path(__file__).resolve().parent
+BACKEND_DIR = HERE.parent.parent / "backend"
+
+QUESTIONS = [
+    "请介绍一下Python的异步编程",
+    "事件循环是如何调度任务的",
+    "如何排查接口的尾部延迟",
+    "SQLite的WAL模式有什么优点",
+    "怎样设计一个可靠的重试机制",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败: {' '.join(process.args)}")
+        try:
+            if httpx.get(url, timeout=1, trust_env=False).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"服务启动超时: {url}")
+
+
+@contextmanager
+def local_servers(args, workdir: Path):
+    """启动模拟服务和后端，退出时全部停止，返回后端地址"""
+    processes = []
+    logs = []
+
+    def start(name: str, command: List[str], ready_url: str, env=None, cwd=None):
+        log = open(workdir / f"{name}.log", "wb")
+        logs.append(log)
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=cwd)
+        processes.append(process)
+        try:
+            wait_ready(ready_url, process)
+        except RuntimeError:
+            log.flush()
+            print((workdir / f"{name}.log").read_text(encoding="utf-8", errors="replace")[-2000:])
+            raise
+
+    try:
+        model_port, search_port, backend_port = free_port(), free_port(), free_port()
+        start("mock_openai", [
+            sys.executable, str(HERE / "mock_openai.py"), "--port", str(model_port),
+            "--first-token-ms", str(args.first_token_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+            "--reply-tokens", str(args.reply_tokens),
+        ], f"http://127.0.0.1:{model_port}/stats")
+        start("mock_search", [
+            sys.executable, str(HERE / "mock_search.py"), "--port", str(search_port),
+            "--search-latency-ms", str(args.search_latency_ms),
+            "--page-latency-ms", str(args.page_latency_ms),
+        ], f"http://127.0.0.1:{search_port}/page/0")
+
+        env = dict(os.environ)
+        env.update({
+            "BASE_URL": f"http://127.0.0.1:{model_port}/v1",
+            "API_KEY": "mock-key",
+            "MODEL": args.model,
+            "SEARCH_URL": f"http://127.0.0.1:{search_port}/html/",
+            "CHAT_DB_PATH": str(workdir / "load_test.db"),
+            "RESPONSE_CACHE_SIZE": "0",
+            "SEARCH_CACHE_TTL": "0",
+            "SEARCH_CACHE_STALE_TTL": "0",
+            "NO_PROXY": "127.0.0.1,localhost",
+        })
+        env.pop("SEARCH_CACHE_PATH", None)
+        start("backend", [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(backend_port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ], f"http://127.0.0.1:{backend_port}/api/health", env=env, cwd=str(BACKEND_DIR))
+
+        yield f"http://127.0.0.1:{backend_port}"
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for log in logs:
+            log.close()
+
+
+async def one_stream(client: httpx.AsyncClient, url: str, message: str, conversation_id: Optional[str],
+                     use_search: bool) -> dict:
+    """发起一次流式对话，记录每个content事件的到达时间"""
+    result = {"ok": False, "ttft_ms": None, "itl_ms": [], "duration_ms": None, "chars": 0,
+              "server_timings": None, "conversation_id": conversation_id, "error": None}
+    payload = {"message": message, "conversation_id": conversation_id, "use_search": use_search, "bypass_cache": True}
+    start = time.perf_counter()
+    last_content = None
+    try:
+        async with client.stream("POST", f"{url}/api/chat/stream", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[5:].strip())
+                now = time.perf_counter()
+                if chunk["type"] == "start":
+                    result["conversation_id"] = chunk.get("conversation_id")
+                elif chunk["type"] == "content":
+                    if last_content is None:
+                        result["ttft_ms"] = (now - start) * 1000
+                    else:
+                        result["itl_ms"].append((now - last_content) * 1000)
+                    last_content = now
+                    result["chars"] += len(chunk.get("content") or "")
+                elif chunk["type"] == "done":
+                    result["ok"] = True
+                    result["server_timings"] = chunk.get("timings")
+                elif chunk["type"] == "error":
+                    result["error"] = chunk.get("error")
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        result["error"] = str(e) or type(e).__name__
+    result["duration_ms"] = (time.perf_counter() - start) * 1000
+    result["ok"] = result["ok"] and result["error"] is None
+    return result
+
+
+async def run_level(url: str, concurrency: int, rounds: int, use_search: bool) -> dict:
+    """concurrency个用户同时对话，每个用户在同一个对话中连续提问rounds次"""
+    limits = httpx.Limits(max_connections=concurrency + 10, max_keepalive_connections=concurrency + 10)
+    timeout = httpx.Timeout(120.0, connect=10.0)
+
+    async def user(index: int) -> List[dict]:
+        results = []
+        conversation_id = None
+        for round_index in range(rounds):
+            message = f"{QUESTIONS[(index + round_index) % len(QUESTIONS)]}（用户{index}第{round_index + 1}问）"
+            result = await one_stream(client, url, message, conversation_id, use_search)
+            conversation_id = result["conversation_id"]
+            results.append(result)
+        return results
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, trust_env=False) as client:
+        start = time.perf_counter()
+        per_user = await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    results = [result for user_results in per_user for result in user_results]
+    ok = [result for result in results if result["ok"]]
+    errors = [result["error"] for result in results if not result["ok"]]
+    server_ttft = [result["server_timings"]["ttft_ms"] for result in ok
+                   if result["server_timings"] and "ttft_ms" in result["server_timings"]]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(errors),
+        "error_samples": sorted(set(filter(None, errors)))[:5],
+        "ttft_ms": summarize([result["ttft_ms"] for result in ok if result["ttft_ms"] is not None]),
+        "itl_ms": summarize([value for result in ok for value in result["itl_ms"]]),
+        "duration_ms": summarize([result["duration_ms"] for result in ok]),
+        "server_ttft_ms": summarize(server_ttft),
+        "streams_per_second": round(len(ok) / elapsed, 2),
+        "chars_per_second": round(sum(result["chars"] for result in ok) / elapsed, 1),
+    }
+
+
+def print_level(level: dict):
+    print(f"  {level['concurrency']:>6}{level['requests']:>8}{level['errors']:>6}"
+          f"{level['ttft_ms']['p50'] or 0:>11.1f}{level['ttft_ms']['p99'] or 0:>11.1f}"
+          f"{level['itl_ms']['p50'] or 0:>10.1f}{level['itl_ms']['p99'] or 0:>10.1f}"
+          f"{level['duration_ms']['p99'] or 0:>12.1f}{level['streams_per_second']:>10.2f}")
+    for sample in level["error_samples"]:
+        print(f"        错误: {sample}")
+
+
+def max_sustainable(levels: List[dict], ttft_slo_ms: float) -> int:
+    """从低到高，连续满足没有错误且TTFT p99不超过阈值的最高并发级别"""
+    sustainable = 0
+    for level in sorted(levels, key=lambda item: item["concurrency"]):
+        p99 = level["ttft_ms"]["p99"]
+        if level["errors"] or p99 is None or p99 > ttft_slo_ms:
+            break
+        sustainable = level["concurrency"]
+    return sustainable
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """与基线结果对比，返回是否有指标退化超过阈值（百分比）"""
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    regressed = False
+    print(f"\n与基线对比（{baseline.get('timestamp', '')}），退化阈值 {threshold:.0f}%")
+    print(f"  {'并发':>6}  {'指标':<16}{'基线':>10}{'当前':>10}{'变化':>10}")
+    for level in current["levels"]:
+        old = baseline_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        for metric, stat in (("ttft_ms", "p50"), ("ttft_ms", "p99"), ("itl_ms", "p99"), ("duration_ms", "p99")):
+            before, after = old[metric][stat], level[metric][stat]
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            flag = ""
+            if change > threshold:
+                regressed = True
+                flag = "  ↑退化"
+            print(f"  {level['concurrency']:>6}  {metric + ' ' + stat:<16}{before:>10.1f}{after:>10.1f}{change:>9.1f}%{flag}")
+    old_max, new_max = baseline.get("max_sustainable_concurrency"), current["max_sustainable_concurrency"]
+    print(f"  最大稳定并发: {old_max} -> {new_max}")
+    if old_max is not None and new_max < old_max:
+        regressed = True
+    return regressed
+
+
+async def run_all(url: str, args) -> List[dict]:
+    levels = []
+    print(f"  {'并发':>6}{'请求数':>8}{'错误':>6}{'TTFT p50':>11}{'TTFT p99':>11}"
+          f"{'ITL p50':>10}{'ITL p99':>10}{'耗时 p99':>12}{'流/秒':>10}")
+    for concurrency in args.concurrency:
+        level = await run_level(url, concurrency, args.rounds, args.search)
+        print_level(level)
+        levels.append(level)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32,64",
+                        type=lambda value: [int(item) for item in value.split(",")], help="并发级别，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=3, help="每个用户在同一对话中连续提问的次数")
+    parser.add_argument("--search", action="store_true", help="请求时开启网络搜索（使用模拟搜索服务）")
+    parser.add_argument("--ttft-slo-ms", type=float, default=2000, help="判断稳定支撑的TTFT p99阈值")
+    parser.add_argument("--output", default=None, help="结果JSON文件，默认 results_<时间>.json")
+    parser.add_argument("--baseline", default=None, help="用于对比的历史结果JSON")
+    parser.add_argument("--regression-threshold", type=float, default=10.0, help="判定退化的变化百分比")
+    parser.add_argument("--backend-url", default=None, help="压测已在运行的后端，不启动本地服务")
+    parser.add_argument("--workers", type=int, default=1, help="后端uvicorn工作进程数")
+    parser.add_argument("--model", default="mock-chat", help="传给后端的模型名称")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="模拟模型的首字延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=40, help="模拟模型每个流的输出速度")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="模拟模型每个回复的token数")
+    parser.add_argument("--search-latency-ms", type=float, default=400, help="模拟搜索结果页延迟")
+    parser.add_argument("--page-latency-ms", type=float, default=150, help="模拟网页延迟")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    print(f"压测配置: {json.dumps(config, ensure_ascii=False)}")
+
+    if args.backend_url:
+        levels = asyncio.run(run_all(args.backend_url.rstrip("/"), args))
+    else:
+        with tempfile.TemporaryDirectory(prefix="ai_chat_load_") as workdir:
+            with local_servers(args, Path(workdir)) as url:
+                levels = asyncio.run(run_all(url, args))
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": config,
+        "levels": levels,
+        "max_sustainable_concurrency": max_sustainable(levels, args.ttft_slo_ms),
+    }
+    print(f"\n最大稳定并发流数（TTFT p99 <= {args.ttft_slo_ms:.0f}ms 且无错误）: "
+          f"{results['max_sustainable_concurrency']}")
+
+    output = args.output or f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.regression_threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
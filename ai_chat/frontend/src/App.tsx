@@ -14,10 +14,12 @@ function App() {
     currentConversationId,
     isStreaming,
     isLoading,
+    hasOlderMessages,
     sendMessage,
     interruptStream,
     loadConversations,
     loadConversationMessages,
+    loadOlderMessages,
     startNewConversation,
     deleteConversation,
     resendLastMessage,
@@ -127,14 +129,26 @@ function App() {
                   </div>
                 </div>
               ) : (
-                messages.map((message, index) => (
-                  <ChatMessage
-                    key={message.id || index}
-                    message={message}
-                    isStreaming={isStreaming && index === messages.length - 1 && message.role === 'assistant'}
-                    onResend={message.role === 'user' ? resendLastMessage : undefined}
-                  />
-                ))
+                <>
+                  {hasOlderMessages && (
+                    <div className="flex justify-center">
+                      <button
+                        onClick={loadOlderMessages}
+                        className="px-4 py-1.5 text-sm text-blue-600 rounded-full bg-white/80 hover:bg-blue-50 transition-colors shadow-sm"
+                      >
+                        加载更早的消息
+                      </button>
+                    </div>
+                  )}
+                  {messages.map((message, index) => (
+                    <ChatMessage
+                      key={message.id || index}
+                      message={message}
+                      isStreaming={isStreaming && index === messages.length - 1 && message.role === 'assistant'}
+                      onResend={message.role === 'user' ? resendLastMessage : undefined}
+                    />
+                  ))}
+                </>
               )}
             </div>
           )}
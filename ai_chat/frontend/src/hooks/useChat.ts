@@ -8,13 +8,17 @@ export const useChat = () => {
   const [currentConversationId, setCurrentConversationId] = useState<string>();
   const [isStreaming, setIsStreaming] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
+  // 更早消息的分页游标，为空表示已经加载到最早的消息
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState<string>();
 
   const cancelStreamRef = useRef<(() => void) | null>(null);
+  // 当前流的ID，用于通知后端中断生成
+  const streamIdRef = useRef<string | null>(null);
 
   const loadConversations = useCallback(async () => {
     try {
-      const convs = await ChatAPI.getConversations();
-      setConversations(convs);
+      const page = await ChatAPI.getConversations();
+      setConversations(page.items);
     } catch (error) {
       console.error('Failed to load conversations:', error);
     }
@@ -23,8 +27,9 @@ export const useChat = () => {
   const loadConversationMessages = useCallback(async (conversationId: string) => {
     try {
       setIsLoading(true);
-      const msgs = await ChatAPI.getConversationMessages(conversationId);
-      setMessages(msgs);
+      const page = await ChatAPI.getConversationMessages(conversationId);
+      setMessages(page.items);
+      setOlderMessagesCursor(page.has_more ? page.before_cursor : undefined);
       setCurrentConversationId(conversationId);
     } catch (error) {
       console.error('Failed to load messages:', error);
@@ -33,6 +38,18 @@ export const useChat = () => {
     }
   }, []);
 
+  const loadOlderMessages = useCallback(async () => {
+    if (!currentConversationId || !olderMessagesCursor) return;
+
+    try {
+      const page = await ChatAPI.getConversationMessages(currentConversationId, olderMessagesCursor);
+      setMessages(prev => [...page.items, ...prev]);
+      setOlderMessagesCursor(page.has_more ? page.before_cursor : undefined);
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+    }
+  }, [currentConversationId, olderMessagesCursor]);
+
   const sendMessage = useCallback(async (
     content: string,
     useSearch: boolean = false
@@ -73,7 +90,9 @@ export const useChat = () => {
         (chunk: StreamChunk) => {
           console.log('收到chunk:', chunk); // 调试日志
 
-          if (chunk.type === 'content' && chunk.content) {
+          if (chunk.type === 'start') {
+            streamIdRef.current = chunk.stream_id ?? null;
+          } else if (chunk.type === 'content' && chunk.content) {
             // 累积内容
             accumulatedContent += chunk.content;
 
@@ -87,12 +106,14 @@ export const useChat = () => {
               return newMessages;
             });
           } else if (chunk.type === 'done') {
+            streamIdRef.current = null;
             setIsStreaming(false);
             if (chunk.conversation_id && !currentConversationId) {
               setCurrentConversationId(chunk.conversation_id);
             }
             loadConversations();
           } else if (chunk.type === 'error') {
+            streamIdRef.current = null;
             console.error('Stream error:', chunk.error);
             setIsStreaming(false);
           }
@@ -115,6 +136,17 @@ export const useChat = () => {
   }, [currentConversationId, isStreaming, loadConversations]);
 
   const interruptStream = useCallback(async () => {
+    // 先通知后端取消模型请求，再关闭本地的流
+    const streamId = streamIdRef.current;
+    streamIdRef.current = null;
+    if (streamId) {
+      try {
+        await ChatAPI.interruptChat(streamId);
+      } catch (error) {
+        console.error('Failed to interrupt chat:', error);
+      }
+    }
+
     if (cancelStreamRef.current) {
       cancelStreamRef.current();
       cancelStreamRef.current = null;
@@ -125,6 +157,7 @@ export const useChat = () => {
 
   const startNewConversation = useCallback(() => {
     setMessages([]);
+    setOlderMessagesCursor(undefined);
     setCurrentConversationId(undefined);
   }, []);
 
@@ -160,10 +193,12 @@ export const useChat = () => {
     currentConversationId,
     isStreaming,
     isLoading,
+    hasOlderMessages: !!olderMessagesCursor,
     sendMessage,
     interruptStream,
     loadConversations,
     loadConversationMessages,
+    loadOlderMessages,
     startNewConversation,
     deleteConversation,
     resendLastMessage,
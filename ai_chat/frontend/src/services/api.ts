@@ -1,6 +1,9 @@
-import { ChatMessage, Conversation, SearchResult } from '../types';
+import { ChatMessage, Conversation, Page, SearchResult } from '../types';
 
 const API_BASE = '/api';
+// 流式连接中断后的续传次数和重试间隔（毫秒，逐次递增）
+const MAX_RESUME_RETRIES = 3;
+const RESUME_DELAY_MS = 1000;
 
 export class ChatAPI {
   static async sendMessage(
@@ -32,16 +35,27 @@ export class ChatAPI {
     return eventSource;
   }
 
-  static async getConversations(): Promise<Conversation[]> {
-    const response = await fetch(`${API_BASE}/conversations`);
+  static async getConversations(after?: string): Promise<Page<Conversation>> {
+    const params = new URLSearchParams();
+    if (after) {
+      params.set('after', after);
+    }
+    const response = await fetch(`${API_BASE}/conversations?${params}`);
     if (!response.ok) {
       throw new Error('Failed to fetch conversations');
     }
     return response.json();
   }
 
-  static async getConversationMessages(conversationId: string): Promise<ChatMessage[]> {
-    const response = await fetch(`${API_BASE}/conversations/${conversationId}/messages`);
+  static async getConversationMessages(
+    conversationId: string,
+    before?: string
+  ): Promise<Page<ChatMessage>> {
+    const params = new URLSearchParams();
+    if (before) {
+      params.set('before', before);
+    }
+    const response = await fetch(`${API_BASE}/conversations/${conversationId}/messages?${params}`);
     if (!response.ok) {
       throw new Error('Failed to fetch messages');
     }
@@ -110,22 +124,23 @@ export class SSEService {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const reader = response.body?.getReader();
+      const decoder = new TextDecoder();
+      let reader = response.body?.getReader();
       if (!reader) {
         throw new Error('No response body');
       }
-
-      const decoder = new TextDecoder();
       let buffer = '';
       let cancelled = false;
+      // 断线续传所需的状态：流ID、最后收到的序号、是否已收到结束块
+      let streamId: string | null = null;
+      let lastSeq = 0;
+      let finished = false;
 
-      const processStream = async () => {
+      const readEvents = async (current: ReadableStreamDefaultReader<Uint8Array>) => {
         try {
           while (!cancelled) {
-            const { done, value } = await reader.read();
-
+            const { done, value } = await current.read();
             if (done) {
-              onComplete();
               break;
             }
 
@@ -139,6 +154,15 @@ export class SSEService {
                   const jsonStr = line.slice(6).trim();
                   if (jsonStr) {
                     const data = JSON.parse(jsonStr);
+                    if (data.type === 'start' && data.stream_id) {
+                      streamId = data.stream_id;
+                    }
+                    if (typeof data.seq === 'number') {
+                      lastSeq = data.seq;
+                    }
+                    if (data.type === 'done' || data.type === 'error') {
+                      finished = true;
+                    }
                     onMessage(data);
                   }
                 } catch (e) {
@@ -147,12 +171,64 @@ export class SSEService {
               }
             }
           }
-        } catch (error) {
-          if (!cancelled) {
-            onError(error instanceof Error ? error.message : 'Stream error');
-          }
         } finally {
-          reader.releaseLock();
+          current.releaseLock();
+        }
+      };
+
+      const resume = async (): Promise<ReadableStreamDefaultReader<Uint8Array> | null> => {
+        for (let attempt = 1; attempt <= MAX_RESUME_RETRIES && !cancelled; attempt++) {
+          await new Promise(resolve => setTimeout(resolve, RESUME_DELAY_MS * attempt));
+          try {
+            const resumed = await fetch(`${API_BASE}/chat/stream/${streamId}`, {
+              headers: { 'Last-Event-ID': String(lastSeq) },
+            });
+            if (resumed.ok && resumed.body) {
+              buffer = '';
+              reader = resumed.body.getReader();
+              return reader;
+            }
+            if (resumed.status === 404 || resumed.status === 410) {
+              return null;
+            }
+          } catch {
+            // 网络仍未恢复，稍后重试
+          }
+        }
+        return null;
+      };
+
+      const processStream = async () => {
+        let current = reader!;
+        while (true) {
+          let failure: unknown = null;
+          try {
+            await readEvents(current);
+          } catch (error) {
+            failure = error;
+          }
+          if (cancelled) {
+            return;
+          }
+          if (finished || !streamId) {
+            if (failure && !finished) {
+              onError(failure instanceof Error ? failure.message : 'Stream error');
+            } else {
+              onComplete();
+            }
+            return;
+          }
+
+          // 连接中断但生成尚未结束：从最后收到的序号之后续传
+          const next = await resume();
+          if (cancelled) {
+            return;
+          }
+          if (!next) {
+            onError(failure instanceof Error ? failure.message : 'Stream interrupted');
+            return;
+          }
+          current = next;
         }
       };
 
@@ -161,7 +237,7 @@ export class SSEService {
       // 返回取消函数
       return () => {
         cancelled = true;
-        reader.cancel();
+        reader?.cancel();
       };
 
     } catch (error) {
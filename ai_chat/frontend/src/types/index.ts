@@ -14,11 +14,21 @@ export interface Conversation {
   message_count: number;
 }
 
+export interface Page<T> {
+  items: T[];
+  has_more: boolean;
+  before_cursor?: string;
+  after_cursor?: string;
+}
+
 export interface StreamChunk {
-  type: 'content' | 'done' | 'error';
+  type: 'start' | 'content' | 'done' | 'error';
   content?: string;
   conversation_id?: string;
   error?: string;
+  stream_id?: string;
+  timings?: Record<string, number>;
+  seq?: number;
 }
 
 export interface SearchResult {